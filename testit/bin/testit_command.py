@@ -48,6 +48,7 @@ class TestIt:
         rospy.wait_for_service('testit/test')
         rospy.wait_for_service('testit/results')
         rospy.wait_for_service('testit/bag/collect')
+        rospy.wait_for_service('testit/bag/extract')
         rospy.wait_for_service('testit/clean')
         rospy.wait_for_service('testit/uppaal/annotate/coverage')
         rospy.wait_for_service('testit/uppaal/extract/failure')
@@ -55,6 +56,8 @@ class TestIt:
         rospy.wait_for_service('testit/credits')
         rospy.wait_for_service('testit/optimize')
         rospy.wait_for_service('testit/learn')
+        rospy.wait_for_service('testit/reload')
+        rospy.wait_for_service('testit/metrics')
         self.bringup_service = rospy.ServiceProxy('testit/bringup', testit.srv.Command)
         self.teardown_service = rospy.ServiceProxy('testit/teardown', testit.srv.Command)
         self.status_service = rospy.ServiceProxy('testit/status', testit.srv.Command)
@@ -62,12 +65,15 @@ class TestIt:
         self.learn_service = rospy.ServiceProxy('testit/learn', testit.srv.Command)
         self.results_service = rospy.ServiceProxy('testit/results', testit.srv.Command)
         self.bag_collect_service = rospy.ServiceProxy('testit/bag/collect', testit.srv.Command)
+        self.bag_extract_service = rospy.ServiceProxy('testit/bag/extract', testit.srv.Command)
         self.clean_service = rospy.ServiceProxy('testit/clean', testit.srv.Command)
         self.uppaal_annotate_coverage_service = rospy.ServiceProxy('testit/uppaal/annotate/coverage', testit.srv.Command)
         self.uppaal_extract_failure_service = rospy.ServiceProxy('testit/uppaal/extract/failure', testit.srv.Command)
         self.shutdown_service = rospy.ServiceProxy('testit/shutdown', testit.srv.Command)
         self.credits_service = rospy.ServiceProxy('testit/credits', testit.srv.Command)
         self.optimize_service = rospy.ServiceProxy('testit/optimize', testit.srv.Command)
+        self.reload_service = rospy.ServiceProxy('testit/reload', testit.srv.Command)
+        self.metrics_service = rospy.ServiceProxy('testit/metrics', testit.srv.Command)
 
     def call_service(self, service, args, callback=None):
         try:
@@ -110,6 +116,7 @@ class TestIt:
     def reload(self, args):
         rospy.loginfo("Reloading configuration to ROS parameter server...")
         testit.testit_common.load_config_to_rosparam(testit.testit_common.parse_yaml(args.config))
+        self.call_service(self.reload_service, args)
 
     def status(self, args):
         self.call_service(self.status_service, args)
@@ -151,10 +158,26 @@ class TestIt:
         self.call_service(self.optimize_service, args, callback)
 
     def results(self, args):
+        args.pipeline = []
         if args.xml_sys_out:
-            args.pipeline = ['--xml-sys-out']
+            args.pipeline.append('--xml-sys-out')
+        if args.history:
+            args.pipeline.append('--history')
+        if args.stats:
+            args.pipeline.append('--stats')
+        args.pipeline += args.scenario
         self.call_service(self.results_service, args, self.results_callback)
 
+    def metrics(self, args):
+        args.pipeline = []
+        self.call_service(self.metrics_service, args, self.metrics_callback)
+
+    def metrics_callback(self, response, args):
+        if args.output != "":
+            self.results_callback(response, args)
+        else:
+            print(response.message)
+
     def results_callback(self, response, args):
         if "output" in args and args.output != "":
             # "--output" specified
@@ -170,9 +193,16 @@ class TestIt:
         def unrecognized(args):
             rospy.logerr("Unrecognized subcommand (%s)!" % args)
         # Bag subcommands handling
-        if len(args.command) == 1:
+        if len(args.command) >= 1:
             if args.command[0] == "collect":
+                args.pipeline = args.command[1:]
                 self.call_service(self.bag_collect_service, args)
+            elif args.command[0] == "extract":
+                args.pipeline = args.command[1:]
+                for option in ("time", "before", "after"):
+                    if getattr(args, option) != "":
+                        args.pipeline += ["--" + option, getattr(args, option)]
+                self.call_service(self.bag_extract_service, args)
             else:
                 unrecognized(args)
         else:
@@ -289,13 +319,23 @@ if __name__ == '__main__':
     parser_results = subparsers.add_parser("results", help="Output the results")
     parser_results.add_argument("-o", "--output", action="store", default='', help="Optional file to write results")
     parser_results.add_argument("-x", "--xml-sys-out", action="store_true", default=False, help="Add system-out to results")
+    parser_results.add_argument("--history", action="store_true", default=False, help="Output all recorded runs instead of the latest runs")
+    parser_results.add_argument("--stats", action="store_true", default=False, help="Output pass rates and duration percentiles")
+    parser_results.add_argument("scenario", nargs="*")
     parser_results.set_defaults(func=testit_instance.results)
 
+    parser_metrics = subparsers.add_parser("metrics", help="Output daemon timing metrics (Prometheus text format)")
+    parser_metrics.add_argument("-o", "--output", action="store", default='', help="Optional file to write metrics")
+    parser_metrics.set_defaults(func=testit_instance.metrics)
+
     parser_log = subparsers.add_parser("log", help="log help")
     parser_log.set_defaults(func=testit_instance.log)
 
     parser_bag = subparsers.add_parser("bag", help="bag help")
     parser_bag.add_argument("command", action="store", nargs="+", help="Bag subcommands")
+    parser_bag.add_argument("--time", action="store", default="", help="Failure time for 'extract' (default: end of the latest run)")
+    parser_bag.add_argument("--before", action="store", default="", help="Seconds before failure time for 'extract'")
+    parser_bag.add_argument("--after", action="store", default="", help="Seconds after failure time for 'extract'")
     parser_bag.set_defaults(func=testit_instance.bag)
 
     parser_uppaal = subparsers.add_parser("uppaal", help="Uppaal TA related commands")
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+# Logger proxy overhead benchmark.
+#
+# Measures the latency the TestIt logger adds to the calls of the SUT: a dummy service (std_srvs/Trigger) and action
+# server (actionlib/Test) are called directly and through the logger proxies (in the same process), and the logger
+# callback of an input topic (std_msgs/UInt32) is timed. Reports latency percentiles and the added latency (median
+# through the proxy - median of the direct calls).
+#
+# Requires a running ROS master (the logger configuration is loaded to the 'testit/configuration' parameter, so do not
+# use the master of a running TestIt daemon), e.g.:
+#   rosrun testit benchmark_logger.py --calls 1000 -o result.json
+
+import rospy
+import actionlib
+import actionlib.msg
+import std_srvs.srv
+import std_msgs.msg
+import argparse
+import tempfile
+import shutil
+import json
+import time
+import yaml
+import testit.testit_logger
+import testit.testit_results
+
+NAMESPACE = "/testit_benchmark/"
+
+
+def create_configuration(args):
+    """
+    Returns:
+    logger configuration with a service, action and topic input
+    """
+    coverage = {'enable': args.coverage, 'mode': "msg", 'reportingTimeLimit': 0.1}
+    inputs = [
+        {'identifier': NAMESPACE + "service", 'proxy': NAMESPACE + "service/proxy", 'type': "std_srvs.srv.Trigger"},
+        {'identifier': NAMESPACE + "action", 'proxy': NAMESPACE + "action/proxy", 'type': "actionlib.msg.TestAction"},
+        {'identifier': NAMESPACE + "topic", 'proxy': "", 'type': "std_msgs.msg.UInt32"}]
+    return {'configuration': {'coverage': coverage, 'inputs': inputs, 'outputs': []}}
+
+
+def measure(call, calls, warmup):
+    """
+    Returns:
+    sorted list of the durations of 'calls' calls (in seconds)
+    """
+    for i in range(warmup):
+        call(i)
+    durations = []
+    for i in range(calls):
+        started = time.time()
+        call(i)
+        durations.append(time.time() - started)
+    return sorted(durations)
+
+
+def summary(durations):
+    return dict([('p%s' % p, testit.testit_results.percentile(durations, p)) for p in (50, 90, 99)] +
+                [('max', durations[-1] if len(durations) > 0 else None)])
+
+
+def compare(direct, proxied):
+    direct = summary(direct)
+    proxied = summary(proxied)
+    return {'direct': direct, 'proxied': proxied, 'added': proxied['p50'] - direct['p50']}
+
+
+def call_action(client, i):
+    client.send_goal(actionlib.msg.TestGoal(i))
+    client.wait_for_result()
+
+
+def run(args):
+    service = rospy.Service(NAMESPACE + "service", std_srvs.srv.Trigger,
+                            lambda request: std_srvs.srv.TriggerResponse(True, ""))
+    action_server = actionlib.SimpleActionServer(
+        NAMESPACE + "action", actionlib.msg.TestAction,
+        lambda goal: action_server.set_succeeded(actionlib.msg.TestResult(goal.goal)), auto_start=False)
+    action_server.start()
+    directory = tempfile.mkdtemp(prefix="testit_benchmark_")
+    try:
+        filename = directory + "/logger.yaml"
+        with open(filename, 'w') as outfile:
+            yaml.safe_dump(create_configuration(args), outfile)
+        rospy.set_param('~config', filename)
+        rospy.set_param('~log', directory + "/logger.log")
+        rospy.set_param('~test', "benchmark")
+        logger = testit.testit_logger.TestItLogger()
+        result = {'calls': args.calls, 'coverage': args.coverage}
+
+        direct = rospy.ServiceProxy(NAMESPACE + "service", std_srvs.srv.Trigger, persistent=True)
+        proxied = rospy.ServiceProxy(NAMESPACE + "service/proxy", std_srvs.srv.Trigger, persistent=True)
+        proxied.wait_for_service()
+        result['service'] = compare(measure(lambda i: direct(), args.calls, args.warmup),
+                                    measure(lambda i: proxied(), args.calls, args.warmup))
+        direct.close()
+        proxied.close()
+
+        direct = actionlib.SimpleActionClient(NAMESPACE + "action", actionlib.msg.TestAction)
+        proxied = actionlib.SimpleActionClient(NAMESPACE + "action/proxy", actionlib.msg.TestAction)
+        direct.wait_for_server()
+        proxied.wait_for_server()
+        result['action'] = compare(measure(lambda i: call_action(direct, i), args.calls, args.warmup),
+                                   measure(lambda i: call_action(proxied, i), args.calls, args.warmup))
+
+        # Topics are not proxied, the logger callback is executed for every message
+        topic = [index for index in logger.mapping if logger.mapping[index]['identifier'] == NAMESPACE + "topic"][0]
+        result['topic'] = {'callback': summary(measure(
+            lambda i: logger.topic_callback(std_msgs.msg.UInt32(i), topic), args.calls, args.warmup))}
+
+        logger.shutdown()
+        result['entries'] = {'written': logger.writer.written, 'dropped': logger.writer.dropped}
+        service.shutdown()
+    finally:
+        shutil.rmtree(directory, True)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="TestIt logger proxy overhead benchmark")
+    parser.add_argument("-n", "--calls", type=int, default=1000, help="Number of measured calls per channel")
+    parser.add_argument("--warmup", type=int, default=50, help="Number of calls before measuring")
+    parser.add_argument("--coverage", action="store_true", default=False,
+                        help="Enable coverage flushing (\"msg\" mode) in the logger")
+    parser.add_argument("-o", "--output", action="store", default='', help="Optional file to write results (JSON)")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Show logger log")
+    args = parser.parse_args(rospy.myargv()[1:])
+    rospy.init_node('testit_benchmark_logger', anonymous=True, disable_signals=True,
+                    log_level=rospy.INFO if args.verbose else rospy.WARN)
+    result = run(args)
+    for kind in ('service', 'action'):
+        rospy.logwarn("%s: direct p50 %.3f ms, proxied p50 %.3f ms (p99 %.3f ms), added %.3f ms" % (
+            kind, 1000.0 * result[kind]['direct']['p50'], 1000.0 * result[kind]['proxied']['p50'],
+            1000.0 * result[kind]['proxied']['p99'], 1000.0 * result[kind]['added']))
+    rospy.logwarn("topic: logger callback p50 %.3f ms (p99 %.3f ms)" % (
+        1000.0 * result['topic']['callback']['p50'], 1000.0 * result['topic']['callback']['p99']))
+    rospy.logwarn("Log entries: %s written, %s dropped" % (result['entries']['written'], result['entries']['dropped']))
+    if args.output != "":
+        with open(args.output, 'w') as outfile:
+            json.dump(result, outfile, indent=2, sort_keys=True)
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+# Scheduler throughput benchmark.
+#
+# Runs the TestIt daemon scheduling paths (handle_test, scheduler lanes, credits, priority preemption,
+# free_pipeline, results/journal bookkeeping) against simulated pipelines: commands are not executed, they complete
+# after configurable simulated delays. Reports makespan, queue wait percentiles and daemon CPU time.
+#
+# Requires a running ROS master, e.g.:
+#   rosrun testit benchmark_scheduler.py --pipelines 8 --scenarios 2000 --credits 2 --priorities 3 -o result.json
+
+import rospy
+import rospkg
+import argparse
+import threading
+import resource
+import tempfile
+import random
+import shutil
+import json
+import time
+import yaml
+import testit.srv
+import testit.testit_daemon
+import testit.testit_results
+
+DEFAULT_DELAYS = {'runSUT': 0.01, 'runTestIt': 0.01, 'docker exec': 0.02, 'stopTestIt': 0.005, 'stopSUT': 0.005}
+
+
+class SimulatedDaemon(testit.testit_daemon.TestItDaemon):
+    """
+    TestIt daemon with simulated pipelines.
+
+    Every pipeline command (see TestItDaemon.call) sleeps for the simulated delay of its kind instead of executing.
+    """
+    def __init__(self, delays):
+        self.delays = delays
+        self.queue_waits = []
+        self.queue_waits_lock = threading.Lock()
+        testit.testit_daemon.TestItDaemon.__init__(self)
+
+    def call(self, command, pipeline, kind, prefix="", remote=None, output=None):
+        started = time.time()
+        time.sleep(self.delays.get(kind, 0.0))
+        self.metrics.observe('testit_command_duration_seconds', time.time() - started,
+                             {'pipeline': pipeline, 'kind': kind})
+        return 0
+
+    def submit_lane(self, tag, worker, args, pipeline, queued=None):
+        if queued is not None:
+            self.queue_waits_lock.acquire()
+            try:
+                self.queue_waits.append(time.time() - queued)
+            finally:
+                self.queue_waits_lock.release()
+        testit.testit_daemon.TestItDaemon.submit_lane(self, tag, worker, args, pipeline, queued)
+
+
+def create_configuration(args, data_directory):
+    """
+    Returns:
+    TestIt configuration with simulated pipelines and scenarios (based on the configuration template)
+    """
+    filename = rospkg.RosPack().get_path('testit') + "/cfg/config.yaml"
+    with open(filename, 'r') as infile:
+        template = yaml.safe_load(infile)
+    configuration = template['configuration']
+    pipeline_template = dict((key, value) for key, value in template['pipelines'][0].items() if value != "")
+    for key in configuration:
+        if not any(key.startswith(prefix) for prefix in ('bringup', 'run', 'stop', 'teardown')):
+            continue
+        if key.endswith('Delay') or key.endswith('Timeout'):
+            configuration[key] = 0
+        elif key.endswith('FinishTrigger'):
+            configuration[key] = "-"
+        else:
+            configuration[key] = "true"  # never executed
+        pipeline_template[key] = configuration[key]
+    configuration['dataDirectory'] = data_directory
+    pipeline_template.update({'testItContainerName': "simulated", 'testItVolume': data_directory})
+    pipelines = []
+    for i in range(args.pipelines):
+        pipeline = dict(pipeline_template)
+        pipeline['tag'] = "Pipeline #%s" % (i + 1)
+        pipelines.append(pipeline)
+    generator = random.Random(args.seed)
+    tests = []
+    for i in range(args.scenarios):
+        tests.append({'tag': "Scenario #%s" % (i + 1), 'mode': "test", 'pipeline': "", 'launch': "true",
+                      'oracle': "", 'timeout': 60, 'timeoutVerdict': False, 'credits': args.credits,
+                      'concurrency': args.concurrency, 'priority': generator.randint(0, max(args.priorities, 1) - 1),
+                      'bagEnabled': False})
+    return {'configuration': configuration, 'pipelines': pipelines, 'tests': tests}
+
+
+def run(args):
+    delays = dict(DEFAULT_DELAYS)
+    for delay in args.delay:
+        kind, seconds = delay.rsplit("=", 1)
+        delays[kind] = float(seconds)
+    data_directory = tempfile.mkdtemp(prefix="testit_benchmark_") + "/"
+    try:
+        filename = data_directory + "config.yaml"
+        with open(filename, 'w') as outfile:
+            yaml.safe_dump(create_configuration(args, data_directory if args.persistent else None), outfile)
+        rospy.set_param('~config', filename)
+        daemon = SimulatedDaemon(delays)
+        response = daemon.handle_bringup(testit.srv.CommandRequest(""))
+        if not response.result:
+            raise RuntimeError("Bringup of simulated pipelines failed: %s" % response.message)
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        started = time.time()
+        daemon.handle_test(testit.srv.CommandRequest("--blocking --no-credit-increment"))
+        makespan = time.time() - started
+        cpu = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = cpu.ru_utime + cpu.ru_stime - usage.ru_utime - usage.ru_stime
+        daemon.results.close()
+        if daemon.journal is not None:
+            daemon.journal.close()
+        daemon.executor.shutdown()
+    finally:
+        shutil.rmtree(data_directory, True)
+    runs = args.scenarios * args.credits
+    run_time = sum(delays.get(kind, 0.0) for kind in DEFAULT_DELAYS)
+    waits = sorted(daemon.queue_waits)
+    return {
+        'pipelines': args.pipelines,
+        'scenarios': args.scenarios,
+        'runs': runs,
+        'delays': delays,
+        'makespan': makespan,
+        'ideal_makespan': runs * run_time / args.pipelines,
+        'throughput': runs / makespan,
+        'queue_wait': dict([('lanes', len(waits))] + [('p%s' % p, testit.testit_results.percentile(waits, p))
+                                                        for p in (50, 90, 99)] +
+                           [('max', waits[-1] if len(waits) > 0 else None)]),
+        'cpu': cpu,
+        'cpu_per_run': cpu / runs if runs > 0 else None,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="TestIt scheduler throughput benchmark (simulated pipelines)")
+    parser.add_argument("-p", "--pipelines", type=int, default=4, help="Number of simulated pipelines")
+    parser.add_argument("-s", "--scenarios", type=int, default=1000, help="Number of test scenarios")
+    parser.add_argument("-c", "--credits", type=int, default=1, help="Credits per scenario")
+    parser.add_argument("--concurrency", type=int, default=1, help="Scenario concurrency (0 = all pipelines)")
+    parser.add_argument("--priorities", type=int, default=1,
+                        help="Number of distinct (random) scenario priorities, more than one exercises preemption")
+    parser.add_argument("-d", "--delay", action="append", default=[],
+                        help="Simulated command duration KIND=SECONDS (e.g., runSUT=0.5, 'docker exec'=1.0)")
+    parser.add_argument("--persistent", action="store_true", default=False,
+                        help="Use a (temporary) data directory to include the results database and journal")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for scenario priorities")
+    parser.add_argument("-o", "--output", action="store", default='', help="Optional file to write results (JSON)")
+    parser.add_argument("-v", "--verbose", action="store_true", default=False, help="Show daemon log")
+    args = parser.parse_args(rospy.myargv()[1:])
+    rospy.init_node('testit_benchmark', anonymous=True, disable_signals=True,
+                    log_level=rospy.INFO if args.verbose else rospy.WARN)
+    result = run(args)
+    rospy.logwarn("%s runs (%s scenarios) on %s pipelines: makespan %.2f s (ideal %.2f s), %.1f runs/s" % (
+        result['runs'], result['scenarios'], result['pipelines'], result['makespan'], result['ideal_makespan'],
+        result['throughput']))
+    rospy.logwarn("Queue wait (%s lanes): p50 %s s, p90 %s s, p99 %s s, max %s s" % (
+        result['queue_wait']['lanes'], result['queue_wait']['p50'], result['queue_wait']['p90'],
+        result['queue_wait']['p99'], result['queue_wait']['max']))
+    rospy.logwarn("Daemon CPU: %.2f s (%.2f ms per run)" % (result['cpu'], 1000.0 * (result['cpu_per_run'] or 0.0)))
+    if args.output != "":
+        with open(args.output, 'w') as outfile:
+            json.dump(result, outfile, indent=2, sort_keys=True)
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+# Persistent command execution agent for pipeline hosts.
+#
+# The agent is started once per connection (e.g., "ssh user@host python -u -c ...", the agent source is sent over
+# stdin) and serves JSON requests (one per line) concurrently. Partial replies (streamed output, file chunks) and the
+# final reply ("done") carry the request id, so multiple requests share one connection.
+#
+# This module must not depend on ROS, it is executed as is on the pipeline hosts.
+
+import threading
+import subprocess
+import itertools
+import base64
+import shlex
+import json
+import time
+import os
+
+CHUNK_SIZE = 65536
+RETRY_INTERVAL = 30.0  # seconds to wait before starting an agent again after a failed start
+
+
+class AgentError(Exception):
+    """
+    Agent connection failure.
+
+    Attributes:
+    sent -- True if the request may have reached the agent (i.e., it must not be retried blindly)
+    """
+    def __init__(self, message, sent=True):
+        Exception.__init__(self, message)
+        self.sent = sent
+
+
+def text(data):
+    return data.decode('utf-8', 'replace') if isinstance(data, bytes) else data
+
+
+def execute_command(request, send):
+    """
+    Execute request['command'] (argv list or shell command string) and return the result message.
+
+    Output (stdout and stderr) is streamed line by line if request['stream'] is set, otherwise returned in the result.
+    """
+    command = request['command']
+    try:
+        process = subprocess.Popen(command, shell=not isinstance(command, list), stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, cwd=request.get('cwd', None))
+    except OSError as e:
+        return {'returncode': 127, 'output': str(e) + "\n"}
+    if request.get('stream', False):
+        for line in iter(process.stdout.readline, b''):
+            send({'id': request['id'], 'output': text(line)})
+        process.wait()
+        return {'returncode': process.returncode}
+    output = process.communicate()[0]
+    return {'returncode': process.returncode, 'output': text(output)}
+
+
+def handle_request(request, send):
+    op = request.get('op', None)
+    try:
+        if op == 'exec':
+            reply = execute_command(request, send)
+        elif op == 'batch':
+            # Commands are executed in order, the results are returned in one reply
+            reply = {'results': [execute_command(dict(command, id=request['id']), send)
+                                 for command in request['commands']]}
+        elif op == 'get':
+            with open(request['path'], 'rb') as infile:
+                for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+                    send({'id': request['id'], 'data': base64.b64encode(chunk).decode('ascii')})
+            reply = {}
+        elif op == 'put':
+            with open(request['path'], 'ab' if request.get('append', False) else 'wb') as outfile:
+                outfile.write(base64.b64decode(request['data']))
+            reply = {}
+        elif op == 'ping':
+            reply = {}
+        else:
+            reply = {'error': "Unknown operation '%s'" % op}
+    except Exception as e:
+        reply = {'error': "%s: %s" % (type(e).__name__, e)}
+    reply['id'] = request['id']
+    reply['done'] = True
+    send(reply)
+
+
+def serve(infile, outfile):
+    """
+    Serve requests from 'infile' until it is closed, every request is handled in its own thread.
+
+    Arguments:
+    infile, outfile -- binary file objects (e.g., stdin and stdout of the agent process)
+    """
+    lock = threading.Lock()
+
+    def send(message):
+        data = (json.dumps(message) + "\n").encode('utf-8')
+        lock.acquire()
+        try:
+            outfile.write(data)
+            outfile.flush()
+        finally:
+            lock.release()
+
+    send({'ready': True})
+    for line in iter(infile.readline, b''):
+        thread = threading.Thread(target=handle_request, args=(json.loads(text(line)), send))
+        thread.daemon = True
+        thread.start()
+
+
+class Call(object):
+    def __init__(self, partial=None):
+        self.partial = partial
+        self.event = threading.Event()
+        self.reply = None
+        self.error = None  # exception raised by the partial reply callback
+
+
+class Agent(object):
+    """
+    Client of the agent (thread-safe, requests from multiple threads are executed concurrently).
+
+    Subclasses implement connect(), which returns the (writer, reader) binary file objects of the connection.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.pending = {}  # {request id: Call} of the current connection
+        self.writer = None
+        self.retry_time = 0.0
+
+    def connect(self):
+        raise NotImplementedError
+
+    def disconnected(self):
+        pass
+
+    def ensure_connected(self):
+        # Must be called with lock held
+        if self.writer is None:
+            if time.time() < self.retry_time:
+                raise AgentError("Agent not available", False)
+            try:
+                writer, reader = self.connect()
+                ready = reader.readline()
+            except (OSError, IOError) as e:
+                self.retry_time = time.time() + RETRY_INTERVAL
+                raise AgentError("Unable to start agent: %s" % e, False)
+            try:
+                started = ready != b'' and json.loads(text(ready)).get('ready', False)
+            except (ValueError, AttributeError):
+                # Not a JSON object (e.g., output of the remote shell startup files)
+                started = False
+            if not started:
+                self.disconnected()
+                self.retry_time = time.time() + RETRY_INTERVAL
+                raise AgentError("Agent did not start", False)
+            self.writer = writer
+            self.pending = {}
+            thread = threading.Thread(target=self.read_replies, args=(self.writer, reader, self.pending))
+            thread.daemon = True
+            thread.start()
+
+    def read_replies(self, writer, reader, pending):
+        try:
+            for line in iter(reader.readline, b''):
+                message = json.loads(text(line))
+                self.lock.acquire()
+                try:
+                    call = pending.get(message['id'], None)
+                    if message.get('done', False):
+                        pending.pop(message['id'], None)
+                finally:
+                    self.lock.release()
+                if call is None:
+                    continue
+                if message.get('done', False):
+                    call.reply = message
+                    call.event.set()
+                elif call.partial is not None and call.error is None:
+                    try:
+                        call.partial(message)
+                    except Exception as e:
+                        # The request still runs to completion, the error is raised to the caller then
+                        call.error = e
+        except (ValueError, KeyError, TypeError):
+            # Invalid reply, the connection is dropped
+            pass
+        finally:
+            # Connection lost (or an invalid reply), fail the pending requests
+            self.lock.acquire()
+            try:
+                if self.writer is writer:
+                    self.writer = None
+                    self.disconnected()
+                calls = list(pending.values())
+                pending.clear()
+            finally:
+                self.lock.release()
+            for call in calls:
+                call.event.set()
+
+    def request(self, message, partial=None):
+        """
+        Send the request and block until the final reply.
+
+        Arguments:
+        partial -- function called with every partial reply (streamed output, file chunks)
+
+        Returns:
+        the final reply (dict)
+        """
+        call = Call(partial)
+        self.lock.acquire()
+        try:
+            self.ensure_connected()
+            message['id'] = next(self.counter)
+            self.pending[message['id']] = call
+            try:
+                self.writer.write((json.dumps(message) + "\n").encode('utf-8'))
+                self.writer.flush()
+            except (OSError, IOError, ValueError) as e:
+                self.pending.pop(message['id'], None)
+                self.writer = None
+                self.disconnected()
+                raise AgentError("Unable to send request: %s" % e, False)
+        finally:
+            self.lock.release()
+        call.event.wait()
+        if call.error is not None:
+            raise AgentError("Unable to handle reply: %s: %s" % (type(call.error).__name__, call.error))
+        if call.reply is None:
+            raise AgentError("Connection to agent lost")
+        if 'error' in call.reply:
+            raise AgentError(call.reply['error'])
+        return call.reply
+
+    def execute(self, command, output=None, cwd=None):
+        """
+        Execute the command on the agent host.
+
+        Arguments:
+        command -- argv list or shell command string
+        output -- function called with every output line (streamed), output is discarded if None
+
+        Returns:
+        the return code of the command
+        """
+        partial = None
+        if output is not None:
+            partial = lambda message: output(message['output'])
+        return self.request({'op': 'exec', 'command': command, 'cwd': cwd, 'stream': output is not None},
+                            partial)['returncode']
+
+    def capture(self, command, cwd=None):
+        """
+        Returns:
+        tuple (return code, output) of the command
+        """
+        reply = self.request({'op': 'exec', 'command': command, 'cwd': cwd})
+        return reply['returncode'], reply['output']
+
+    def batch(self, commands):
+        """
+        Execute the commands in order in one round trip.
+
+        Returns:
+        list of return codes
+        """
+        reply = self.request({'op': 'batch', 'commands': [{'command': command} for command in commands]})
+        return [result['returncode'] for result in reply['results']]
+
+    def get_file(self, path, filename):
+        """
+        Copy the file 'path' from the agent host to local 'filename'.
+        """
+        with open(filename, 'wb') as outfile:
+            self.request({'op': 'get', 'path': path},
+                         lambda message: outfile.write(base64.b64decode(message['data'])))
+
+    def put_file(self, filename, path):
+        """
+        Copy local 'filename' to 'path' at the agent host.
+        """
+        append = False
+        with open(filename, 'rb') as infile:
+            for chunk in iter(lambda: infile.read(CHUNK_SIZE), b''):
+                self.request({'op': 'put', 'path': path, 'data': base64.b64encode(chunk).decode('ascii'),
+                              'append': append})
+                append = True
+        if not append:
+            self.request({'op': 'put', 'path': path, 'data': ""})
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            writer = self.writer
+            self.writer = None
+            self.disconnected()
+        finally:
+            self.lock.release()
+        if writer is not None:
+            try:
+                writer.close()
+            except (OSError, IOError):
+                pass
+
+
+def agent_source():
+    """
+    Returns:
+    the source code of this module (sent to the remote host on connect)
+    """
+    filename = os.path.splitext(os.path.abspath(__file__))[0] + ".py"
+    with open(filename, 'rb') as infile:
+        return infile.read()
+
+
+class RemoteAgent(Agent):
+    """
+    Agent on a remote host behind one persistent connection (e.g., ssh).
+
+    The connection command is started on the first request and restarted on the next request if it was lost.
+    """
+    def __init__(self, connection, python="python"):
+        """
+        Arguments:
+        connection -- argv list of the connection command (e.g., ['ssh', '-i', 'key', 'user@host'])
+        python -- Python interpreter on the remote host
+        """
+        Agent.__init__(self)
+        self.connection = connection
+        self.python = python
+        self.process = None
+
+    def connect(self):
+        source = agent_source()
+        bootstrap = 'import sys; f = getattr(sys.stdin, "buffer", sys.stdin); exec(f.read(%d)); ' \
+                    'serve(f, getattr(sys.stdout, "buffer", sys.stdout))' % len(source)
+        self.process = subprocess.Popen(self.connection + [self.python + " -u -c '" + bootstrap + "'"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self.process.stdin.write(source)
+        self.process.stdin.flush()
+        return self.process.stdin, self.process.stdout
+
+    def disconnected(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except (OSError, IOError):
+                pass
+            self.process = None
+
+    @staticmethod
+    def from_prefix(prefix, python="python"):
+        """
+        Create the agent for a connection prefix of TestItDaemon.get_command_wrapper (e.g., "ssh user@host '").
+        """
+        return RemoteAgent([os.path.expanduser(arg) for arg in shlex.split(prefix.strip().rstrip("'"))], python)
+
+
+class LocalAgent(Agent):
+    """
+    In-process agent (the server runs in a thread of this process and is connected with pipes).
+
+    Executes the commands on localhost using the same protocol as RemoteAgent (e.g., for testing).
+    """
+    def connect(self):
+        request_read, request_write = os.pipe()
+        reply_read, reply_write = os.pipe()
+        server_in = os.fdopen(request_read, 'rb')
+        server_out = os.fdopen(reply_write, 'wb')
+
+        def run():
+            try:
+                serve(server_in, server_out)
+            finally:
+                for f in (server_in, server_out):
+                    try:
+                        f.close()
+                    except (OSError, IOError):
+                        # Python 2: still in use by a request thread
+                        pass
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return os.fdopen(request_write, 'wb'), os.fdopen(reply_read, 'rb')
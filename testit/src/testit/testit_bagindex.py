@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import rosbag
+import json
+import os
+
+INDEX_SUFFIX = ".index.json"
+
+
+def index_filename(bag_filename):
+    return bag_filename + INDEX_SUFFIX
+
+
+def build_index(bag_filename):
+    """
+    Read the chunk index of the bag (only the index records are read, not the messages).
+
+    Returns:
+    dictionary with bag start and end time, topics (type and message count) and chunks (start and end time and
+    message count per topic)
+    """
+    bag = rosbag.Bag(bag_filename, 'r')
+    try:
+        # rosbag does not expose per-chunk information, so the connection and chunk index read on open is used
+        topics = {}
+        for connection in bag._connections.values():
+            topics.setdefault(connection.topic, {'type': connection.datatype, 'count': 0})
+        chunks = []
+        for chunk in bag._chunks:
+            counts = {}
+            for connection_id, count in chunk.connection_counts.items():
+                topic = bag._connections[connection_id].topic
+                counts[topic] = counts.get(topic, 0) + count
+                topics[topic]['count'] += count
+            chunks.append({'start': chunk.start_time.to_sec(), 'end': chunk.end_time.to_sec(), 'counts': counts})
+        start = min([chunk['start'] for chunk in chunks]) if len(chunks) > 0 else None
+        end = max([chunk['end'] for chunk in chunks]) if len(chunks) > 0 else None
+    finally:
+        bag.close()
+    stat = os.stat(bag_filename)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'start': start, 'end': end, 'topics': topics,
+            'chunks': chunks}
+
+
+def get_index(bag_filename):
+    """
+    Load the sidecar index of the bag, (re)building it if it is missing or the bag has changed.
+
+    Returns:
+    index dictionary (see build_index) or None if the bag could not be indexed
+    """
+    sidecar = index_filename(bag_filename)
+    stat = os.stat(bag_filename)
+    try:
+        with open(sidecar, 'r') as f:
+            index = json.load(f)
+        if index.get('size', None) == stat.st_size and index.get('mtime', None) == stat.st_mtime:
+            return index
+    except (IOError, ValueError):
+        pass
+    rospy.loginfo("Indexing '%s'..." % bag_filename)
+    try:
+        index = build_index(bag_filename)
+    except Exception as e:
+        rospy.logerr("Unable to index '%s': %s" % (bag_filename, e))
+        return None
+    with open(sidecar, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    return index
+
+
+def count_messages(index, start, end, topics=None):
+    """
+    Estimate the number of messages within [start, end] from the chunk index (chunks overlapping the window are
+    counted in full).
+    """
+    count = 0
+    for chunk in index['chunks']:
+        if chunk['end'] >= start and chunk['start'] <= end:
+            count += sum([c for topic, c in chunk['counts'].items() if topics is None or topic in topics])
+    return count
+
+
+def extract_window(bag_filenames, start, end, output_filename, topics=None):
+    """
+    Write the messages within [start, end] from the bags to a new bag.
+
+    Bags that do not overlap the window according to their index are not opened, from the overlapping bags only the
+    chunks within the window are read.
+
+    Arguments:
+    start, end -- window in seconds
+    topics -- list of topics to extract (None for all)
+
+    Returns:
+    (number of messages written, list of bags used), the output bag is removed when no messages were written
+    """
+    sources = []
+    for filename in bag_filenames:
+        index = get_index(filename)
+        if index is None or index['start'] is None:
+            continue
+        if index['end'] >= start and index['start'] <= end and count_messages(index, start, end, topics) > 0:
+            sources.append((index['start'], filename))
+    sources.sort()
+    written = 0
+    output = rosbag.Bag(output_filename, 'w')
+    try:
+        for _, filename in sources:
+            bag = rosbag.Bag(filename, 'r')
+            try:
+                for topic, message, t in bag.read_messages(topics=topics, start_time=rospy.Time.from_sec(start),
+                                                           end_time=rospy.Time.from_sec(end), raw=True):
+                    output.write(topic, message, t, raw=True)
+                    written += 1
+            finally:
+                bag.close()
+    finally:
+        output.close()
+        if written == 0 and os.path.isfile(output_filename):
+            os.remove(output_filename)
+    return written, [filename for _, filename in sources]
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import subprocess
+import hashlib
+import json
+import re
+import os
+import concurrent.futures
+import testit_bagindex
+
+FAILURE_WINDOW_SUFFIX = "_failure_window.bag"  # extracted failure windows (see TestItDaemon.handle_bag_extract)
+
+
+def md5sum(filename, block_size=1 << 20):
+    checksum = hashlib.md5()
+    with open(filename, 'rb') as f:
+        block = f.read(block_size)
+        while len(block) > 0:
+            checksum.update(block)
+            block = f.read(block_size)
+    return checksum.hexdigest()
+
+
+def pipeline_prefix(pipeline):
+    """
+    Returns:
+    prefix of the collected bags whose name is taken by another pipeline (see BagCollector.local_name)
+    """
+    return pipeline.replace(" ", "_") + "_"
+
+
+def scenario_bags(data_directory, test, pipelines):
+    """
+    List the collected bags of a scenario.
+
+    Bags are recorded as "[test].bag" or "[test]_[split].bag" and collected bags may be prefixed with the pipeline
+    tag, bags of other scenarios and extracted failure windows are not listed.
+
+    Arguments:
+    pipelines -- tags of the pipelines the bags may have been collected from
+
+    Returns:
+    sorted list of bag paths
+    """
+    prefixes = "|".join([re.escape(pipeline_prefix(pipeline)) for pipeline in pipelines])
+    regex = re.compile("^(?:%s)?%s(?:_[0-9]+)?\\.bag$" % (prefixes, re.escape(test)))
+    return [os.path.join(data_directory, name) for name in sorted(os.listdir(data_directory))
+            if regex.match(name) is not None and not name.endswith(FAILURE_WINDOW_SUFFIX)]
+
+
+class BagCollector(object):
+    """
+    Collect rosbag files from pipelines to the daemon data directory.
+
+    Files are transferred concurrently (at most 'parallelism' transfers at a time). A manifest in the data directory
+    records the size, modification time and checksum of every collected file, so files that have not changed are
+    not transferred again (unless the collected file no longer matches its checksum). Interrupted transfers are kept
+    as partial files and resumed on the next collection, every transfer is verified against the checksum of the
+    source file.
+    """
+    def __init__(self, data_directory, parallelism=4, compression=""):
+        """
+        Arguments:
+        data_directory -- local directory to collect the bags to
+        parallelism -- maximum number of concurrent transfers
+        compression -- "" (none), "lz4" or "bz2" (compressed with 'rosbag compress' after the transfer)
+        """
+        self.data_directory = data_directory
+        self.partial_directory = os.path.join(data_directory, ".partial")
+        self.manifest_filename = os.path.join(data_directory, "bag_manifest.json")
+        self.parallelism = max(1, int(parallelism))
+        self.compression = compression
+        self.lock = threading.Lock()
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_filename, 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def save_manifest(self):
+        """
+        Write the manifest atomically (must be called with lock held).
+        """
+        temp_filename = self.manifest_filename + ".tmp"
+        with open(temp_filename, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.rename(temp_filename, self.manifest_filename)
+
+    def list_bags(self, pipeline, directory, prefix, suffix):
+        """
+        List the bag files in the pipeline directory (files still being recorded are not listed).
+
+        Returns:
+        list of (path, size, modification time) tuples or None if listing failed
+        """
+        command = prefix + "find \"" + directory + "\" -maxdepth 1 -name \"*.bag\" -printf \"%s %T@ %p\\n\"" + suffix
+        rospy.loginfo("Executing command '%s'" % command)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+        output = process.communicate()[0]
+        if process.returncode != 0:
+            rospy.logerr("Unable to list bags in pipeline '%s'!" % pipeline)
+            return None
+        bags = []
+        for line in output.decode('utf-8').splitlines():
+            fields = line.split(" ", 2)
+            if len(fields) == 3:
+                bags.append((fields[2], int(fields[0]), fields[1]))
+        return bags
+
+    def local_name(self, key, pipeline, path, reserved):
+        """
+        Arguments:
+        reserved -- names already assigned to other files in this collection
+
+        Returns:
+        file name in the data directory (prefixed with the pipeline tag if the name is taken by another pipeline)
+        """
+        name = os.path.basename(path)
+        taken = set(reserved)
+        taken.update([self.manifest[other_key]['name'] for other_key in self.manifest if other_key != key])
+        if name in taken:
+            name = pipeline_prefix(pipeline) + name
+        return name
+
+    def is_collected(self, key, size, mtime):
+        """
+        Returns:
+        the manifest entry if the file has been collected and has not changed since (the checksum is not verified),
+        otherwise None
+        """
+        entry = self.manifest.get(key, None)
+        if entry is not None and entry['size'] == size and entry['mtime'] == mtime and \
+                os.path.isfile(os.path.join(self.data_directory, entry['name'])):
+            return entry
+        return None
+
+    def remote_md5sum(self, pipeline, path, prefix, suffix):
+        """
+        Returns:
+        checksum of the file in the pipeline or None if it could not be computed
+        """
+        command = prefix + "md5sum \"" + path + "\"" + suffix
+        rospy.loginfo("Executing command '%s'" % command)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE)
+        output = process.communicate()[0].decode('utf-8').split()
+        if process.returncode != 0 or len(output) == 0:
+            rospy.logerr("[%s] Unable to compute the checksum of '%s'!" % (pipeline, path))
+            return None
+        return output[0]
+
+    def collect_bag(self, pipeline, key, name, path, size, mtime, prefix, suffix, checksum=None):
+        """
+        Collect a single file, a collected file is only transferred again if it does not match its checksum.
+
+        Arguments:
+        checksum -- checksum of the collected file (None if the file has not been collected)
+
+        Returns:
+        True if the file was collected, False if the transfer failed or None if the collected file was verified
+        """
+        if checksum is not None:
+            if md5sum(os.path.join(self.data_directory, name)) == checksum:
+                return None
+            rospy.logwarn("[%s] Collected '%s' does not match its checksum, collecting again..." % (pipeline, name))
+        return self.transfer(pipeline, key, name, path, size, mtime, prefix, suffix)
+
+    def transfer(self, pipeline, key, name, path, size, mtime, prefix, suffix):
+        """
+        Transfer (or resume transferring) a single file.
+
+        Returns:
+        True if the file was collected
+        """
+        partial = os.path.join(self.partial_directory, name)
+        # The source of the partial file is stored next to it, so only transfers of the same file are resumed
+        source = "%s %s %s" % (key, size, mtime)
+        offset = 0
+        if os.path.isfile(partial):
+            try:
+                with open(partial + ".source", 'r') as f:
+                    if f.read() == source:
+                        offset = os.path.getsize(partial)
+            except IOError:
+                pass
+            if offset == 0 or offset > size:
+                os.remove(partial)
+                offset = 0
+        with open(partial + ".source", 'w') as f:
+            f.write(source)
+        if offset < size:
+            if offset > 0:
+                rospy.loginfo("[%s] Resuming '%s' at %s/%s bytes" % (pipeline, path, offset, size))
+            command = prefix + "tail -c +" + str(offset + 1) + " \"" + path + "\"" + suffix + " >> \"" + partial + "\""
+            rospy.loginfo("Executing command '%s'" % command)
+            if subprocess.call(command, shell=True) != 0:
+                rospy.logerr("[%s] Unable to copy '%s'!" % (pipeline, path))
+                return False
+        if os.path.getsize(partial) != size:
+            rospy.logerr("[%s] Size of '%s' does not match (%s != %s)!" % (pipeline, path, os.path.getsize(partial),
+                                                                          size))
+            os.remove(partial)
+            return False
+        os.remove(partial + ".source")
+        checksum = md5sum(partial)
+        remote_checksum = self.remote_md5sum(pipeline, path, prefix, suffix)
+        if remote_checksum != checksum:
+            if remote_checksum is not None:
+                rospy.logerr("[%s] Checksum of '%s' does not match (%s != %s)!" % (pipeline, path, checksum,
+                                                                                  remote_checksum))
+            os.remove(partial)
+            return False
+        target = os.path.join(self.data_directory, name)
+        if self.compression in ("lz4", "bz2"):
+            command = "rosbag compress -q --" + self.compression + " --output-dir=\"" + self.data_directory + \
+                      "\" \"" + partial + "\""
+            rospy.loginfo("Executing command '%s'" % command)
+            if subprocess.call(command, shell=True) != 0:
+                rospy.logerr("[%s] Unable to compress '%s'!" % (pipeline, partial))
+                return False
+            os.remove(partial)
+            # The manifest holds the checksum of the collected file
+            checksum = md5sum(target)
+        else:
+            os.rename(partial, target)
+        self.lock.acquire()
+        try:
+            self.manifest[key] = {'pipeline': pipeline, 'path': path, 'size': size, 'mtime': mtime, 'md5': checksum,
+                                  'name': name, 'compression': self.compression}
+            self.save_manifest()
+        finally:
+            self.lock.release()
+        rospy.loginfo("[%s] Collected '%s' to '%s'" % (pipeline, path, target))
+        # Index while the file is still in the page cache
+        testit_bagindex.get_index(target)
+        return True
+
+    def collect(self, sources):
+        """
+        Collect bags from all sources concurrently.
+
+        Arguments:
+        sources -- list of (pipeline, directory, prefix, suffix) tuples
+
+        Returns:
+        (collected, skipped, failed) counts
+        """
+        for directory in (self.data_directory, self.partial_directory):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        collected = 0
+        skipped = 0
+        failed = 0
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.parallelism)
+        try:
+            listings = dict((executor.submit(self.list_bags, pipeline, directory, prefix, suffix),
+                             (pipeline, prefix, suffix)) for pipeline, directory, prefix, suffix in sources)
+            transfers = []
+            reserved = set()
+            for future in concurrent.futures.as_completed(listings):
+                pipeline, prefix, suffix = listings[future]
+                bags = future.result()
+                if bags is None:
+                    failed += 1
+                    continue
+                for path, size, mtime in bags:
+                    key = pipeline + ":" + path
+                    self.lock.acquire()
+                    try:
+                        entry = self.is_collected(key, size, mtime)
+                        if entry is not None:
+                            name = entry['name']
+                            checksum = entry.get('md5', None)
+                        else:
+                            name = self.local_name(key, pipeline, path, reserved)
+                            checksum = None
+                    finally:
+                        self.lock.release()
+                    reserved.add(name)
+                    transfers.append(executor.submit(self.collect_bag, pipeline, key, name, path, size, mtime,
+                                                     prefix, suffix, checksum))
+            for future in concurrent.futures.as_completed(transfers):
+                try:
+                    result = future.result()
+                    if result is None:
+                        skipped += 1
+                    elif result:
+                        collected += 1
+                    else:
+                        failed += 1
+                except Exception as e:
+                    rospy.logerr("Bag transfer failed: %s" % e)
+                    failed += 1
+        finally:
+            executor.shutdown(wait=True)
+        return collected, skipped, failed
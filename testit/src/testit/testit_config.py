@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import numbers
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+SYSTEMS = ("SUT", "TestIt")
+MODES = ("bringup", "run", "stop", "teardown", "reset")
+# Step key suffix (e.g., "runSUT" + "Delay") and its value if the configuration schema is not available
+STEP_FIELDS = (("", ""), ("Delay", 0), ("Timeout", 0), ("FinishTrigger", "-"))
+# Optional pipeline settings (not required in the pipeline definitions)
+PIPELINE_OPTIONAL = {'warmPipeline': False, 'warmRestartInterval': 0}
+# Scheduling settings of the tests if the configuration schema is not available
+TEST_DEFAULTS = {'priority': 0, 'concurrency': 1, 'pipeline': "", 'creditBatch': 1}
+# Test settings that the pipeline configuration overrides if the pipeline defines them, with their defaults
+PIPELINE_RESOLVED = {'testItVolume': None, 'sharedDirectory': None, 'resultsDirectory': None, 'verbose': False,
+                     'postTestCommand': "", 'postTestSuccessCommand': "", 'postTestFailureCommand': "",
+                     'postCommand': "", 'postSuccessCommand': "", 'postFailureCommand': ""}
+
+
+class ConfigurationError(Exception):
+    """
+    Invalid configuration.
+
+    Attributes:
+    problems -- list of problem descriptions
+    """
+    def __init__(self, problems):
+        Exception.__init__(self, "; ".join(problems))
+        self.problems = problems
+
+
+def step_keys():
+    """
+    Returns:
+    list of (mode, system) tuples of the pipeline steps (e.g., ("run", "SUT"))
+    """
+    return [(mode, system) for mode in MODES for system in SYSTEMS]
+
+
+def pipeline_defaults(configuration, schema=None):
+    """
+    Default values of the pipeline step and warm pipeline settings.
+
+    Values are taken from the configuration section, then from the configuration schema (cfg/config.yaml).
+
+    Returns:
+    dict {key: default value}
+    """
+    fallback = dict(PIPELINE_OPTIONAL)
+    for mode, system in step_keys():
+        for suffix, value in STEP_FIELDS:
+            fallback[mode + system + suffix] = value
+    if schema is not None:
+        for key in fallback:
+            if schema.get('configuration', {}).get(key, '') != '':
+                fallback[key] = schema['configuration'][key]
+    defaults = {}
+    for key in fallback:
+        value = configuration.get(key, '')
+        defaults[key] = fallback[key] if value == '' else value
+    return defaults
+
+
+def as_tuple(value):
+    """
+    Returns:
+    the list value as a tuple or a scalar value as a tuple of one value
+    """
+    if type(value) == list or type(value) == tuple:
+        return tuple(value)
+    return (value,)
+
+
+def check_type(where, key, value, expected, problems):
+    """
+    Check the value (or the values of a list) against the type of the schema value.
+
+    Empty strings and None are accepted, they mean "use default".
+    """
+    if value is None or value == '' or expected is None:
+        return
+    values = value if type(value) == list else [value]
+    for value in values:
+        if type(expected) == bool:
+            valid = type(value) == bool
+            name = "boolean"
+        elif isinstance(expected, numbers.Number):
+            valid = isinstance(value, numbers.Number) and type(value) != bool
+            name = "number"
+        elif isinstance(expected, string_types):
+            valid = isinstance(value, string_types) or isinstance(value, numbers.Number)
+            name = "string"
+        else:
+            return
+        if not valid:
+            problems.append("%s '%s' must be a %s (is %r)" % (where, key, name, value))
+            return
+
+
+class Section(object):
+    """
+    Read-only configuration section (e.g., a pipeline or a test) with attribute access to its values.
+    """
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Configuration is read-only ('%s')" % name)
+
+    def get(self, key, default=None):
+        return self.__dict__.get(key, default)
+
+
+class Step(object):
+    """
+    Pipeline step (e.g., runSUT) normalized to tuples of commands, delays, timeouts and triggers.
+
+    A command list means one command per host (multi-host SUT), scalar values apply to all hosts.
+    """
+    __slots__ = ('name', 'commands', 'delays', 'timeouts', 'triggers')
+
+    def __init__(self, name, values):
+        self.name = name
+        self.commands = as_tuple(values.get(name, None))
+        self.delays = as_tuple(values.get(name + 'Delay', 0))
+        self.timeouts = as_tuple(values.get(name + 'Timeout', 0))
+        self.triggers = as_tuple(values.get(name + 'FinishTrigger', "-"))
+
+    def problems(self, where):
+        lengths = set([len(x) for x in (self.commands, self.delays, self.timeouts, self.triggers) if len(x) > 1])
+        if len(lengths) > 1:
+            return ["%s '%s' list values have different lengths (%s)" % (where, self.name,
+                                                                          ", ".join(str(x) for x in sorted(lengths)))]
+        return []
+
+    def at(self, values, i):
+        return values[0] if i is None or len(values) == 1 else values[i]
+
+    def command(self, i=None):
+        return self.at(self.commands, i)
+
+    def delay(self, i=None):
+        return self.at(self.delays, i)
+
+    def timeout(self, i=None):
+        return self.at(self.timeouts, i)
+
+    def trigger(self, i=None):
+        return self.at(self.triggers, i)
+
+
+class PipelineConfig(Section):
+    """
+    Compiled pipeline configuration.
+
+    Attributes (in addition to the pipeline values):
+    steps -- {step name (e.g., "runSUT"): Step}
+    overrides -- test settings defined by the pipeline (see PIPELINE_RESOLVED)
+    """
+    def __init__(self, values):
+        Section.__init__(self, values)
+        self.__dict__['steps'] = dict((mode + system, Step(mode + system, values)) for mode, system in step_keys())
+        self.__dict__['overrides'] = dict((key, values[key]) for key in PIPELINE_RESOLVED if key in values)
+
+    def resolve(self, values):
+        """
+        Resolve the test settings (e.g., a rendered test configuration) in the pipeline: the pipeline values have
+        priority and missing values are set to defaults.
+
+        Returns:
+        new dict
+        """
+        resolved = dict(values)
+        resolved.update(self.overrides)
+        for key in PIPELINE_RESOLVED:
+            if resolved.get(key, None) is None:
+                resolved[key] = PIPELINE_RESOLVED[key]
+        return resolved
+
+    def lookup(self, values, key):
+        """
+        Returns:
+        the value of a test setting in the pipeline (without modifying the test)
+        """
+        if key in self.overrides:
+            return self.overrides[key]
+        value = values.get(key, None)
+        return PIPELINE_RESOLVED.get(key, None) if value is None else value
+
+
+class Configuration(object):
+    """
+    Daemon configuration compiled once from the configuration, pipeline and test dictionaries.
+
+    Values are validated against the types in the configuration schema (cfg/config.yaml). Keys that are not in
+    the schema are accepted (e.g., custom '[[key]]' replacement values).
+
+    Attributes:
+    configuration -- Section
+    pipelines -- {tag: PipelineConfig}
+    tests -- {tag: Section} (missing and empty test values are set to the schema defaults)
+    """
+    def __init__(self, configuration, pipelines, tests, schema=None):
+        problems = []
+        schema = schema if schema is not None else {}
+        configuration_schema = schema.get('configuration', {})
+        pipeline_schema = dict(configuration_schema)
+        pipeline_schema.update((schema.get('pipelines', None) or [{}])[0])
+        test_template = (schema.get('tests', None) or [{}])[0]
+        self.test_schema = dict(configuration_schema)
+        self.test_schema.update(test_template)
+        self.test_defaults = dict(TEST_DEFAULTS)
+        self.test_defaults.update((key, value) for key, value in test_template.items()
+                                  if key != 'tag' and value != '' and not isinstance(value, (list, dict)))
+        self.check(problems, "Configuration", configuration, configuration_schema)
+        self.configuration = Section(configuration)
+        self.pipelines = {}
+        for tag in pipelines:
+            self.check(problems, "Pipeline '%s'" % tag, pipelines[tag], pipeline_schema)
+            self.pipelines[tag] = PipelineConfig(pipelines[tag])
+            for step in self.pipelines[tag].steps.values():
+                problems += step.problems("Pipeline '%s'" % tag)
+        self.tests = {}
+        for tag in tests:
+            problems += self.add_test(tag, tests[tag], False)
+        if len(problems) > 0:
+            raise ConfigurationError(problems)
+
+    def add_test(self, tag, values, strict=True):
+        """
+        Compile a test (e.g., a scenario created at runtime).
+
+        Returns:
+        list of problems (raises ConfigurationError instead if strict)
+        """
+        problems = []
+        self.check(problems, "Test '%s'" % tag, values, self.test_schema)
+        if strict and len(problems) > 0:
+            raise ConfigurationError(problems)
+        compiled = dict(self.test_defaults)
+        compiled.update((key, value) for key, value in values.items() if value != '')
+        self.tests[tag] = Section(compiled)
+        return problems
+
+    def check(self, problems, where, values, schema):
+        for key in values:
+            if key in schema:
+                check_type(where, key, values[key], schema[key], problems)
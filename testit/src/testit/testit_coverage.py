@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import json
+import os
+
+SEGMENT_SIZE = 16 * 1024 * 1024  # bytes, a new segment file is started when the current one exceeds this
+
+
+class CoverageStore(object):
+    """
+    Append-only store for coverage log entries (see testit_coverage.log).
+
+    Entries are appended to JSON lines segment files ('segment-N.jsonl') grouped into slices by model, file, event
+    and traceStartTimestamp. Every slice is recorded in 'index.jsonl' with its location, so queries read only the
+    slices they need. Each line holds the position of the entry in the added list, so the original order is restored
+    when slices are merged. Traces that have already been added from a pipeline are skipped, so adding the same coverage
+    log again does not count the entries twice.
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        self.lock.acquire()
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.slices = []
+            self.runs = set()
+            self.segment = 0
+            self.batch = 0
+            try:
+                with open(self.index_filename(), 'r') as f:
+                    for line in f:
+                        if line.strip() == "":
+                            continue
+                        record = json.loads(line)
+                        self.slices.append(record)
+                        self.runs.add(self.run_key(record['pipeline'], record['model'], record['trace']))
+                        self.segment = max(self.segment, record['segment'])
+                        self.batch = max(self.batch, record['batch'] + 1)
+            except IOError:
+                pass
+            rospy.loginfo("Coverage store '%s' has %s slice(s)" % (self.directory, len(self.slices)))
+        finally:
+            self.lock.release()
+
+    def index_filename(self):
+        return os.path.join(self.directory, "index.jsonl")
+
+    def segment_filename(self, segment):
+        return os.path.join(self.directory, "segment-%s.jsonl" % segment)
+
+    def open_segment(self):
+        segment = open(self.segment_filename(self.segment), 'ab')
+        # The position of a file opened for appending is not defined before the first write
+        segment.seek(0, os.SEEK_END)
+        return segment
+
+    def run_key(self, pipeline, model, trace):
+        return (pipeline, model, trace)
+
+    def add(self, entries, pipeline=""):
+        """
+        Append coverage entries (each entry must have 'model', 'file', 'event' and 'traceStartTimestamp').
+
+        Arguments:
+        pipeline -- pipeline tag the entries were collected from (traces are deduplicated per pipeline and model)
+
+        Returns:
+        number of entries added
+        """
+        groups = {}
+        order = []
+        for i, entry in enumerate(entries):
+            key = (entry.get('model', ""), entry.get('file', ""), entry.get('event', ""),
+                   entry.get('traceStartTimestamp', None))
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append((i, entry))
+        added = 0
+        self.lock.acquire()
+        try:
+            new_runs = set()
+            records = []
+            segment = self.open_segment()
+            try:
+                for key in order:
+                    model, file, event, trace = key
+                    run = self.run_key(pipeline, model, trace)
+                    if run in self.runs:
+                        continue
+                    new_runs.add(run)
+                    if segment.tell() > SEGMENT_SIZE:
+                        segment.close()
+                        self.segment += 1
+                        segment = self.open_segment()
+                    offset = segment.tell()
+                    data = "".join([json.dumps(line) + "\n" for line in groups[key]]).encode('utf-8')
+                    segment.write(data)
+                    records.append({'pipeline': pipeline, 'model': model, 'file': file, 'event': event,
+                                    'trace': trace, 'batch': self.batch, 'segment': self.segment, 'offset': offset,
+                                    'length': len(data), 'count': len(groups[key])})
+                    added += len(groups[key])
+                segment.flush()
+                os.fsync(segment.fileno())
+            finally:
+                segment.close()
+            # The slices are added to the index only after the data has been written
+            with open(self.index_filename(), 'a') as index:
+                for record in records:
+                    index.write(json.dumps(record) + "\n")
+            self.slices += records
+            self.runs |= new_runs
+            self.batch += 1
+        finally:
+            self.lock.release()
+        return added
+
+    def match(self, record, model=None, file=None, event=None, trace=None):
+        """
+        'model' and 'file' match substrings (as the coverage entries have absolute paths), 'event' and 'trace' must be
+        equal.
+        """
+        return (model is None or model in record['model']) and (file is None or file in record['file']) and \
+            (event is None or event == record['event']) and (trace is None or trace == record['trace'])
+
+    def traces(self, model=None, file=None, event=None):
+        """
+        Returns:
+        list of traceStartTimestamps of the matching slices in the order they were added (without duplicates)
+        """
+        self.lock.acquire()
+        try:
+            traces = []
+            for record in self.slices:
+                if self.match(record, model, file, event) and record['trace'] not in traces:
+                    traces.append(record['trace'])
+            return traces
+        finally:
+            self.lock.release()
+
+    def query(self, model=None, file=None, event=None, trace=None):
+        """
+        Read the entries of the matching slices.
+
+        Returns:
+        list of coverage entries in the order they were added
+        """
+        self.lock.acquire()
+        try:
+            records = [record for record in self.slices if self.match(record, model, file, event, trace)]
+        finally:
+            self.lock.release()
+        records.sort(key=lambda record: (record['segment'], record['offset']))
+        lines = []
+        handles = {}
+        try:
+            for record in records:
+                if record['segment'] not in handles:
+                    handles[record['segment']] = open(self.segment_filename(record['segment']), 'rb')
+                f = handles[record['segment']]
+                f.seek(record['offset'])
+                for line in f.read(record['length']).decode('utf-8').splitlines():
+                    position, entry = json.loads(line)
+                    lines.append((record['batch'], position, entry))
+        finally:
+            for f in handles.values():
+                f.close()
+        lines.sort(key=lambda line: line[:2])
+        return [entry for _, _, entry in lines]
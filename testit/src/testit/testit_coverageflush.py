@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import collections
+import time
+
+
+class CoverageFlushScheduler(object):
+    """
+    Coalesces the coverage flushes of logged entries.
+
+    The scheduler thread requests the coverage reports of the SUT hosts ('flush(seq)') as soon as an entry is added,
+    but at most once per 'window' seconds: the entries added while a request is throttled share the next flush. A
+    flush only covers the entries added before it was requested, so an entry never gets a coverage snapshot taken
+    before it happened. The reports of the flush ('report') are collected for 'report_time' seconds after the
+    request, then the collected coverage is attached to all entries of the flush in one pass and they are written in
+    order ('write(entry)'). Reports are indexed by flush sequence number, so reports of other flushes are never
+    scanned.
+    """
+    def __init__(self, flush, write, window=0.1, report_time=1.0):
+        self.flush = flush
+        self.write = write
+        self.window = window
+        self.report_time = report_time
+        self.condition = threading.Condition()
+        self.pending = []  # entries waiting for the next flush to be started
+        self.flushes = collections.deque()  # requested flushes in order: {'seq', 'entries', 'due'}
+        self.requested = None  # time of the last flush request
+        self.reports = {}  # seq: {filename: {host_id: lines}}
+        self.seq = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="testit_coverageflush")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, entry):
+        """
+        Add an entry to the next flush.
+
+        Returns:
+        False if the scheduler is closed
+        """
+        self.condition.acquire()
+        try:
+            if self.closed:
+                return False
+            self.pending.append(entry)
+            if len(self.pending) == 1:
+                self.condition.notify_all()
+            return True
+        finally:
+            self.condition.release()
+
+    def report(self, seq, host_id, coverage):
+        """
+        Add the coverage report of a SUT host for flush 'seq'.
+
+        Args:
+        coverage -- list of FileCoverage (filename, lines)
+        """
+        self.condition.acquire()
+        try:
+            files = self.reports.get(seq, None)
+            if files is None:
+                # Not requested or the reporting time has passed
+                return False
+            for file_coverage in coverage:
+                files.setdefault(file_coverage.filename, {})[host_id] = file_coverage.lines
+            return True
+        finally:
+            self.condition.release()
+
+    def close(self, timeout=10.0):
+        """
+        Write the pending entries (without waiting for the coverage reports) and stop the scheduler thread.
+        """
+        self.condition.acquire()
+        try:
+            self.closed = True
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+        self.thread.join(timeout)
+
+    def next_action(self):
+        """
+        Wait until a flush has to be requested or completed (condition must be acquired).
+
+        Returns:
+        tuple (seq to request, None, []) or (None, coverage, entries of a completed flush), None when closed and
+        nothing is left
+        """
+        while True:
+            now = time.time()
+            deadlines = []
+            if len(self.pending) > 0 and not self.closed:
+                start = now if self.requested is None else self.requested + self.window
+                if now >= start:
+                    self.seq += 1
+                    self.reports[self.seq] = {}
+                    self.flushes.append({'seq': self.seq, 'entries': self.pending, 'due': now + self.report_time})
+                    self.pending = []
+                    self.requested = now
+                    return self.seq, None, []
+                deadlines.append(start)
+            if len(self.flushes) > 0 and (self.closed or now >= self.flushes[0]['due']):
+                completed = self.flushes.popleft()
+                return None, self.reports.pop(completed['seq']), completed['entries']
+            if self.closed:
+                entries = self.pending
+                self.pending = []
+                return None if len(entries) == 0 else (None, {}, entries)
+            if len(self.flushes) > 0:
+                deadlines.append(self.flushes[0]['due'])
+            if len(deadlines) > 0:
+                self.condition.wait(min(deadlines) - now)
+            else:
+                self.condition.wait()
+
+    def run(self):
+        while True:
+            self.condition.acquire()
+            try:
+                action = self.next_action()
+            finally:
+                self.condition.release()
+            if action is None:
+                return
+            seq, coverage, entries = action
+            if seq is not None:
+                try:
+                    self.flush(seq)
+                except Exception as e:
+                    rospy.logerr("Coverage flush failed: %s" % e)
+            for entry in entries:
+                entry['coverage'] = coverage
+                self.write(entry)
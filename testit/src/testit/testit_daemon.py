@@ -46,16 +46,30 @@ import threading
 import time
 import sys
 import re
+import socket
 import subprocess
 import testit.junit
 import cStringIO
-import xml.etree.ElementTree
 import os
 import rosbag
 import testit_uppaal
 import tempfile
 import testit_optimizer
+import testit_probes
+import testit_scheduler
+import testit_template
+import testit_results
+import testit_collector
+import testit_bagindex
+import testit_coverage
+import testit_logstore
+import testit_journal
+import testit_metrics
+import testit_agent
+import testit_config
+import testit_shard
 import uuid
+import concurrent.futures
 
 
 class TestItDaemon:
@@ -67,6 +81,7 @@ class TestItDaemon:
         rospy.Service('testit/learn', testit.srv.Command, self.handle_learn)
         rospy.Service('testit/results', testit.srv.Command, self.handle_results)
         rospy.Service('testit/bag/collect', testit.srv.Command, self.handle_bag_collect)
+        rospy.Service('testit/bag/extract', testit.srv.Command, self.handle_bag_extract)
         rospy.Service('testit/coverage', testit.srv.Command, self.handle_coverage)
         rospy.Service('testit/uppaal/annotate/coverage', testit.srv.Command, self.handle_uppaal_annotate_coverage)
         rospy.Service('testit/uppaal/extract/failure', testit.srv.Command, self.handle_uppaal_extract_failure)
@@ -75,15 +90,24 @@ class TestItDaemon:
         rospy.Service('testit/credits', testit.srv.Command, self.handle_credits)
         rospy.Service('testit/optimize', testit.srv.Command, self.handle_optimize_log_scenario)
         rospy.Service('testit/online', testit.srv.Command, self.handle_online_test)
+        rospy.Service('testit/reload', testit.srv.Command, self.handle_reload)
+        rospy.Service('testit/metrics', testit.srv.Command, self.handle_metrics)
 
         self.initialize()
 
     def initialize(self):
         self.load_config_from_file()
-        self.threads = {}
-        self.test_threads = {}
+        self.lanes = {}  # number of active execution lanes per test tag
+        self.lanes_condition = threading.Condition()
+        self.credits_lock = threading.Lock()  # credits and reserved_credits of the tests
         self.testing = False
         self.call_result = {}
+        self.path_cache = {}  # {(prefix, suffix): {command: grounded path}}
+        self.path_cache_lock = threading.Lock()
+        self.metrics = self.create_metrics()
+        self.metrics_written = 0.0
+        self.agents = {}  # {connection prefix: testit_agent.RemoteAgent}
+        self.agents_lock = threading.Lock()
         self.configuration = rospy.get_param('testit/configuration', None)
         if self.configuration is None:
             rospy.logerror("No configuration defaults defined in configuration!")
@@ -95,6 +119,8 @@ class TestItDaemon:
         tests = self.rosparam_list_to_dict(rospy.get_param('testit/tests', {}), 'tag')
         self.tests = self.set_defaults(tests, self.configuration)
         self.tests = self.substitute_replacement_values(self.tests)
+        self.templates = {}
+        self.templates_lock = threading.Lock()
         if self.tests is None:
             rospy.logerror("No tests defined in configuration!")
             sys.exit(-1)
@@ -102,9 +128,409 @@ class TestItDaemon:
         if self.pipelines is None:
             rospy.logerror("No pipelines defined in configuration!")
             sys.exit(-1)
-        self.pipelines = self.substitute_replacement_values(
-            self.set_defaults(self.pipelines,
-                              self.configuration))
+        # Sharded execution: "" (standalone), "coordinator" or "worker"
+        self.role = rospy.get_param('~role', "")
+        self.coordinator = None
+        self.worker = None
+        if self.role == "worker":
+            self.worker_name = rospy.get_param('~worker', socket.gethostname())
+            self.pipelines = self.select_worker_pipelines(self.pipelines)
+            if self.configuration.get('dataDirectory', None) is not None:
+                self.configuration['dataDirectory'] += "workers/" + self.worker_name + "/"
+        self.pipelines = self.set_defaults(self.pipelines, self.configuration)
+        # Step and warm pipeline settings missing from the pipeline definitions are taken from the configuration
+        schema = self.get_configuration_schema()
+        step_defaults = testit_config.pipeline_defaults(self.configuration, schema)
+        for pipeline in self.pipelines.values():
+            for key in step_defaults:
+                if pipeline.get(key, '') == '':
+                    pipeline[key] = step_defaults[key]
+        self.pipelines = self.substitute_replacement_values(self.pipelines)
+        try:
+            self.config = testit_config.Configuration(self.configuration, self.pipelines, self.tests, schema)
+        except testit_config.ConfigurationError as e:
+            for problem in e.problems:
+                rospy.logerr("Invalid configuration: %s" % problem)
+            sys.exit(-1)
+        self.scheduler = testit_scheduler.Scheduler(self.pipelines.keys())
+        # At most one worker per pipeline can be executing, queued work waits in the scheduler
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(self.pipelines)))
+        self.warm_pipelines = {}  # {pipeline: runs since the SUT and TestIt were (re)started} (warmPipeline mode)
+        self.results = self.open_run_store()
+        self.coverage = self.open_coverage_store()
+        self.logs = None
+        if self.configuration.get('dataDirectory', None) is not None:
+            self.logs = testit_logstore.LogStore(self.ground_path(self.configuration['dataDirectory'], "", "") +
+                                                 "logger.log")
+        self.journal = None
+        if self.configuration.get('dataDirectory', None) is not None:
+            self.journal = testit_journal.Journal(self.ground_path(self.configuration['dataDirectory'], "", ""))
+            self.recover()
+        address = self.configuration.get('coordinator', "localhost:8910")
+        timeout = float(self.configuration.get('workerTimeout', 30))
+        if self.role == "coordinator":
+            self.coordinator = testit_shard.Coordinator(address, timeout, self.worker_states, self.worker_lost)
+        elif self.role == "worker":
+            self.worker = testit_shard.Worker(address, self.worker_name, timeout, self.pipeline_states,
+                                              self.execute_work, self.handle_work)
+
+    def select_worker_pipelines(self, pipelines):
+        """
+        Select the pipelines of this worker: pipelines with 'worker' equal to the worker name or, if no pipeline
+        defines 'worker', every n-th pipeline (sorted by tag) according to the '~shard' parameter ("index/count").
+
+        Returns:
+        dict with the selected pipelines
+        """
+        if any(pipelines[tag].get('worker', "") != "" for tag in pipelines):
+            selected = [tag for tag in pipelines if pipelines[tag].get('worker', "") == self.worker_name]
+        else:
+            index, count = [int(x) for x in str(rospy.get_param('~shard', "0/1")).split("/")]
+            selected = [tag for i, tag in enumerate(sorted(pipelines)) if i % count == index]
+        rospy.loginfo("Worker '%s' pipelines: %s" % (self.worker_name, selected))
+        return dict((tag, pipelines[tag]) for tag in selected)
+
+    def pipeline_states(self):
+        """
+        Returns:
+        {pipeline: state} (reported to the coordinator by workers)
+        """
+        return dict((tag, self.pipelines[tag].get('state', "OFFLINE")) for tag in self.pipelines)
+
+    def worker_states(self, worker, states):
+        """
+        Coordinator: adopt the pipeline states reported by a worker (pipelines leased to a lane stay BUSY).
+        """
+        for pipeline in states:
+            if pipeline not in self.pipelines:
+                rospy.logwarn("Worker '%s' reported unknown pipeline '%s'!" % (worker, pipeline))
+                continue
+            current = self.pipelines[pipeline].get('state', "OFFLINE")
+            if current == "BUSY":
+                continue
+            if states[pipeline] == "BUSY":
+                # Not leased by this coordinator (e.g., after a coordinator restart or a lost worker)
+                self.coordinator.release(pipeline)
+            elif current != states[pipeline]:
+                rospy.loginfo("[%s] %s (worker '%s')" % (pipeline, states[pipeline], worker))
+                self.set_pipeline_state(pipeline, states[pipeline])
+
+    def worker_lost(self, worker, pipelines):
+        """
+        Coordinator: the pipelines of a lost worker are OFFLINE (lanes executing in them are queued again).
+        """
+        for pipeline in pipelines:
+            if pipeline in self.pipelines:
+                self.set_pipeline_state(pipeline, "OFFLINE")
+
+    def execute_work(self, message):
+        """
+        Worker: execute a credit sent by the coordinator.
+
+        Returns:
+        outcome of the run (see execute_credit)
+        """
+        tag = message['tag']
+        pipeline = message['pipeline']
+        if tag not in self.tests or pipeline not in self.pipelines:
+            rospy.logerr("Unknown test '%s' or pipeline '%s' requested by coordinator!" % (tag, pipeline))
+            return {'executed': False, 'timings': {}}
+        # The coordinator owns the credits, the remaining credits decide about post commands and warm pipelines
+        self.tests[tag]['credits'] = message['credits']
+        if message.get('uuid', None) is not None:
+            self.tests[tag]['uuid'] = message['uuid']
+        if self.pipelines[pipeline].get('state', "OFFLINE") != "BUSY":
+            self.set_pipeline_state(pipeline, "BUSY")
+        rospy.set_param('testit/pipeline', self.pipelines[pipeline])
+        sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", pipeline)
+        testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+        return self.execute_credit(tag, pipeline, message.get('keepBags', False), sut_prefix, sut_suffix,
+                                   testit_prefix, testit_suffix)
+
+    def handle_work(self, message):
+        """
+        Worker: execute a pipeline release or a command (bringup, teardown) sent by the coordinator.
+        """
+        if message['kind'] == "release":
+            if message['pipeline'] in self.pipelines and \
+                    self.pipelines[message['pipeline']].get('state', "OFFLINE") == "BUSY":
+                self.free_pipeline(message['pipeline'])
+        elif message['kind'] == "command" and message['name'] in ("bringup", "teardown"):
+            request = testit.srv.CommandRequest(message['args'])
+            response = getattr(self, "handle_" + message['name'])(request)
+            rospy.loginfo("Coordinator %s finished with %s" % (message['name'], response.result))
+        else:
+            rospy.logwarn("Unknown message from coordinator: %s" % message)
+
+    def create_metrics(self):
+        metrics = testit_metrics.Metrics()
+        metrics.declare('testit_phase_duration_seconds', 'histogram',
+                        "Duration of test execution phases (queueWait, runSUT, runTestIt, preLaunch, launch, test, "
+                        "postTest, stopTestIt, stopSUT) per scenario and pipeline")
+        metrics.declare('testit_system_step_duration_seconds', 'histogram',
+                        "Duration of the command, delay and finish trigger steps of SUT and TestIt run/stop")
+        metrics.declare('testit_command_duration_seconds', 'histogram',
+                        "Duration of ssh/docker exec commands executed for a pipeline")
+        metrics.declare('testit_runs_total', 'counter', "Number of recorded test runs")
+        metrics.declare('testit_pipeline_busy_seconds_total', 'counter',
+                        "Time the pipeline has spent in BUSY state (utilization is the rate of this counter)")
+        metrics.declare('testit_pipeline_busy', 'gauge', "1 if the pipeline is executing a test, 0 otherwise")
+        metrics.declare('testit_queue_depth', 'gauge', "Number of execution lanes waiting for a free pipeline")
+        return metrics
+
+    def get_agent(self, prefix):
+        """
+        Return the remote agent for the connection prefix (see get_command_wrapper).
+
+        Returns:
+        testit_agent.RemoteAgent or None if 'remoteAgent' is disabled or commands are not wrapped (localhost or
+        multiple connections)
+        """
+        if not self.configuration.get('remoteAgent', False) or type(prefix) != str or prefix == "":
+            return None
+        self.agents_lock.acquire()
+        try:
+            if prefix not in self.agents:
+                self.agents[prefix] = testit_agent.RemoteAgent.from_prefix(
+                    prefix, self.configuration.get('remoteAgentPython', "python"))
+            return self.agents[prefix]
+        finally:
+            self.agents_lock.release()
+
+    def close_agents(self):
+        self.agents_lock.acquire()
+        try:
+            agents = self.agents.values()
+            self.agents = {}
+        finally:
+            self.agents_lock.release()
+        for agent in agents:
+            agent.close()
+
+    def call(self, command, pipeline, kind, prefix="", remote=None, output=None):
+        """
+        Execute a shell command for the pipeline and add its duration to the command metrics.
+
+        If the remote agent is enabled for the connection (prefix), 'remote' is executed by the agent instead of
+        'command'.
+
+        Arguments:
+        kind -- command type label (e.g., "bringup", "docker exec", "scp")
+        remote -- the command without the connection wrapping (argv list or shell command string)
+        output -- function called with the output lines of the remote command (output goes to stdout if None)
+
+        Returns:
+        the return code of the command
+        """
+        started = time.time()
+        try:
+            agent = self.get_agent(prefix) if remote is not None else None
+            if agent is not None:
+                try:
+                    return agent.execute(remote, output if output is not None else sys.stdout.write)
+                except testit_agent.AgentError as e:
+                    if e.sent:
+                        rospy.logerr("[%s] Remote agent failed: %s" % (pipeline, e))
+                        return 255
+                    rospy.logwarn("[%s] Remote agent not available (%s), executing '%s'" % (pipeline, e, command))
+            return subprocess.call(command, shell=True)
+        finally:
+            self.metrics.observe('testit_command_duration_seconds', time.time() - started,
+                                 {'pipeline': pipeline, 'kind': kind})
+
+    def call_batch(self, pipeline, prefix, commands):
+        """
+        Execute the commands in order (in one round trip if the remote agent is enabled for the connection).
+
+        Arguments:
+        commands -- list of tuples (command, kind, remote), see call
+
+        Returns:
+        list of return codes
+        """
+        agent = self.get_agent(prefix)
+        if agent is not None:
+            started = time.time()
+            try:
+                return agent.batch([remote for command, kind, remote in commands])
+            except testit_agent.AgentError as e:
+                if e.sent:
+                    rospy.logerr("[%s] Remote agent failed: %s" % (pipeline, e))
+                    return [255] * len(commands)
+                rospy.logwarn("[%s] Remote agent not available (%s)" % (pipeline, e))
+            finally:
+                self.metrics.observe('testit_command_duration_seconds', time.time() - started,
+                                     {'pipeline': pipeline, 'kind': "batch"})
+        return [self.call(command, pipeline, kind) for command, kind, remote in commands]
+
+    def docker_exec_command(self, pipeline, prefix, suffix, script, options=(), wrapper=()):
+        """
+        Build the 'docker exec' command executing a bash script in the TestIt container.
+
+        Arguments:
+        options -- docker exec options (e.g., ['-d'])
+        wrapper -- command wrapping bash (e.g., ['stdbuf', '-i0', '-o0', '-e0'])
+
+        Returns:
+        tuple (command wrapped with the connection prefix and suffix, argv list for the remote agent)
+        """
+        argv = ['docker', 'exec'] + list(options) + [self.pipelines[pipeline]['testItContainerName']] + \
+            list(wrapper) + ['/bin/bash', '-c', script]
+        quote_termination = "'"
+        if prefix != "":
+            quote_termination = "'\\''"
+        return prefix + " ".join(argv[:-1]) + " " + quote_termination + script + quote_termination + suffix, argv
+
+    def write_metrics(self, force=True):
+        """
+        Update the gauges and write the metrics to the Prometheus text file in the daemon data directory.
+
+        Arguments:
+        force -- if False, the metrics are written at most once per 'metricsWriteInterval' seconds (rendering is
+                 proportional to the number of scenarios and pipelines)
+
+        Returns:
+        the metrics in Prometheus text exposition format or None if not written
+        """
+        now = time.time()
+        if not force and now - self.metrics_written < self.configuration.get('metricsWriteInterval', 10.0):
+            return None
+        self.metrics_written = now
+        for pipeline in self.pipelines:
+            self.metrics.set('testit_pipeline_busy', 1 if self.pipelines[pipeline].get('state', "") == "BUSY" else 0,
+                             {'pipeline': pipeline})
+        self.metrics.set('testit_queue_depth', self.scheduler.queued())
+        text = self.metrics.render()
+        if self.configuration.get('dataDirectory', None) is not None:
+            try:
+                self.metrics.write(self.ground_path(self.configuration['dataDirectory'], "", "") + "testit_metrics.prom",
+                                   text)
+            except (IOError, OSError) as e:
+                rospy.logwarn("Unable to write metrics: %s" % e)
+        return text
+
+    def handle_metrics(self, req):
+        rospy.logdebug("Metrics requested")
+        return testit.srv.CommandResponse(True, self.write_metrics())
+
+    def open_run_store(self):
+        """
+        Open the results database in the daemon data directory (in memory if 'dataDirectory' is not defined).
+        """
+        filename = ":memory:"
+        data_directory = self.configuration.get('dataDirectory', None)
+        if data_directory is not None:
+            filename = self.ground_path(data_directory, "", "") + "testit_results.db"
+        else:
+            rospy.logwarn("'dataDirectory' is not defined, test run history will not be persisted!")
+        return testit_results.RunStore(filename)
+
+    def journal_test(self, tag):
+        """
+        Record the scheduling state of the test in the journal.
+        """
+        if self.journal is not None:
+            worker, args = self.tests[tag].get('worker', (None, []))
+            self.journal.write("tests", tag, {'credits': self.tests[tag].get('credits', 0),
+                                              'running': self.tests[tag].get('running', 0),
+                                              'executing': self.tests[tag].get('executing', False),
+                                              'worker': worker, 'args': list(args)})
+
+    def journal_pipeline(self, pipeline):
+        if self.journal is not None:
+            self.journal.write("pipelines", pipeline, {'state': self.pipelines[pipeline].get('state', "OFFLINE")})
+
+    def journal_all(self):
+        for pipeline in self.pipelines:
+            self.journal_pipeline(pipeline)
+        for tag in self.tests:
+            self.journal_test(tag)
+
+    def pipeline_alive(self, pipeline, timeout=5.0):
+        """
+        Returns:
+        True if the bringup finish triggers of the pipeline report readiness (or no triggers are defined)
+        """
+        for system in ('SUT', 'TestIt'):
+            triggers = self.pipelines[pipeline].get('bringup' + system + 'FinishTrigger', "-")
+            if type(triggers) != list:
+                triggers = [triggers]
+            for trigger in triggers:
+                if trigger != "-" and not testit_probes.wait(trigger, timeout):
+                    return False
+        return True
+
+    def recover(self):
+        """
+        Restore the state journaled by a previous daemon (e.g., after a crash).
+
+        Pipelines that were READY are adopted again if their bringup triggers still report readiness (interrupted
+        runs in BUSY pipelines are stopped first). Credits of interrupted runs are returned, the latest results are
+        restored from the results database and tests that were executing are resumed.
+        """
+        state = self.journal.recover()
+        for pipeline, values in state.get('pipelines', {}).items():
+            if self.role == "coordinator":
+                # Workers report the pipeline states
+                break
+            if pipeline not in self.pipelines or values.get('state', None) not in ("READY", "BUSY"):
+                continue
+            if values['state'] == "BUSY":
+                rospy.loginfo("[%s] Stopping interrupted run..." % pipeline)
+                self.pipelines[pipeline]['state'] = "BUSY"
+                testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+                sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", pipeline)
+                self.execute_system(pipeline, 'TestIt', 'stop', testit_prefix, testit_suffix)
+                self.execute_system(pipeline, 'SUT', 'stop', sut_prefix, sut_suffix)
+            if self.pipeline_alive(pipeline):
+                rospy.loginfo("[%s] Adopting pipeline from previous daemon" % pipeline)
+                self.set_pipeline_state(pipeline, "READY")
+            else:
+                rospy.logwarn("[%s] Pipeline is not ready anymore, bringup is needed!" % pipeline)
+                self.set_pipeline_state(pipeline, "OFFLINE")
+        resume = []
+        for tag, values in state.get('tests', {}).items():
+            if tag not in self.tests:
+                continue
+            self.tests[tag]['credits'] = values.get('credits', 0) + values.get('running', 0)
+            self.tests[tag]['running'] = 0
+            run = self.results.latest(tag)
+            if run is not None:
+                self.tests[tag]['result'] = run['verdict']
+                self.tests[tag]['executor_pipeline'] = run['pipeline']
+                self.tests[tag]['test_start_timestamp'] = rospy.Time.from_sec(run['start'])
+                self.tests[tag]['test_end_timestamp'] = rospy.Time.from_sec(run['end'])
+            if values.get('executing', False) and values.get('worker', None) in ("test_thread_worker",
+                                                                                 "learn_thread_worker"):
+                resume.append((tag, values))
+            else:
+                self.journal_test(tag)
+        for tag, values in resume:
+            rospy.loginfo("Resuming '%s' with %s credit(s)" % (tag, self.tests[tag]['credits']))
+            self.tests[tag]['executing'] = True
+            self.start_lanes(tag, getattr(self, values['worker']), tuple(values.get('args', [])))
+
+    def open_coverage_store(self):
+        """
+        Open the coverage store in the daemon data directory (the old 'testit_coverage.log' is imported once).
+        """
+        data_directory = self.configuration.get('dataDirectory', None)
+        if data_directory is None:
+            rospy.logwarn("'dataDirectory' is not defined, coverage will not be stored!")
+            return None
+        data_directory = self.ground_path(data_directory, "", "")
+        store = testit_coverage.CoverageStore(data_directory + "coverage/")
+        legacy_filename = data_directory + "testit_coverage.log"
+        if os.path.isfile(legacy_filename):
+            rospy.loginfo("Importing coverage from '%s'..." % legacy_filename)
+            try:
+                entries = testit_common.parse_yaml(legacy_filename)
+                if entries is not None:
+                    rospy.loginfo("Imported %s coverage entries" % store.add(entries))
+                os.rename(legacy_filename, legacy_filename + ".imported")
+            except Exception as e:
+                rospy.logerr("Unable to import '%s': %s" % (legacy_filename, e))
+        return store
 
     def substitute_replacement_values(self, params, auxiliary={}, regex='(\[\[.*?\]\])', replacement_index=2):
         """
@@ -151,12 +577,9 @@ class TestItDaemon:
     def set_defaults(self, params, defaults):
         for param in params:
             for key in params[param]:
-                try:
-                    if params[param][key] == '' and defaults[key] != '':
-                        # set default
-                        params[param][key] = defaults[key]
-                except:
-                    pass
+                if params[param][key] == '' and defaults.get(key, '') != '':
+                    # set default
+                    params[param][key] = defaults[key]
         return params
 
     def rosparam_list_to_dict(self, param, key):
@@ -211,80 +634,79 @@ class TestItDaemon:
         testit_common.load_config_to_rosparam(testit_common.parse_yaml(filename))
 
     def execution_sleep(self, tag, prefix, instance, i=None):
-        start_time = rospy.Time.now()
-        timeout = self.pipelines[tag][prefix + instance + 'Timeout'] if i is None or type(
-            self.pipelines[tag][prefix + instance + 'Timeout']) != list else \
-            self.pipelines[tag][prefix + instance + 'Timeout'][i]
-        trigger = self.pipelines[tag][prefix + instance + 'FinishTrigger'] if i is None or type(
-            self.pipelines[tag][prefix + instance + 'FinishTrigger']) != list else \
-            self.pipelines[tag][prefix + instance + 'FinishTrigger'][i]
-        while timeout == 0 or (rospy.Time.now() - start_time).to_sec() < timeout:
-            if trigger != '-':
-                if subprocess.call(trigger, shell=True) == 0:
-                    rospy.loginfo('[%s] Done!' % tag)
-                    return True
-            else:
-                rospy.loginfo('[%s] Done!' % tag)
-                return True
-            time.sleep(1.0)
+        step = self.config.pipelines[tag].steps[prefix + instance]
+        trigger = step.trigger(i)
+        if trigger == '-' or testit_probes.wait(trigger, step.timeout(i)):
+            rospy.loginfo('[%s] Done!' % tag)
+            return True
         rospy.logerr('[%s] Timed out!' % tag)
         return False
 
-    def single_instance_execution(self, tag, prefix, instance, set_result, i=None):
-        command = self.pipelines[tag][prefix + instance] if i is None else self.pipelines[tag][prefix + instance][i]
+    def single_instance_execution(self, tag, prefix, instance, i=None):
+        step = self.config.pipelines[tag].steps[prefix + instance]
+        command = step.command(i)
         rospy.loginfo("[%s] Command is '%s'" % (tag, command))
-        if subprocess.call(command, shell=True) == 0:
+        if self.call(command, tag, prefix + instance) == 0:
             rospy.loginfo('[%s] Done!' % tag)
-            rospy.loginfo('[%s] Waiting for delay duration (%s)...' % (tag, self.pipelines[tag][
-                prefix + instance + 'Delay'] if i is None or type(
-                self.pipelines[tag][prefix + instance + 'Delay']) != list else
-            self.pipelines[tag][prefix + instance + 'Delay'][i]))
-            time.sleep(self.pipelines[tag][prefix + instance + 'Delay'] if i is None or type(
-                self.pipelines[tag][prefix + instance + 'Delay']) != list else
-                       self.pipelines[tag][prefix + instance + 'Delay'][i])
+            rospy.loginfo('[%s] Waiting for delay duration (%s)...' % (tag, step.delay(i)))
+            time.sleep(step.delay(i))
             rospy.loginfo('[%s] Waiting for the %s to finish...' % (tag, prefix))
             if not self.execution_sleep(tag, prefix, instance, i):
                 # Timed out
-                if set_result:
-                    self.threads[tag]['result'] = False
                 return False
             if self.pipelines[tag].get('state', "OFFLINE") != "TEARDOWN":
-                if set_result:
-                    self.threads[tag]['result'] = True
                 return True
             else:
                 rospy.logerr("Pipeline in TEARDOWN state!")
-                if set_result:
-                    self.threads[tag]['result'] = False
                 return False
         else:
             rospy.logerr("[%s] Failed to execute %s!" % (tag, instance))
-            if set_result:
-                self.threads[tag]['result'] = False
             return False
 
-    def instance_execution(self, tag, prefix, instance, set_result):
-        if type(self.pipelines[tag][prefix + instance]) == str:
+    def instance_execution(self, tag, prefix, instance):
+        commands = self.config.pipelines[tag].steps[prefix + instance].commands
+        if len(commands) == 1:
             rospy.loginfo('[%s] Executing %s %s...' % (tag, prefix, instance))
-            return self.single_instance_execution(tag, prefix, instance, set_result)
+            return self.single_instance_execution(tag, prefix, instance)
         else:
-            for i in range(len(self.pipelines[tag][prefix + instance])):
-                rospy.loginfo('[%s] Executing %s %s (%s of %s)...' % (
-                    tag, prefix, instance, i + 1, len(self.pipelines[tag][prefix + instance])))
-                if not self.single_instance_execution(tag, prefix, instance, set_result if set_result and i == len(
-                        self.pipelines[tag][prefix + instance]) - 1 else False, i):
+            for i in range(len(commands)):
+                rospy.loginfo('[%s] Executing %s %s (%s of %s)...' % (tag, prefix, instance, i + 1, len(commands)))
+                if not self.single_instance_execution(tag, prefix, instance, i):
                     return False
             return True
 
-    def thread_worker(self, tag, prefix, post_states):
+    def thread_worker(self, tag, prefix, post_states, extra_commands=[]):
+        """
+        Execute the SUT and TestIt commands for the pipeline (e.g., bringup or teardown).
+
+        Returns:
+        tuple (result, {phase: duration in seconds})
+        """
         rospy.logdebug('[%s] thread_worker started!' % tag)
-        sut_result = self.instance_execution(tag, prefix, "SUT", False)
-        testit_result = self.instance_execution(tag, prefix, "TestIt", True)
+        durations = {}
+        if prefix == "teardown":
+            # run stop just in case
+            start_time = time.time()
+            sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", tag)
+            testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", tag)
+            self.execute_system(tag, 'SUT', 'stop', sut_prefix, sut_suffix)
+            self.execute_system(tag, 'TestIt', 'stop', testit_prefix, testit_suffix)
+            durations['stop'] = time.time() - start_time
+        # Run extra_commands before executing the main command
+        for command in extra_commands:
+            command(tag)
+        rospy.loginfo("[%s] Executing %s..." % (tag, prefix))
+        start_time = time.time()
+        sut_result = self.instance_execution(tag, prefix, "SUT")
+        durations[prefix + 'SUT'] = time.time() - start_time
+        start_time = time.time()
+        testit_result = self.instance_execution(tag, prefix, "TestIt")
+        durations[prefix + 'TestIt'] = time.time() - start_time
         if sut_result and testit_result:
-            self.pipelines[tag]['state'] = post_states['True']
-            return True
-        self.pipelines[tag]['state'] = post_states['False']
-        return False
+            self.set_pipeline_state(tag, post_states['True'])
+            return (True, durations)
+        self.set_pipeline_state(tag, post_states['False'])
+        return (False, durations)
 
     def multithreaded_command(self, verb, req, prefix, pre_state, post_states, extra_commands=[]):
         rospy.logdebug(verb + " requested")
@@ -294,59 +716,63 @@ class TestItDaemon:
         else:
             pipelines = set(self.tokenize_arguments(req.args))  # Remove duplicates
             rospy.loginfo(verb + "ing " + req.args + "...")
-        matched = False
-        for pipe in rospy.get_param('testit/pipelines', []):
-            if req.args == '' or pipe['tag'] in pipelines:
-                rospy.loginfo("[%s] Setting state to %s" % (pipe['tag'], pre_state))
-                self.pipelines[pipe['tag']]['state'] = pre_state
-                if prefix == "teardown":
-                    # run stop just in case
-                    sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", pipe['tag'])
-                    testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipe['tag'])
-                    self.execute_system(pipe['tag'], 'SUT', 'stop', sut_prefix, sut_suffix)
-                    self.execute_system(pipe['tag'], 'TestIt', 'stop', testit_prefix, testit_suffix)
-                # Run extra_commands before executing the main command
-                for command in extra_commands:
-                    command(pipe['tag'])
-                rospy.loginfo(pipe['tag'] + " " + verb.lower() + "ing...")
-                thread = threading.Thread(target=self.thread_worker, args=(pipe['tag'], prefix, post_states))
-                self.threads[pipe['tag']] = {'thread': thread, 'result': None}
-                thread.start()
-                matched = True
-        if not matched:
+        selected = [pipe['tag'] for pipe in rospy.get_param('testit/pipelines', [])
+                    if pipe['tag'] in self.pipelines and (req.args == '' or pipe['tag'] in pipelines)]
+        if len(selected) == 0:
             rospy.logwarn("Unable to recognize pipeline!")
+            return (True, "")
         result = True
         message = ""
-        while len(self.threads) > 0:
-            for thread in self.threads:
-                if not self.threads[thread]['result'] is None:
-                    msg = '%s finished with %r' % (thread, self.threads[thread]['result'])
-                    rospy.loginfo(msg)
-                    if not self.threads[thread]['result']:
-                        # Report if experienced a failure...
-                        message += msg + "\n"
-                        self.pipelines[thread][prefix] = False
-                        result = False
-                    else:
-                        # Success!
-                        self.pipelines[thread][prefix] = True
-                    del self.threads[thread]
-                    break
-            time.sleep(1.0)
-            rospy.loginfo_throttle(15.0, '...')
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(selected))
+        futures = {}
+        for tag in selected:
+            rospy.loginfo("[%s] Setting state to %s" % (tag, pre_state))
+            self.set_pipeline_state(tag, pre_state)
+            rospy.loginfo(tag + " " + verb.lower() + "ing...")
+            futures[executor.submit(self.thread_worker, tag, prefix, post_states, extra_commands)] = tag
+        for future in concurrent.futures.as_completed(futures):
+            tag = futures[future]
+            try:
+                success, durations = future.result()
+            except Exception as e:
+                rospy.logerr("[%s] %s failed: %s" % (tag, verb, e))
+                self.set_pipeline_state(tag, post_states['False'])
+                success, durations = False, {}
+            msg = '%s finished with %r (%s)' % (tag, success, ", ".join(
+                ["%s %.1f s" % (phase, durations[phase]) for phase in sorted(durations)]))
+            rospy.loginfo(msg)
+            message += msg + "\n"
+            self.pipelines[tag][prefix] = success
+            if not success:
+                result = False
+        executor.shutdown()
         return (result, message)
 
     def remove_bags(self, tag):
         rospy.loginfo("removing bags from tag = %s" % tag)
 
+    def forward_command(self, name, req):
+        """
+        Coordinator: send the command to the workers (nonblocking, the workers report the pipeline states).
+        """
+        workers = self.coordinator.command(name, req.args)
+        if len(workers) == 0:
+            return testit.srv.CommandResponse(False, self.log(True, "No workers connected!", "err"))
+        return testit.srv.CommandResponse(True, self.log(True, "Sent %s to workers %s" % (name, ", ".join(workers))))
+
     def handle_bringup(self, req):
+        if self.coordinator is not None:
+            return self.forward_command("bringup", req)
         result = self.multithreaded_command("Start", req, "bringup", "BRINGUP", {'True': "READY", 'False': "FAILED"})
         return testit.srv.CommandResponse(result[0], result[1])
 
     def handle_teardown(self, req):
         self.testing = False
+        if self.coordinator is not None:
+            return self.forward_command("teardown", req)
         result = self.multithreaded_command("Stop", req, "teardown", "TEARDOWN",
-                                            {'True': "OFFLINE", 'False': "OFFLINE"}, extra_commands=[self.remove_bags])
+                                            {'True': "OFFLINE", 'False': "OFFLINE"},
+                                            extra_commands=[self.remove_bags, self.invalidate_paths])
         return testit.srv.CommandResponse(result[0], result[1])
 
     def handle_status(self, req):
@@ -357,65 +783,71 @@ class TestItDaemon:
             for pipeline in self.pipelines:  # dict
                 message += "[%s] %s\n" % (
                     self.pipelines[pipeline]['tag'], self.pipelines[pipeline].get('state', "OFFLINE"))
+            if self.coordinator is not None:
+                workers = self.coordinator.status()
+                for worker in sorted(workers):
+                    message += "Worker '%s': %s\n" % (worker, ", ".join(workers[worker]))
         except:
             result = False
         return testit.srv.CommandResponse(result, message)
 
-    def acquire_pipeline(self, tag):
-        """
-        Return:
-        pipeline tag
-        """
-        rospy.loginfo("Acquiring pipeline for test \'%s\'" % tag)
-        while True:
-            for pipeline in self.pipelines:
-                if self.pipelines[pipeline].get('state', "OFFLINE") == "READY":
-                    # Check whether test thread pool has a higher priority test queued. If yes, then continue sleeping
-                    priority = self.tests[tag].get('priority', 0)
-                    sleep = False
-                    for thread in self.test_threads:
-                        thread_tag = self.test_threads[thread]['tag']
-                        thread_test_priority = self.tests[thread_tag].get('priority', 0)
-                        queued = self.test_threads[thread].get('queued', False)
-                        if queued and thread_test_priority > priority:
-                            rospy.logwarn(
-                                "Higher priority is queued, continuing to sleep for test scenario '%s'..." % tag)
-                            sleep = True
-                            break
-                    if not sleep:
-                        self.pipelines[pipeline]['state'] = "BUSY"
-                        return pipeline
-            time.sleep(0.2)
-            rospy.logwarn_throttle(30.0, 'Test \'%s\' (priority %s) waiting for a free pipeline...' % (
-                tag, self.tests[tag].get('priority', 0)))
-
-    def single_execute_system(self, pipeline, system, mode, command, i=None):
+    def set_pipeline_state(self, pipeline, state):
+        """
+        Set the pipeline state and notify the scheduler whether the pipeline can accept tests.
+        """
+        self.pipelines[pipeline]['state'] = state
+        self.journal_pipeline(pipeline)
+        self.metrics.track('testit_pipeline_busy_seconds_total', state == "BUSY", {'pipeline': pipeline})
+        if state not in ("READY", "BUSY"):
+            # Bringup and teardown stop the containers
+            self.warm_pipelines.pop(pipeline, None)
+        if state == "READY":
+            self.scheduler.release(pipeline)
+        else:
+            self.scheduler.disable(pipeline)
+
+    def preempt_pipeline(self, tag, pipeline):
+        """
+        Free the pipeline if a higher priority test is queued for it.
+
+        Returns:
+        True if the pipeline was released to a higher priority test
+        """
+        priority = self.config.tests[tag].priority
+        if self.scheduler.higher_priority_waiting(pipeline, priority):
+            rospy.loginfo("Releasing the pipeline to higher priority test...")
+            self.free_pipeline(pipeline)
+            return True
+        rospy.loginfo("Continuing with pipeline %s" % pipeline)
+        return False
+
+    def single_execute_system(self, pipeline, system, mode, command, i=None, prefix="", remote=None):
         rospy.loginfo("[%s] Executing \"%s\"" % (pipeline, command))
-        if command is not None and subprocess.call(command, shell=True) == 0:
-            delay = self.pipelines[pipeline][mode + system + 'Delay'] if i is None or type(
-                self.pipelines[pipeline][mode + system + 'Delay']) != list else \
-                self.pipelines[pipeline][mode + system + 'Delay'][i]
+        labels = {'pipeline': pipeline, 'phase': mode + system}
+        step = self.config.pipelines[pipeline].steps[mode + system]
+        started = time.time()
+        if command is not None and self.call(command, pipeline, mode + system, prefix, remote) == 0:
+            self.metrics.observe('testit_system_step_duration_seconds', time.time() - started,
+                                 dict(labels, step='command'))
+            delay = step.delay(i)
             rospy.loginfo('[%s] Waiting for delay duration (%s)...' % (pipeline, delay))
             time.sleep(delay)
-            start_time = rospy.Time.now()
-            timeout = self.pipelines[pipeline][mode + system + 'Timeout'] if i is None or type(
-                self.pipelines[pipeline][mode + system + 'Timeout']) != list else \
-                self.pipelines[pipeline][mode + system + 'Timeout'][i]
-            trigger = self.pipelines[pipeline][mode + system + 'FinishTrigger'] if i is None or type(
-                self.pipelines[pipeline][mode + system + 'FinishTrigger']) != list else \
-                self.pipelines[pipeline][mode + system + 'FinishTrigger'][i]
-            while self.pipelines[pipeline]['state'] not in ["TEARDOWN", "FAILED", "OFFLINE"] and (
-                    timeout == 0 or (rospy.Time.now() - start_time).to_sec() < timeout):
-                if trigger != '-':
-                    if subprocess.call(trigger, shell=True) == 0:
-                        rospy.loginfo('[%s] Trigger successful!' % pipeline)
-                        return True
-                else:
-                    # No trigger means we do not wait for timeout and break immediately
-                    rospy.loginfo('[%s] Execution finished!' % pipeline)
-                    return True
-                rospy.loginfo_throttle(15.0, '[%s] (%s) ..' % (pipeline, mode))
-                time.sleep(1.0)
+            self.metrics.observe('testit_system_step_duration_seconds', delay, dict(labels, step='delay'))
+            timeout = step.timeout(i)
+            trigger = step.trigger(i)
+            if trigger == '-':
+                # No trigger means we do not wait for timeout and break immediately
+                rospy.loginfo('[%s] Execution finished!' % pipeline)
+                return True
+            rospy.loginfo('[%s] Waiting for trigger (%s)...' % (pipeline, mode))
+            started = time.time()
+            triggered = testit_probes.wait(trigger, timeout, lambda: self.pipelines[pipeline]['state'] in [
+                "TEARDOWN", "FAILED", "OFFLINE"])
+            self.metrics.observe('testit_system_step_duration_seconds', time.time() - started,
+                                 dict(labels, step='trigger'))
+            if triggered:
+                rospy.loginfo('[%s] Trigger successful!' % pipeline)
+                return True
             if self.pipelines[pipeline]['state'] not in ["TEARDOWN", "FAILED", "OFFLINE"]:
                 return True
             rospy.loginfo('[%s] Execution timed out!' % pipeline)
@@ -430,65 +862,48 @@ class TestItDaemon:
         true -- if successful, false otherwise
         """
         rospy.loginfo("[%s] Executing %s to %s..." % (pipeline, system, mode))
+        step = self.config.pipelines[pipeline].steps[mode + system]
         quote_termination = ""
         if type(prefix) == str:
             if prefix != "":
                 quote_termination = "'\\''"
-            command = "/bin/bash -c '" + prefix[:-1] + quote_termination + self.pipelines[pipeline].get(mode + system,
-                                                                                                        None) + suffix[
-                                                                                                                :-1] + quote_termination + "'"
-            return self.single_execute_system(pipeline, system, mode, command)
+            configured_command = step.command()
+            if configured_command is None:
+                return self.single_execute_system(pipeline, system, mode, None)
+            command = "/bin/bash -c '" + prefix[:-1] + quote_termination + configured_command + suffix[
+                                                                                                :-1] + quote_termination + "'"
+            return self.single_execute_system(pipeline, system, mode, command, None, prefix, configured_command)
         else:
             for i in range(len(prefix)):
                 if prefix[i] != "":
                     quote_termination = "'\\''"
-                configured_command = self.pipelines[pipeline].get(mode + system, None)
-                if type(configured_command) == list:
-                    configured_command = configured_command[i]
+                configured_command = step.command(i)
                 command = "/bin/bash -c '" + prefix[i][:-1] + quote_termination + configured_command + suffix[i][
                                                                                                        :-1] + quote_termination + "'"
-                if not self.single_execute_system(pipeline, system, mode, command, i):
+                if not self.single_execute_system(pipeline, system, mode, command, i, prefix[i], configured_command):
                     return False
             return True
 
-    def thread_call(self, tag, command):
+    def thread_call(self, tag, command, pipeline=None, prefix="", remote=None):
         self.call_result[tag] = -1  # -1 means timeout
-        self.call_result[tag] = subprocess.call(command, shell=True)
-        rospy.loginfo("Thread call finished with: " + str(self.call_result[tag]))
-
-    def resolve_configuration_value(self, target_dictionary, pipeline, key, default=None):
-        """
-        Resolve the configuration value based on - use default if missing.
-
-        Returns:
-        The resolved configuration value.
-        """
-        if key in self.pipelines[pipeline]:
-            target_dictionary[key] = self.pipelines[pipeline][key]
-            rospy.loginfo("Resolved '%s' to '%s'" % (key, target_dictionary[key]))
+        if pipeline is None:
+            self.call_result[tag] = subprocess.call(command, shell=True)
         else:
-            if target_dictionary.get(key, None) is None:
-                if default is not None:
-                    target_dictionary[key] = default
-                    rospy.loginfo("Resolved '%s' to default '%s'" % (key, target_dictionary[key]))
-                else:
-                    rospy.logerr("Unable to resolve '%s'" % key)
-                    return None
-        return target_dictionary[key]
+            self.call_result[tag] = self.call(command, pipeline, "docker exec", prefix, remote,
+                                              lambda line: rospy.loginfo("[%s] %s" % (pipeline, line.rstrip())))
+        rospy.loginfo("Thread call finished with: " + str(self.call_result[tag]))
 
-    def delete_bag_files(self, pipeline, test, prefix, suffix):
+    def delete_bag_files(self, pipeline, test, config, prefix, suffix):
         """
         Remove bag files from results.
 
         Returns:
         True if successful (no errors)
         """
-        self.resolve_configuration_value(self.tests[test], pipeline, 'testItVolume')
-        self.resolve_configuration_value(self.tests[test], pipeline, 'resultsDirectory')
-        if self.tests[test]['testItVolume'] is not None:
-            if self.tests[test]['resultsDirectory'] is not None:
+        if config['testItVolume'] is not None:
+            if config['resultsDirectory'] is not None:
                 bags_directory = self.ground_path(
-                    self.tests[test]['testItVolume'] + self.tests[test]['resultsDirectory'], prefix, suffix)
+                    config['testItVolume'] + config['resultsDirectory'], prefix, suffix)
                 # Handle spaces in tag names
                 split_prefix = test.split(" ")
                 if len(split_prefix) > 1:
@@ -501,9 +916,37 @@ class TestItDaemon:
                                                     :-1] + quote_termination + "rm -f " + bags_directory + split_prefix + "*bag" + suffix[
                                                                                                                                    :-1] + quote_termination + "'"
                 rospy.loginfo("Executing '%s'" % delete_command)
-                return True if subprocess.call(delete_command, shell=True) == 0 else False
+                return True if self.call(delete_command, pipeline, "rm bags", prefix,
+                                         "rm -f " + bags_directory + split_prefix + "*bag") == 0 else False
         return False
 
+    def render_test_configuration(self, tag, pipeline):
+        """
+        Render the test configuration for a single run in the pipeline (self.tests is not modified apart from the
+        UUIDs).
+
+        Returns:
+        dict with '[[key]]' values substituted from the test, the run UUIDs and the pipeline configuration, and the
+        settings defined by the pipeline (e.g., 'resultsDirectory') resolved
+        """
+        self.templates_lock.acquire()
+        try:
+            template = self.templates.get(tag, None)
+            if template is None or template.params is not self.tests[tag]:
+                template = testit_template.Template(self.tests[tag])
+                self.templates[tag] = template
+            # Generate scenario UUID if needed
+            if self.tests[tag].get('uuid', None) is None:
+                self.tests[tag]['uuid'] = str(uuid.uuid4())
+                rospy.loginfo("[%s] Generated UUID is '%s'" % (pipeline, self.tests[tag]['uuid']))
+        finally:
+            self.templates_lock.release()
+        # Generate UUID for the test
+        test_uuid = str(uuid.uuid4())
+        self.tests[tag]['testUuid'] = test_uuid
+        rendered = template.render({'uuid': self.tests[tag]['uuid'], 'testUuid': test_uuid}, self.pipelines[pipeline])
+        return self.config.pipelines[pipeline].resolve(rendered)
+
     def get_launch(self, mode, launch):
         launch_suffix = ""
         launch_suffix += " && " if launch != "" and mode in ("explore", "refine-model", "learn", "tron") else ""
@@ -516,112 +959,92 @@ class TestItDaemon:
 
         return launch + launch_suffix
 
-    def execute_in_testit_container(self, pipeline, test, keep_bags, prefix, suffix):
+    def execute_in_testit_container(self, pipeline, test, config, keep_bags, prefix, suffix):
         """
+        Arguments:
+        config -- the rendered test configuration for this run (see render_test_configuration)
+
         Returns:
         True if test successful, False otherwise
         """
-        # Generate scenario UUID if needed
-        if self.tests[test].get('uuid', None) is None:
-            self.tests[test]['uuid'] = str(uuid.uuid4())
-            self.tests = self.substitute_replacement_values(self.tests)
-            rospy.loginfo("[%s] Generated UUID is '%s'" % (pipeline, self.tests[test]['uuid']))
-        # Clear the previous test UUID
-        if self.tests[test].get('testUuid', None) is not None:
-            rospy.logwarn("Clearing old")
-            self.tests = self.substitute_replacement_values(self.tests,
-                                                            auxiliary={self.tests[test]['testUuid']: '[[testUuid]]'},
-                                                            regex='(' + self.tests[test]['testUuid'] + ')',
-                                                            replacement_index=0)
-            rospy.loginfo(self.tests[test])
-        # Generate UUID for the test
-        self.tests[test]['testUuid'] = str(uuid.uuid4())
-        self.tests = self.substitute_replacement_values(self.tests)
         # execute preLaunchCommand, if this returns 0, proceed, if not, fail
-        prelaunch_command = self.tests[test].get('preLaunchCommand', None)
+        prelaunch_command = config.get('preLaunchCommand', None)
         if prelaunch_command is not None:
             rospy.loginfo("[%s] Executing pre-launch command..." % pipeline)
-            quote_termination = "'"
-            if prefix != "":
-                quote_termination = "'\\''"
-            command = prefix + "docker exec " + self.pipelines[pipeline][
-                'testItContainerName'] + " /bin/bash -c " + quote_termination + "source /catkin_ws/devel/setup.bash && " + prelaunch_command + quote_termination + suffix
+            command, argv = self.docker_exec_command(pipeline, prefix, suffix,
+                                                     "source /catkin_ws/devel/setup.bash && " + prelaunch_command)
             rospy.loginfo("Executing '%s'" % command)
-            return_value = subprocess.call(command, shell=True)
+            started = time.time()
+            return_value = self.call(command, pipeline, "docker exec", prefix, argv)
+            self.metrics.observe('testit_phase_duration_seconds', time.time() - started,
+                                 {'scenario': test, 'pipeline': pipeline, 'phase': 'preLaunch'})
             rospy.loginfo("[%s] Pre-launch command returned %s" % (pipeline, return_value))
             if return_value != 0:
                 rospy.logerr("Pre-launch command failed! Test failed!")
                 return False
-        self.resolve_configuration_value(self.tests[test], pipeline, 'sharedDirectory')
-        self.resolve_configuration_value(self.tests[test], pipeline, 'resultsDirectory')
         bag_return = 1
-        bag_enabled = self.tests[test].get('bagEnabled', False)
-        mode = self.tests[test].get('mode', 'test')
+        bag_enabled = config.get('bagEnabled', False)
+        mode = config.get('mode', 'test')
         if bag_enabled:
             # Delete old rosbags if present
-            if not self.delete_bag_files(pipeline, test, prefix, suffix):
+            if not self.delete_bag_files(pipeline, test, config, prefix, suffix):
                 rospy.logwarn("[%s] Rosbag deletion failed!" % pipeline)
 
             rospy.loginfo("[%s] Start rosbag recording..." % pipeline)
-            max_splits = self.tests[test].get('bagMaxSplits', None)
+            max_splits = config.get('bagMaxSplits', None)
             if max_splits is None:
                 rospy.logwarn("[%s] bagMaxSplits is not defined, defaulting to 2" % pipeline)
                 max_splits = 2
-            duration = self.tests[test].get('bagDuration', None)
+            duration = config.get('bagDuration', None)
             if duration is None:
                 rospy.logwarn("[%s] bagDuration is not defined, defaulting to 30" % pipeline)
                 duration = 30
-            topic_regex = self.tests[test].get('bagTopicRegex', None)
+            topic_regex = config.get('bagTopicRegex', None)
             if topic_regex is None:
                 rospy.logwarn("[%s] bagTopicRegex is not defined, defaulting to 'all'" % pipeline)
                 topic_regex = ""
             topics = "-a "
             if topic_regex != "":
                 topics = "--regex \"" + str(topic_regex) + "\" "
-            topic_exclude = self.tests[test].get('bagTopicExcludeRegex', None)
+            topic_exclude = config.get('bagTopicExcludeRegex', None)
             if topic_exclude is None:
                 rospy.logwarn("[%s] bagTopicExcludeRegex is not defined, defaulting to ''" % pipeline)
                 topic_exclude = ""
             exclude = ""
             if topic_exclude != "":
                 exclude = "--exclude \"" + str(topic_exclude) + "\" "
-            quote_termination = "'"
-            if prefix != "":
-                quote_termination = "'\\''"
-            command = prefix + "docker exec -d " + self.pipelines[pipeline][
-                'testItContainerName'] + " /bin/bash -c " + quote_termination + "source /catkin_ws/devel/setup.bash && mkdir -p " + str(
-                self.tests[test]['sharedDirectory']) + str(self.tests[test]['resultsDirectory']) + " && cd " + str(
-                self.tests[test]['sharedDirectory']) + str(
-                self.tests[test]['resultsDirectory']) + " && rosbag record --split --max-splits=" + str(
-                max_splits) + " --duration=" + str(
-                duration) + " -O \"" + test + "\" " + exclude + topics + "__name:=testit_rosbag_recorder" + quote_termination + suffix
+            command, argv = self.docker_exec_command(
+                pipeline, prefix, suffix, "source /catkin_ws/devel/setup.bash && mkdir -p " + str(
+                    config['sharedDirectory']) + str(config['resultsDirectory']) + " && cd " + str(
+                    config['sharedDirectory']) + str(
+                    config['resultsDirectory']) + " && rosbag record --split --max-splits=" + str(
+                    max_splits) + " --duration=" + str(
+                    duration) + " -O \"" + test + "\" " + exclude + topics + "__name:=testit_rosbag_recorder", ['-d'])
             rospy.loginfo("Executing '%s'" % command)
-            bag_return = subprocess.call(command, shell=True)
+            bag_return = self.call(command, pipeline, "docker exec", prefix, argv)
             rospy.loginfo("[%s] rosbag record returned %s" % (pipeline, bag_return))
         # Run logger
-        if self.tests[test].get('loggerConfiguration', None) is not None:
+        if config.get('loggerConfiguration', None) is not None:
             rospy.loginfo("Starting logger...")
-            quote_termination = "'"
-            if prefix != "":
-                quote_termination = "'\\''"
-            command = prefix + "docker exec -d " + self.pipelines[pipeline][
-                'testItContainerName'] + " /bin/bash -c " + quote_termination + "source /catkin_ws/devel/setup.bash && mkdir -p " + str(
-                self.tests[test]['sharedDirectory']) + str(self.tests[test]['resultsDirectory']) + " && cd " + str(
-                self.tests[test]['sharedDirectory']) + str(
-                self.tests[test]['resultsDirectory']) + " && rosrun testit testit_logger.py _config:=" + str(
-                self.tests[test]['sharedDirectory']) + str(self.tests[test]['loggerConfiguration']) + " _test:=\"" + \
-                      self.tests[test]['tag'].replace(" ", "\\ ") + "\" _log:=" + str(
-                self.tests[test]['sharedDirectory']) + str(
-                self.tests[test]['resultsDirectory']) + "logger.log" + quote_termination + suffix
+            command, argv = self.docker_exec_command(
+                pipeline, prefix, suffix, "source /catkin_ws/devel/setup.bash && mkdir -p " + str(
+                    config['sharedDirectory']) + str(config['resultsDirectory']) + " && cd " + str(
+                    config['sharedDirectory']) + str(
+                    config['resultsDirectory']) + " && rosrun testit testit_logger.py _config:=" + str(
+                    config['sharedDirectory']) + str(config['loggerConfiguration']) + " _test:=\"" + \
+                config['tag'].replace(" ", "\\ ") + "\" _log:=" + str(
+                    config['sharedDirectory']) + str(
+                    config['resultsDirectory']) + "logger.log", ['-d'])
             rospy.loginfo("Executing '%s'" % command)
-            logger_return = subprocess.call(command, shell=True)
+            chown_command, chown_argv = self.docker_exec_command(
+                pipeline, prefix, suffix, "chown -R " + self.ground_path("$(id -u)", prefix, suffix) + ":" +
+                self.ground_path("$(id -g)", prefix, suffix) + " " + str(config['sharedDirectory']) + str(
+                    config['resultsDirectory']), ['-d'])
+            # Start the logger and set the privileges in one round trip
+            logger_return, chown_return = self.call_batch(pipeline, prefix, [
+                (command, "docker exec", argv), (chown_command, "docker exec", chown_argv)])
             rospy.loginfo("[%s] logger returned %s" % (pipeline, logger_return))
-            rospy.loginfo("[%s] Setting privileges..." % pipeline)
-            subprocess.call(prefix + "docker exec -d " + self.pipelines[pipeline][
-                'testItContainerName'] + " /bin/bash -c \"chown -R " + self.ground_path("$(id -u)", prefix,
-                                                                                        suffix) + ":" + self.ground_path(
-                "$(id -g)", prefix, suffix) + " " + str(self.tests[test]['sharedDirectory']) + str(
-                self.tests[test]['resultsDirectory']) + "\"" + suffix, shell=True)
+            rospy.loginfo("[%s] Setting privileges returned %s" % (pipeline, chown_return))
         else:
             rospy.loginfo("Logger not configured ('loggerConfiguration'), skipping logger start!")
             if mode in ("explore", "refine-model", "learn"):
@@ -630,44 +1053,44 @@ class TestItDaemon:
 
         # launch test in TestIt docker in new thread (if oracle specified, run in detached mode)
         detached = ""
-        self.resolve_configuration_value(self.tests[test], pipeline, 'verbose', False)
-        if self.tests[test]['oracle'] != "" and not self.tests[test]['verbose']:
+        if config['oracle'] != "" and not config['verbose']:
             # run in detached
             detached = "-d "
         rospy.loginfo("[%s] Launching %s \'%s\'" % (pipeline, mode, test))
-        rospy.loginfo("[%s] Launch parameter is \'%s\'" % (pipeline, self.tests[test]['launch']))
-        launch = self.tests[test].get('launch', "")
+        rospy.loginfo("[%s] Launch parameter is \'%s\'" % (pipeline, config['launch']))
+        launch = config.get('launch', "")
         finished_publisher = rospy.Publisher('/testit/finished/%s' % test, Bool, queue_size=1)
         start_time = rospy.Time.now()
         if launch != "" or mode in ('learn', 'explore', 'refine-model'):
-            quote_termination = "'"
-            if prefix != "":
-                quote_termination = "'\\''"
-            launch = self.tests[test].get('launch', '')
+            launch = config.get('launch', '')
             launch = self.get_launch(mode, launch)
             source = "source /catkin_ws/devel/setup.bash"
             source += " &&" if launch.strip() != "" else ""
-            thread_command = prefix + "docker exec " + detached + self.pipelines[pipeline][
-                'testItContainerName'] + " stdbuf -i0 -o0 -e0 /bin/bash -c " + quote_termination + source + launch + quote_termination + suffix
+            thread_command, argv = self.docker_exec_command(pipeline, prefix, suffix, source + launch,
+                                                            detached.split(), ['stdbuf', '-i0', '-o0', '-e0'])
             rospy.loginfo("[%s] Launch command is '%s'" % (pipeline, thread_command))
             thread = threading.Thread(target=self.thread_call,
-                                      args=('launch' + str(threading.current_thread().ident), thread_command))
+                                      args=('launch' + str(threading.current_thread().ident), thread_command,
+                                            pipeline, prefix, argv))
+            launch_started = time.time()
             thread.start()
-            if not self.tests[test]['verbose'] or self.tests[test][
+            if not config['verbose'] or config[
                 'oracle'] == "":  # join only if not verbose or no oracle
                 rospy.loginfo("Joining thread")
-                thread.join(self.tests[test]['timeout'])
+                thread.join(config['timeout'])
+            self.metrics.observe('testit_phase_duration_seconds', time.time() - launch_started,
+                                 {'scenario': test, 'pipeline': pipeline, 'phase': 'launch'})
         return_value = False
         rospy.loginfo("Returned from thread with call_result: " + str(
             self.call_result['launch' + str(threading.current_thread().ident)]))
         if (launch == "" or self.call_result['launch' + str(threading.current_thread().ident)] == 0 or detached == "" or
-            self.tests[test]['verbose']) and not mode == 'refine-model':
+            config['verbose']) and not mode == 'refine-model':
             # command returned success or in verbose mode (run oracle in parallel)
             rospy.loginfo("[%s] %s PASS!" % (pipeline, mode.upper()))
             return_value = True
         elif self.call_result['launch' + str(threading.current_thread().ident)] == -1:
-            rospy.logwarn("[%s] %s TIMEOUT (%s)!" % (pipeline, mode.upper(), self.tests[test]['timeoutVerdict']))
-            if self.tests[test]['timeoutVerdict']:
+            rospy.logwarn("[%s] %s TIMEOUT (%s)!" % (pipeline, mode.upper(), config['timeoutVerdict']))
+            if config['timeoutVerdict']:
                 return_value = True
         else:
             rospy.logerr("[%s] %s FAIL!" % (pipeline, mode.upper()))
@@ -704,231 +1127,516 @@ class TestItDaemon:
             return prefixes, suffixes
         return connection, suffix
 
-    def learn_thread_worker(self, tag, pipeline=None):
-        rospy.loginfo("Learn thread worker: " + tag)
-        if pipeline is None:
-            # TODO if specific pipeline is specified for a test, acquire that specific pipeline
-            rospy.loginfo("Waiting for main thread")
-            while self.test_threads.get(threading.current_thread().ident, 0) == 0:
-                time.sleep(0.01)  # Wait until main thread has created the thread entry in the dictionary
-            rospy.loginfo("Done waiting for main thread")
-
-            self.test_threads[threading.current_thread().ident]['queued'] = True
-            pipeline = self.acquire_pipeline(tag)  # find a free pipeline (blocking)
-            self.test_threads[threading.current_thread().ident]['queued'] = False
-            rospy.loginfo("Acquired pipeline '%s' for test '%s'" % (pipeline, tag))
-        else:
-            # We have to free the pipeline if higher priority tasks are waiting in test_thread pool
-            highest_queued_priority = None
-            for thread in self.test_threads:
-                test = self.test_threads[thread]['tag']
-                priority = self.tests[test].get('priority', 0)
-                queued = self.test_threads[thread].get('queued', False)
-                requested_pipeline = self.tests[test].get('pipeline', "")
-                if test != tag and queued and (highest_queued_priority is None or priority > highest_queued_priority):
-                    # TODO consider wildcards for pipeline
-                    if requested_pipeline == "" or pipeline == requested_pipeline:
-                        highest_queued_priority = priority
-            rospy.loginfo("Highest queued priority is %s" % highest_queued_priority)
-            priority = self.tests[tag].get('priority', 0)
-            if highest_queued_priority is not None and highest_queued_priority > priority:
-                rospy.loginfo("Releasing the pipeline to higher priority test...")
-                self.free_pipeline(pipeline)
-                rospy.loginfo("Pipeline freed!")
-                rospy.loginfo("Add to queue again in 5 sec...")
-                time.sleep(5.0)
-                self.tests[tag]['reserved_credits'] -= 1
-                rospy.loginfo("Adding to queue...")
-                # FIXME this will raise recursion limit exceeded if the project has scenarios with large number of credits or complex priority/queuing!
-                self.learn_thread_worker(tag)
+    def queue_lane(self, tag, worker, args=()):
+        """
+        Queue an execution lane in the scheduler (nonblocking).
+
+        The worker is submitted to the executor once the scheduler has assigned a pipeline to the lane.
+        """
+        queued = time.time()
+        self.scheduler.submit(tag, self.config.tests[tag].priority, self.config.tests[tag].pipeline,
+                              lambda pipeline: self.submit_lane(tag, worker, args, pipeline, queued))
+
+    def submit_lane(self, tag, worker, args, pipeline, queued=None):
+        self.pipelines[pipeline]['state'] = "BUSY"
+        self.journal_pipeline(pipeline)
+        self.metrics.track('testit_pipeline_busy_seconds_total', True, {'pipeline': pipeline})
+        if queued is not None:
+            self.metrics.observe('testit_phase_duration_seconds', time.time() - queued,
+                                 {'scenario': tag, 'pipeline': pipeline, 'phase': 'queueWait'})
+        rospy.loginfo("Acquired pipeline '%s' for test '%s'" % (pipeline, tag))
+        future = self.executor.submit(worker, tag, pipeline, *args)
+        future.add_done_callback(lambda f: self.lane_done(tag, pipeline, f))
+
+    def lane_done(self, tag, pipeline, future):
+        """
+        Completion callback for lane workers.
+
+        Workers return True if the lane is finished, False if the lane was queued again.
+        """
+        try:
+            if not future.result():
                 return
+        except Exception as e:
+            rospy.logerr("[%s] Test '%s' worker failed: %s" % (pipeline, tag, e))
+            self.free_pipeline(pipeline)
+        self.lanes_condition.acquire()
+        try:
+            self.lanes[tag] -= 1
+            if self.lanes[tag] <= 0:
+                self.tests[tag]['executing'] = False
+            if all(lanes <= 0 for lanes in self.lanes.values()):
+                self.testing = False
+            self.lanes_condition.notify_all()
+        finally:
+            self.lanes_condition.release()
+        self.journal_test(tag)
+        if not self.testing:
+            self.write_metrics()
+
+    def start_lanes(self, tag, worker, args=()):
+        """
+        Start as many execution lanes for the test as 'concurrency' allows.
+        """
+        concurrency = self.config.tests[tag].concurrency
+        lanes = len(self.pipelines) if concurrency == 0 else min(concurrency, len(self.pipelines))
+        self.tests[tag]['worker'] = (worker.__name__, args)
+        self.lanes_condition.acquire()
+        try:
+            self.lanes[tag] = lanes
+            if lanes > 0:
+                self.testing = True
             else:
-                rospy.loginfo("Continuing with pipeline %s" % pipeline)
+                self.tests[tag]['executing'] = False
+        finally:
+            self.lanes_condition.release()
+        self.journal_test(tag)
+        for _ in range(lanes):
+            self.queue_lane(tag, worker, args)
+
+    def wait_for_tests(self, tags):
+        """
+        Block until none of the tests are executing.
+        """
+        self.lanes_condition.acquire()
+        try:
+            while any(self.tests[tag].get('executing', False) for tag in tags):
+                self.lanes_condition.wait(1.0)
+        finally:
+            self.lanes_condition.release()
+
+    def learn_thread_worker(self, tag, pipeline):
+        """
+        Returns:
+        True if finished, False if the pipeline was released and the learning was queued again
+        """
+        rospy.loginfo("Learn thread worker: " + tag)
+        if self.coordinator is not None:
+            rospy.logerr("Learning is not supported by the coordinator, run it in a worker daemon!")
+            self.free_pipeline(pipeline)
+            return True
+        # We have to free the pipeline if higher priority tasks are waiting in the scheduler queue
+        if self.preempt_pipeline(tag, pipeline):
+            rospy.loginfo("Adding to queue...")
+            self.queue_lane(tag, self.learn_thread_worker)
+            return False
         rospy.set_param('testit/pipeline', self.pipelines[pipeline])
-        self.tests = self.substitute_replacement_values(self.tests, self.pipelines[pipeline])
+        config = self.render_test_configuration(tag, pipeline)
         testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+        timings = {}
 
         rospy.loginfo("[%s] Running TestIt..." % pipeline)
-        if self.execute_system(pipeline, 'TestIt', 'run', testit_prefix, testit_suffix):
+        if self.timed(timings, 'runTestIt', self.execute_system, pipeline, 'TestIt', 'run', testit_prefix,
+                      testit_suffix):
             rospy.loginfo("[%s] Executing learn in TestIt container..." % pipeline)
-            self.tests[tag]['test_start_timestamp'] = rospy.Time.now()
-            self.tests[tag]['result'] = self.execute_in_testit_container(pipeline, tag, False, testit_prefix,
-                                                                         testit_suffix)
+            start = rospy.Time.now()
+            self.tests[tag]['test_start_timestamp'] = start
+            verdict = self.timed(timings, 'test', self.execute_in_testit_container, pipeline, tag, config, False,
+                                 testit_prefix, testit_suffix)
+            self.tests[tag]['result'] = verdict
             self.tests[tag]['test_end_timestamp'] = rospy.Time.now()
             self.tests[tag]['executor_pipeline'] = pipeline
             # stopTestIt
             rospy.loginfo("[%s] Stopping TestIt container..." % pipeline)
-            self.execute_system(pipeline, 'TestIt', 'stop', testit_prefix, testit_suffix)
+            self.timed(timings, 'stopTestIt', self.execute_system, pipeline, 'TestIt', 'stop', testit_prefix,
+                       testit_suffix)
+            self.record_run(tag, pipeline, config, start, self.tests[tag]['test_end_timestamp'], verdict, timings)
         else:
             # unable to run TestIt
             rospy.logerr("[%s] Unable to run TestIt!" % pipeline)
+            self.observe_timings(tag, pipeline, timings)
             rospy.sleep(1.0)
+        self.free_pipeline(pipeline)
+        return True
+
+    def claim_credits(self, tag):
+        """
+        Reserve the next batch of credits of the test for an execution lane.
+
+        A batch is at most 'creditBatch' credits and at most an even share of the unreserved credits between the lanes
+        of the test.
 
-    def test_thread_worker(self, tag, keep_bags=False, pipeline=None):
+        Returns:
+        number of credits reserved (0 if no unreserved credits are left)
+        """
+        self.credits_lock.acquire()
+        try:
+            self.tests[tag]['credits'] = self.tests[tag].get('credits', 0)
+            self.tests[tag]['reserved_credits'] = self.tests[tag].get('reserved_credits', 0)
+            available = self.tests[tag]['credits'] - self.tests[tag]['reserved_credits']
+            if available <= 0:
+                return 0
+            lanes = max(1, self.lanes.get(tag, 1))
+            batch = min(available, max(1, int(self.config.tests[tag].creditBatch)), -(-available // lanes))
+            self.tests[tag]['reserved_credits'] += batch
+            return batch
+        finally:
+            self.credits_lock.release()
+
+    def release_credits(self, tag, count):
         """
+        Return 'count' unused reserved credits of the test.
+        """
+        if count <= 0:
+            return
+        self.credits_lock.acquire()
+        try:
+            self.tests[tag]['reserved_credits'] -= count
+        finally:
+            self.credits_lock.release()
+
+    def test_thread_worker(self, tag, pipeline, keep_bags=False):
+        """
+        Execute credits of the test while holding the pipeline (lease).
+
+        Credits are claimed in batches (see claim_credits) and executed one after another without releasing the
+        pipeline (in warmPipeline mode the SUT and TestIt are also kept running). The pipeline is only released when
+        no credits are left or when a higher priority test is waiting for it.
+
         Arguments:
             tag -- test tag (string)
+            pipeline -- pipeline tag assigned by the scheduler
+
+        Returns:
+        True if the lane is finished, False if the pipeline was released and the test was queued again
         """
-        self.tests[tag]['reserved_credits'] = self.tests[tag].get('reserved_credits', 0)
-        # check whether credits > 0, or return
-        self.tests[tag]['credits'] = self.tests[tag].get('credits', 0)
-        rospy.loginfo("Test '%s' has %s credit(s)." % (tag, self.tests[tag]['credits']))
-        if self.tests[tag]['credits'] - self.tests[tag]['reserved_credits'] <= 0:
-            rospy.loginfo("Test '%s' has no credits! Test not executed!" % tag)
-            self.test_threads[threading.current_thread().ident]['result'] = False
-            if pipeline is not None:
-                self.free_pipeline(pipeline)
-            return
-        self.tests[tag]['reserved_credits'] += 1
-        if pipeline is None:
-            # TODO if specific pipeline is specified for a test, acquire that specific pipeline
-            while self.test_threads.get(threading.current_thread().ident, 0) == 0:
-                time.sleep(0.01)  # Wait until main thread has created the thread entry in the dictionary
-            self.test_threads[threading.current_thread().ident]['queued'] = True
-            pipeline = self.acquire_pipeline(tag)  # find a free pipeline (blocking)
-            self.test_threads[threading.current_thread().ident]['queued'] = False
-            rospy.loginfo("Acquired pipeline '%s' for test '%s'" % (pipeline, tag))
-        else:
-            # We have to free the pipeline if higher priority tasks are waiting in test_thread pool
-            highest_queued_priority = None
-            for thread in self.test_threads:
-                test = self.test_threads[thread]['tag']
-                priority = self.tests[test].get('priority', 0)
-                queued = self.test_threads[thread].get('queued', False)
-                requested_pipeline = self.tests[test].get('pipeline', "")
-                if test != tag and queued and (highest_queued_priority is None or priority > highest_queued_priority):
-                    # TODO consider wildcards for pipeline
-                    if requested_pipeline == "" or pipeline == requested_pipeline:
-                        highest_queued_priority = priority
-            rospy.loginfo("Highest queued priority is %s" % highest_queued_priority)
-            priority = self.tests[tag].get('priority', 0)
-            if highest_queued_priority is not None and highest_queued_priority > priority:
-                rospy.loginfo("Releasing the pipeline to higher priority test...")
-                self.free_pipeline(pipeline)
-                rospy.loginfo("Pipeline freed!")
-                rospy.loginfo("Add to queue again in 5 sec...")
-                time.sleep(5.0)
-                self.tests[tag]['reserved_credits'] -= 1
-                rospy.loginfo("Adding to queue...")
-                # FIXME this will raise recursion limit exceeded if the project has scenarios with large number of credits or complex priority/queuing!
-                self.test_thread_worker(tag, keep_bags)
-                return
-            else:
-                rospy.loginfo("Continuing with pipeline %s" % pipeline)
-        rospy.set_param('testit/pipeline', self.pipelines[pipeline])
-        self.tests = self.substitute_replacement_values(self.tests, self.pipelines[pipeline])
-        # runSUT
-        rospy.loginfo("[%s] Running SUT..." % pipeline)
+        if self.coordinator is None:
+            rospy.set_param('testit/pipeline', self.pipelines[pipeline])
         sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", pipeline)
         testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
-        if self.execute_system(pipeline, 'SUT', 'run', sut_prefix, sut_suffix):
-            # runTestIt
-            rospy.loginfo("[%s] Running TestIt..." % pipeline)
-            if self.execute_system(pipeline, 'TestIt', 'run', testit_prefix, testit_suffix):
-                rospy.loginfo("[%s] Executing tests in TestIt container..." % pipeline)
-                self.tests[tag]['test_start_timestamp'] = rospy.Time.now()
-                self.tests[tag]['credits'] -= 1
-                self.tests[tag]['result'] = self.execute_in_testit_container(pipeline, tag, keep_bags, testit_prefix,
-                                                                             testit_suffix)
-                self.tests[tag]['test_end_timestamp'] = rospy.Time.now()
-                self.tests[tag]['executor_pipeline'] = pipeline
-                # execute postTest commands
-                self.resolve_configuration_value(self.tests[tag], pipeline, 'postTestCommand', "")
-                self.resolve_configuration_value(self.tests[tag], pipeline, 'postTestSuccessCommand', "")
-                self.resolve_configuration_value(self.tests[tag], pipeline, 'postTestFailureCommand', "")
-                if self.tests[tag]['result']:
-                    if self.tests[tag]['postTestSuccessCommand'] != "":
-                        rospy.loginfo(
-                            "Executing post-test success command ('%s')..." % self.tests[tag]['postTestSuccessCommand'])
-                        result = subprocess.call(self.tests[tag]['postTestSuccessCommand'], shell=True)
-                        if result != 0:
-                            rospy.logerr("Post-success command failed!")
+        claimed = 0
+        executed = 0
+        try:
+            while True:
+                if claimed == 0:
+                    claimed = self.claim_credits(tag)
+                    if claimed == 0:
+                        if executed == 0:
+                            rospy.loginfo("Test '%s' has no credits! Test not executed!" % tag)
+                        self.free_pipeline(pipeline)
+                        return True
+                    rospy.loginfo("Test '%s' has %s credit(s), claimed %s." % (tag, self.tests[tag]['credits'],
+                                                                                claimed))
+                # We have to free the pipeline if higher priority tasks are waiting in the scheduler queue
+                if self.preempt_pipeline(tag, pipeline):
+                    # Unused credits are returned first, so that the queued lane can claim them again
+                    self.release_credits(tag, claimed)
+                    claimed = 0
+                    rospy.loginfo("Adding to queue...")
+                    self.queue_lane(tag, self.test_thread_worker, (keep_bags,))
+                    return False
+                # The reservation of the credit is handed over to the execution (consumed with the credit or returned)
+                claimed -= 1
+                if self.coordinator is not None:
+                    self.execute_remote_credit(tag, pipeline, keep_bags)
                 else:
-                    if self.tests[tag]['postTestFailureCommand'] != "":
-                        rospy.loginfo(
-                            "Executing post-test failure command ('%s')..." % self.tests[tag]['postTestFailureCommand'])
-                        result = subprocess.call(self.tests[tag]['postTestFailureCommand'], shell=True)
-                        if result != 0:
-                            rospy.logerr("Post-test failure command failed!")
-                if self.tests[tag]['postTestCommand'] != "":
-                    rospy.loginfo("Executing post-test command ('%s')..." % self.tests[tag]['postTestCommand'])
-                    result = subprocess.call(self.tests[tag]['postTestCommand'], shell=True)
-                    if result != 0:
-                        rospy.logerr("Post-test command failed!")
-
-                # execute the post commands if credits are zero
-                if self.tests[tag]['credits'] == 0:
-                    self.resolve_configuration_value(self.tests[tag], pipeline, 'postCommand', "")
-                    self.resolve_configuration_value(self.tests[tag], pipeline, 'postSuccessCommand', "")
-                    self.resolve_configuration_value(self.tests[tag], pipeline, 'postFailureCommand', "")
-                    if self.tests[tag]['result']:
-                        if self.tests[tag]['postSuccessCommand'] != "":
-                            rospy.loginfo("Executing post-testing success command ('%s')..." % self.tests[tag][
-                                'postSuccessCommand'])
-                            result = subprocess.call(self.tests[tag]['postSuccessCommand'], shell=True)
+                    self.execute_credit(tag, pipeline, keep_bags, sut_prefix, sut_suffix, testit_prefix,
+                                        testit_suffix, True)
+                executed += 1
+                if self.pipelines[pipeline]['state'] != "BUSY":
+                    # The pipeline was lost (e.g., teardown or a lost worker)
+                    self.release_credits(tag, claimed)
+                    claimed = 0
+                    rospy.logwarn("[%s] Pipeline is %s, adding '%s' to queue..." % (
+                        pipeline, self.pipelines[pipeline]['state'], tag))
+                    self.queue_lane(tag, self.test_thread_worker, (keep_bags,))
+                    return False
+                if self.tests[tag]['credits'] > 0:
+                    rospy.loginfo("Test '%s' has %s credits remaining! Continuing..." % (tag,
+                                                                                       self.tests[tag]['credits']))
+        finally:
+            self.release_credits(tag, claimed)
+
+    def execute_remote_credit(self, tag, pipeline, keep_bags):
+        """
+        Coordinator: execute a single run of the test by the worker that owns the pipeline and record the outcome.
+
+        The credit must have been reserved (see claim_credits), the reservation is consumed with the credit or
+        returned if the run was not executed.
+        """
+        consumed = False
+        try:
+            if self.tests[tag].get('uuid', None) is None:
+                self.tests[tag]['uuid'] = str(uuid.uuid4())
+            outcome = self.coordinator.execute(pipeline, {'tag': tag, 'keepBags': keep_bags,
+                                                          'credits': self.tests[tag]['credits'],
+                                                          'uuid': self.tests[tag]['uuid']})
+            if outcome is None:
+                rospy.logerr("[%s] Run of '%s' was lost!" % (pipeline, tag))
+                return
+            if not outcome['executed']:
+                self.observe_timings(tag, pipeline, outcome['timings'])
+                return
+            self.credits_lock.acquire()
+            try:
+                self.tests[tag]['credits'] -= 1
+                self.tests[tag]['reserved_credits'] -= 1
+                consumed = True
+            finally:
+                self.credits_lock.release()
+        finally:
+            if not consumed:
+                self.release_credits(tag, 1)
+        start = rospy.Time.from_sec(outcome['start'])
+        end = rospy.Time.from_sec(outcome['end'])
+        self.tests[tag]['result'] = outcome['verdict']
+        self.tests[tag]['test_start_timestamp'] = start
+        self.tests[tag]['test_end_timestamp'] = end
+        self.tests[tag]['executor_pipeline'] = pipeline
+        self.tests[tag]['testUuid'] = outcome['testUuid']
+        self.journal_test(tag)
+        self.record_run(tag, pipeline, outcome, start, end, outcome['verdict'], outcome['timings'],
+                        outcome['artifacts'])
+
+    def execute_credit(self, tag, pipeline, keep_bags, sut_prefix, sut_suffix, testit_prefix, testit_suffix,
+                       reserved=False):
+        """
+        Execute a single run of the test in the pipeline (the credit is consumed once the test is started).
+
+        Arguments:
+        reserved -- True if the credit was reserved (see claim_credits), the reservation is consumed with the credit
+                    or returned if the test was not started
+
+        Returns:
+        outcome dict: 'executed' (True if the test was started), 'timings' and for executed runs 'verdict',
+        'start', 'end' (seconds), 'artifacts', 'mode', 'uuid' and 'testUuid'
+        """
+        config = self.render_test_configuration(tag, pipeline)
+        # runSUT
+        rospy.loginfo("[%s] Running SUT..." % pipeline)
+        timings = {}
+        start = None
+        warm = pipeline in self.warm_pipelines
+        keep_warm = False
+        counted = False
+        try:
+            if warm and not self.reset_systems(pipeline, timings, sut_prefix, sut_suffix, testit_prefix, testit_suffix):
+                rospy.logwarn("[%s] Reset failed, restarting SUT and TestIt..." % pipeline)
+                self.stop_warm_systems(pipeline)
+                warm = False
+            if warm or self.timed(timings, 'runSUT', self.execute_system, pipeline, 'SUT', 'run', sut_prefix,
+                                  sut_suffix):
+                # runTestIt
+                rospy.loginfo("[%s] Running TestIt..." % pipeline)
+                if warm or self.timed(timings, 'runTestIt', self.execute_system, pipeline, 'TestIt', 'run',
+                                      testit_prefix, testit_suffix):
+                    rospy.loginfo("[%s] Executing tests in TestIt container..." % pipeline)
+                    start = rospy.Time.now()
+                    self.tests[tag]['test_start_timestamp'] = start
+                    self.credits_lock.acquire()
+                    try:
+                        self.tests[tag]['credits'] -= 1
+                        if reserved:
+                            self.tests[tag]['reserved_credits'] -= 1
+                        # A credit of a run interrupted by a daemon crash is returned on recovery
+                        self.tests[tag]['running'] = self.tests[tag].get('running', 0) + 1
+                        counted = True
+                    finally:
+                        self.credits_lock.release()
+                    self.journal_test(tag)
+                    verdict = self.timed(timings, 'test', self.execute_in_testit_container, pipeline, tag, config,
+                                         keep_bags, testit_prefix, testit_suffix)
+                    self.tests[tag]['result'] = verdict
+                    end = rospy.Time.now()
+                    self.tests[tag]['test_end_timestamp'] = end
+                    self.tests[tag]['executor_pipeline'] = pipeline
+                    post_test_started = time.time()
+                    # execute postTest commands
+                    if verdict:
+                        if config['postTestSuccessCommand'] != "":
+                            rospy.loginfo(
+                                "Executing post-test success command ('%s')..." % config['postTestSuccessCommand'])
+                            result = subprocess.call(config['postTestSuccessCommand'], shell=True)
                             if result != 0:
-                                rospy.logerr("Post-testing success command failed!")
+                                rospy.logerr("Post-success command failed!")
                     else:
-                        if self.tests[tag]['postFailureCommand'] != "":
-                            rospy.loginfo("Executing post-testing failure command ('%s')..." % self.tests[tag][
-                                'postFailureCommand'])
-                            result = subprocess.call(self.tests[tag]['postFailureCommand'], shell=True)
+                        if config['postTestFailureCommand'] != "":
+                            rospy.loginfo(
+                                "Executing post-test failure command ('%s')..." % config['postTestFailureCommand'])
+                            result = subprocess.call(config['postTestFailureCommand'], shell=True)
                             if result != 0:
-                                rospy.logerr("Post-failure command failed!")
-                    if self.tests[tag]['postCommand'] != "":
-                        rospy.loginfo("Executing post-testing command ('%s')..." % self.tests[tag]['postCommand'])
-                        result = subprocess.call(self.tests[tag]['postCommand'], shell=True)
+                                rospy.logerr("Post-test failure command failed!")
+                    if config['postTestCommand'] != "":
+                        rospy.loginfo("Executing post-test command ('%s')..." % config['postTestCommand'])
+                        result = subprocess.call(config['postTestCommand'], shell=True)
                         if result != 0:
                             rospy.logerr("Post-test command failed!")
-                    self.test_threads[threading.current_thread().ident]['result'] = self.tests[tag]['result']
-                # stopTestIt
-                rospy.loginfo("[%s] Stopping TestIt container..." % pipeline)
-                self.execute_system(pipeline, 'TestIt', 'stop', testit_prefix, testit_suffix)
+                    timings['postTest'] = time.time() - post_test_started
+
+                    # execute the post commands if credits are zero
+                    if self.tests[tag]['credits'] == 0:
+                        if verdict:
+                            if config['postSuccessCommand'] != "":
+                                rospy.loginfo("Executing post-testing success command ('%s')..." % config[
+                                    'postSuccessCommand'])
+                                result = subprocess.call(config['postSuccessCommand'], shell=True)
+                                if result != 0:
+                                    rospy.logerr("Post-testing success command failed!")
+                        else:
+                            if config['postFailureCommand'] != "":
+                                rospy.loginfo("Executing post-testing failure command ('%s')..." % config[
+                                    'postFailureCommand'])
+                                result = subprocess.call(config['postFailureCommand'], shell=True)
+                                if result != 0:
+                                    rospy.logerr("Post-failure command failed!")
+                        if config['postCommand'] != "":
+                            rospy.loginfo("Executing post-testing command ('%s')..." % config['postCommand'])
+                            result = subprocess.call(config['postCommand'], shell=True)
+                            if result != 0:
+                                rospy.logerr("Post-test command failed!")
+                    keep_warm = self.keep_warm(tag, pipeline, verdict)
+                    if not keep_warm:
+                        # stopTestIt
+                        rospy.loginfo("[%s] Stopping TestIt container..." % pipeline)
+                        self.timed(timings, 'stopTestIt', self.execute_system, pipeline, 'TestIt', 'stop',
+                                   testit_prefix, testit_suffix)
+                else:
+                    # unable to run TestIt
+                    rospy.logerr("[%s] Unable to run TestIt!" % pipeline)
+                    rospy.sleep(1.0)
+                if not keep_warm:
+                    # stopSUT
+                    rospy.loginfo("[%s] Stopping SUT..." % pipeline)
+                    self.timed(timings, 'stopSUT', self.execute_system, pipeline, 'SUT', 'stop', sut_prefix, sut_suffix)
+                if start is not None:
+                    artifacts = self.run_artifacts(tag, pipeline, config)
+                    self.record_run(tag, pipeline, config, start, end, verdict, timings, artifacts)
+                    return {'executed': True, 'verdict': verdict, 'start': start.to_sec(), 'end': end.to_sec(),
+                            'timings': timings, 'artifacts': artifacts, 'mode': config.get('mode', 'test'),
+                            'uuid': config.get('uuid', None), 'testUuid': config.get('testUuid', None)}
+                else:
+                    self.observe_timings(tag, pipeline, timings)
             else:
-                # unable to run TestIt
-                rospy.logerr("[%s] Unable to run TestIt!" % pipeline)
+                # Unable to run SUT
+                rospy.logerr("[%s] Unable to run SUT!" % pipeline)
+                self.observe_timings(tag, pipeline, timings)
                 rospy.sleep(1.0)
-            # stopSUT
-            rospy.loginfo("[%s] Stopping SUT..." % pipeline)
-            self.execute_system(pipeline, 'SUT', 'stop', sut_prefix, sut_suffix)
-        else:
-            # Unable to run SUT
-            rospy.logerr("[%s] Unable to run SUT!" % pipeline)
-            rospy.sleep(1.0)
-        self.tests[tag]['reserved_credits'] -= 1
-        if self.tests[tag]['credits'] > 0:
-            rospy.loginfo("Test '%s' has %s credits remaining! Continuing..." % (tag, self.tests[tag]['credits']))
-            self.test_thread_worker(tag, keep_bags, pipeline)
-        else:
-            self.free_pipeline(pipeline)
+        finally:
+            if reserved and not counted:
+                self.release_credits(tag, 1)
+            if counted:
+                self.credits_lock.acquire()
+                try:
+                    self.tests[tag]['running'] -= 1
+                finally:
+                    self.credits_lock.release()
+                self.journal_test(tag)
+        return {'executed': False, 'timings': timings}
+
+    def timed(self, timings, phase, function, *args):
+        """
+        Call 'function' with 'args' and store its duration (seconds) in timings[phase].
+
+        Returns:
+        the return value of 'function'
+        """
+        started = time.time()
+        try:
+            return function(*args)
+        finally:
+            timings[phase] = time.time() - started
+
+    def run_artifacts(self, tag, pipeline, config):
+        """
+        Returns:
+        dict of the run artifact locations in the pipeline (results directory, bags, logger log)
+        """
+        artifacts = {}
+        testit_volume = self.pipelines[pipeline].get('testItVolume', None)
+        results_directory = config.get('resultsDirectory', None)
+        if testit_volume is not None and results_directory is not None:
+            testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+            path = self.ground_path(testit_volume, testit_prefix, testit_suffix) + str(results_directory)
+            artifacts['resultsDirectory'] = path
+            if config.get('bagEnabled', False):
+                artifacts['bags'] = path + tag + "*.bag"
+            if config.get('loggerConfiguration', None) is not None:
+                artifacts['logger'] = path + "logger.log"
+        return artifacts
+
+    def record_run(self, tag, pipeline, config, start, end, verdict, timings, artifacts=None):
+        """
+        Record a test execution in the results database.
+
+        Arguments:
+        start, end -- rospy.Time of the test start and end
+        verdict -- test result (True, False or None)
+        artifacts -- artifact locations (see run_artifacts, resolved if None)
+        """
+        if artifacts is None:
+            artifacts = self.run_artifacts(tag, pipeline, config)
+        self.results.record(tag, pipeline, config.get('mode', 'test'), config.get('uuid', None),
+                            config.get('testUuid', None), start.to_sec(), end.to_sec(), verdict, timings, artifacts)
+        self.metrics.increment('testit_runs_total', 1, {'scenario': tag, 'pipeline': pipeline,
+                                                        'verdict': str(verdict).lower()})
+        self.observe_timings(tag, pipeline, timings)
+
+    def observe_timings(self, tag, pipeline, timings):
+        """
+        Add the phase durations of a run to the metrics and update the metrics file.
+        """
+        for phase in timings:
+            self.metrics.observe('testit_phase_duration_seconds', timings[phase],
+                                 {'scenario': tag, 'pipeline': pipeline, 'phase': phase})
+        self.write_metrics(False)
+
+    def keep_warm(self, tag, pipeline, verdict):
+        """
+        Decide whether the SUT and TestIt are kept running for the next credit in the pipeline (warmPipeline mode).
+
+        The containers are restarted after a failed test and after every 'warmRestartInterval' runs (0 = never).
+
+        Returns:
+        True if the containers are kept running
+        """
+        runs = self.warm_pipelines.pop(pipeline, 0) + 1
+        if not self.config.pipelines[pipeline].warmPipeline or not verdict or \
+                self.tests[tag]['credits'] <= 0:
+            return False
+        interval = self.config.pipelines[pipeline].warmRestartInterval
+        if interval > 0 and runs >= interval:
+            rospy.loginfo("[%s] Restarting SUT and TestIt after %s runs" % (pipeline, runs))
+            return False
+        rospy.loginfo("[%s] Keeping SUT and TestIt running for the next run" % pipeline)
+        self.warm_pipelines[pipeline] = runs
+        return True
+
+    def reset_systems(self, pipeline, timings, sut_prefix, sut_suffix, testit_prefix, testit_suffix):
+        """
+        Execute the 'resetSUT' and 'resetTestIt' hooks (if defined) in a warm pipeline.
+
+        Returns:
+        True if successful
+        """
+        for system, prefix, suffix in (('SUT', sut_prefix, sut_suffix), ('TestIt', testit_prefix, testit_suffix)):
+            if self.config.pipelines[pipeline].steps['reset' + system].commands in (("",), ()):
+                continue
+            rospy.loginfo("[%s] Resetting %s..." % (pipeline, system))
+            if not self.timed(timings, 'reset' + system, self.execute_system, pipeline, system, 'reset', prefix,
+                              suffix):
+                return False
+        return True
+
+    def stop_warm_systems(self, pipeline):
+        """
+        Stop the SUT and TestIt that were kept running in the pipeline (warmPipeline mode).
+        """
+        if self.warm_pipelines.pop(pipeline, None) is None:
+            return
+        rospy.loginfo("[%s] Stopping warm TestIt and SUT..." % pipeline)
+        testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+        sut_prefix, sut_suffix = self.get_command_wrapper("sutConnection", "ssh", pipeline)
+        self.execute_system(pipeline, 'TestIt', 'stop', testit_prefix, testit_suffix)
+        self.execute_system(pipeline, 'SUT', 'stop', sut_prefix, sut_suffix)
 
     def free_pipeline(self, pipeline):
+        # Containers are only kept running between the credits of the lane that holds the pipeline
+        self.stop_warm_systems(pipeline)
         if self.pipelines[pipeline]['state'] not in ["TEARDOWN", "OFFLINE", "FAILED"]:
             rospy.loginfo("Freeing pipeline \'%s\'" % pipeline)
-            self.pipelines[pipeline]['state'] = "READY"
-
-    def nonblocking_test_monitor(self):
-        while True:
-            sleep = True
-            for thread in self.test_threads:
-                tag = self.test_threads[thread]['tag']
-                if not self.test_threads[thread]['result'] is None:
-                    del self.test_threads[thread]
-                    # Only set executing to false if all other threads with same tag are not None
-                    executing = False
-                    for check in self.test_threads:
-                        if self.test_threads[check]['tag'] == tag and not self.test_threads[check]['result'] is None:
-                            executing = True
-                            break
-                    if not executing:
-                        self.tests[tag]['executing'] = False
-                    sleep = False
-                    break
-            if len(self.test_threads) == 0:
-                self.testing = False
-                return  # all threads are finished
-            if sleep:
-                time.sleep(0.5)
+            if self.coordinator is not None:
+                self.coordinator.release(pipeline)
+            self.set_pipeline_state(pipeline, "READY")
 
     def tokenize_arguments(self, string):
         """
@@ -968,6 +1676,15 @@ class TestItDaemon:
                         rospy.logerr("Unable to remove files from '%s'!" % data_directory)
                     else:
                         rospy.loginfo("Done!")
+                    # The results database, coverage store and journal were removed as well
+                    self.results.reopen()
+                    if self.journal is not None:
+                        self.journal.reset()
+                        self.journal_all()
+                    if self.coverage is not None:
+                        self.coverage.open()
+                    if self.logs is not None:
+                        self.logs.open()
                 else:
                     rospy.logerr("'dataDirectory' is not defined in configuration!")
             if len(req.args) > 0:
@@ -1033,6 +1750,7 @@ class TestItDaemon:
                     if set_value is not None:
                         rospy.loginfo("Setting test '%s' credits to %s!" % (test['tag'], set_value))
                         self.tests[test['tag']]['credits'] = set_value
+                        self.journal_test(test['tag'])
                     else:
                         message += self.log(True, "Test '%s' credits: %s" % (test['tag'], test.get('credits', 0)),
                                             "info")
@@ -1051,15 +1769,7 @@ class TestItDaemon:
             if not self.tests[test]['executing']:
                 self.tests[test]['result'] = None
                 self.tests[test]['executing'] = True
-                threads = 0
-                concurrency = self.tests[test].get('concurrency', 1)
-                for _ in self.pipelines:
-                    thread = threading.Thread(target=self.learn_thread_worker, args=(test,))
-                    thread.start()
-                    self.test_threads[thread.ident] = {'thread': thread, 'result': None, 'tag': test}
-                    threads += 1
-                    if concurrency != 0 and threads >= concurrency:
-                        break
+                self.start_lanes(test, self.learn_thread_worker)
             else:
                 rospy.logerr("Learning '%s' is already executing!" % test)
 
@@ -1120,96 +1830,129 @@ class TestItDaemon:
                         rospy.loginfo("Auto incrementing '%s' test credits..." % test)
                         self.tests[test]['credits'] += 1
                 self.tests[test]['executing'] = True
-                threads = 0
-                concurrency = self.tests[test].get('concurrency', 1)
-                for _ in self.pipelines:
-                    thread = threading.Thread(target=self.test_thread_worker, args=(test, keep_bags, None))
-                    thread.start()
-                    self.test_threads[thread.ident] = {'thread': thread, 'result': None, 'tag': test}
-                    threads += 1
-                    if concurrency != 0 and threads >= concurrency:
-                        break
-                if not self.testing:
-                    thread = threading.Thread(target=self.nonblocking_test_monitor)
-                    thread.start()
-                    self.testing = True
+                self.start_lanes(test, self.test_thread_worker, (keep_bags,))
             else:
                 rospy.logerr("Test '%s' is already executing!" % test)
         if blocking:
-            finished = False
-            while not finished:
-                finished = True
-                for test in queue:
-                    executing = self.tests[test].get('executing', False)
-                    if executing:
-                        finished = False
-                        break
-                rospy.sleep(0.2)
+            self.wait_for_tests(queue)
         return testit.srv.CommandResponse(result, message)
 
     def handle_results(self, req):
+        """
+        Output results from the results database.
+
+        Arguments (req.args):
+        --xml-sys-out -- include [scenario_tag]_system_out.xml in <system-out> of the latest run
+        --history -- output all recorded runs instead of the latest run of each scenario
+        --stats -- output run count, pass rate and duration percentiles instead of JUnit XML
+        [scenario_tag [...]] -- limit to these scenarios
+        """
         rospy.logdebug("Results requested")
         message = ""
         result = True
-        testsuite = testit.junit.testsuite(tests=len(self.tests))
+        tokens = self.tokenize_arguments(req.args)
+        options = [token for token in tokens if token.startswith("--")]
+        scenarios = [token for token in tokens if not token.startswith("--")]
+        for scenario in scenarios:
+            if scenario not in self.tests:
+                rospy.logwarn("Unknown scenario tag specified '%s'" % scenario)
+        if len(scenarios) == 0:
+            scenarios = [test for test in self.tests]
+        if "--stats" in options:
+            for test in scenarios:
+                statistics = self.results.statistics(test)
+                line = "Scenario '%s': %s run(s), %s passed, %s failed" % (test, statistics['runs'],
+                                                                           statistics['passed'], statistics['failed'])
+                if statistics['pass_rate'] is not None:
+                    line += ", pass rate %.1f%%" % (statistics['pass_rate'] * 100.0)
+                if statistics['p50'] is not None:
+                    line += ", duration p50 %.1f s, p90 %.1f s, p99 %.1f s" % (statistics['p50'], statistics['p90'],
+                                                                               statistics['p99'])
+                message += line + "\n"
+            return testit.srv.CommandResponse(result, message)
         output = cStringIO.StringIO()
-        for test in self.tests:
-            testcase = testit.junit.testcase(classname=test)
-            start_timestamp = self.tests[test].get('test_start_timestamp', None)
-            if start_timestamp is not None:
-                testcase.set_timestamp(start_timestamp.to_sec())
-            end_timestamp = self.tests[test].get('test_end_timestamp', None)
-            if end_timestamp is not None and start_timestamp is not None:
-                if end_timestamp > start_timestamp:
-                    testcase.set_time((end_timestamp - start_timestamp).to_sec())
-            test_result = self.tests[test].get('result', None)
-            if test_result is None:
+        testcases = 0
+        failures = 0
+        for test in scenarios:
+            if "--history" in options:
+                runs = self.results.runs(test)
+            else:
+                run = self.results.latest(test)
+                runs = [run] if run is not None else []
+            executed = False
+            for run in runs:
+                executed = True
+                testcases += 1
+                if run['verdict'] is False:
+                    failures += 1
+                self.export_run(output, test, run, "--xml-sys-out" in options and "--history" not in options)
+            if not executed:
                 # skipped or not executed
+                testcases += 1
+                testcase = testit.junit.testcase(classname=test)
                 skipped = testit.junit.skipped(message="SKIPPED")
                 skipped.set_valueOf_("This test has not been executed.")
                 testcase.add_skipped(skipped)
                 testcase.set_name("skipped")
-            else:
-                # If "--xml-sys-out" is specified, try to include [scenario_tag]_system_out.xml to <system-out> tag in generated XML
-                if req.args == "--xml-sys-out":
-                    pipeline = self.tests[test].get('executor_pipeline', None)
-                    if pipeline is not None:
-                        rospy.loginfo("Ran in %s " % pipeline)
-                        # Get XML file from pipeline
-                        self.resolve_configuration_value(self.tests[test], pipeline, 'resultsDirectory')
-                        filename = self.tests[test].get("resultsDirectory", "") + self.tests[test][
-                            'tag'] + "_system_out.xml"
-                        # ground testItVolume path
-                        testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
-                        path = self.ground_path(self.pipelines[pipeline]['testItVolume'], testit_prefix, testit_suffix)
-                        fullname = self.ground_path("\"" + path + filename + "\"", testit_prefix, testit_suffix)
-                        if self.pipelines[pipeline].get('testItConnection', "-") != "-":
-                            fullname = self.get_temp_filename(pipeline, fullname)
-                        # Read the file
-                        rospy.loginfo("Reading from file '%s'" % fullname)
-                        try:
-                            with open(fullname, 'r') as sys_out:
-                                data = sys_out.readlines()
-                                testcase.add_system_out("".join(data))
-                        except Exception as e:
-                            pass
-                if not test_result:
-                    # failed
-                    failure = testit.junit.failure(message="FAILURE")
-                    failure.set_valueOf_("Failure text")
-                    testcase.add_failure(failure)
-                    testcase.set_name("fail")
-                else:
-                    # success
-                    testcase.set_name("success")
-            testsuite.add_testcase(testcase)
-        testsuite.export(output, 0, pretty_print=False)
-        message = '<?xml version="1.0" encoding="UTF-8" ?>\n' + output.getvalue() + "\n"
+                testcase.export(output, 1, name_='testcase', pretty_print=False)
+        # The testcases are exported while iterating the runs, the totals are known only afterwards
+        message = '<?xml version="1.0" encoding="UTF-8" ?>\n<testsuite tests="%s" failures="%s">' % (testcases,
+                                                                                                     failures)
+        message += output.getvalue() + "</testsuite>\n"
         return testit.srv.CommandResponse(result, message)
 
+    def export_run(self, output, test, run, include_system_out=False):
+        """
+        Write a recorded run as JUnit testcase element to 'output'.
+        """
+        testcase = testit.junit.testcase(classname=test)
+        if run['start'] is not None:
+            testcase.set_timestamp(run['start'])
+        if run['duration'] is not None and run['duration'] > 0:
+            testcase.set_time(run['duration'])
+        if include_system_out and run['pipeline'] in self.pipelines:
+            # Try to include [scenario_tag]_system_out.xml to <system-out> tag in generated XML
+            pipeline = run['pipeline']
+            rospy.loginfo("Ran in %s " % pipeline)
+            # Get XML file from pipeline
+            results_directory = self.config.pipelines[pipeline].lookup(self.tests[test], 'resultsDirectory')
+            filename = (results_directory or "") + self.tests[test]['tag'] + "_system_out.xml"
+            # ground testItVolume path
+            testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+            path = self.ground_path(self.pipelines[pipeline]['testItVolume'], testit_prefix, testit_suffix)
+            fullname = self.ground_path("\"" + path + filename + "\"", testit_prefix, testit_suffix)
+            if self.pipelines[pipeline].get('testItConnection', "-") != "-":
+                fullname = self.get_temp_filename(pipeline, fullname)
+            # Read the file
+            rospy.loginfo("Reading from file '%s'" % fullname)
+            try:
+                with open(fullname, 'r') as sys_out:
+                    data = sys_out.readlines()
+                    testcase.add_system_out("".join(data))
+            except Exception as e:
+                pass
+        if run['verdict'] is None:
+            testcase.set_name("skipped")
+            skipped = testit.junit.skipped(message="SKIPPED")
+            skipped.set_valueOf_("No verdict was recorded for this run.")
+            testcase.add_skipped(skipped)
+        elif not run['verdict']:
+            # failed
+            failure = testit.junit.failure(message="FAILURE")
+            failure.set_valueOf_("Failure text")
+            testcase.add_failure(failure)
+            testcase.set_name("fail")
+        else:
+            # success
+            testcase.set_name("success")
+        testcase.export(output, 1, name_='testcase', pretty_print=False)
+
     def handle_bag_collect(self, req):
         """
         Collect bags from pipelines to daemon data directory.
+
+        Bags are copied from all pipelines concurrently (at most 'bagCollectParallelism' transfers at a time),
+        already collected bags are skipped and interrupted transfers are resumed (see testit_collector).
         """
         result = True
         message = ""
@@ -1217,8 +1960,16 @@ class TestItDaemon:
         data_directory = self.configuration.get('dataDirectory', None)
         if data_directory is not None:
             data_directory = self.ground_path(data_directory, "", "")
-            for pipeline in self.pipelines:
-                rospy.loginfo("Copying files from pipeline '%s'..." % pipeline)
+            queue = [pipeline for pipeline in self.pipelines]
+            if len(req.args) > 0:
+                queue = []
+                for pipe in set(self.tokenize_arguments(req.args)):
+                    if pipe in self.pipelines:
+                        queue.append(pipe)
+                    else:
+                        rospy.logwarn("Unknown pipeline tag specified '%s'" % pipe)
+            sources = []
+            for pipeline in queue:
                 testit_volume = self.pipelines[pipeline].get('testItVolume', None)
                 if testit_volume is not None:
                     results_directory = self.pipelines[pipeline].get('resultsDirectory', None)
@@ -1226,21 +1977,84 @@ class TestItDaemon:
                         testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
                         bags_directory = self.ground_path(testit_volume + results_directory, testit_prefix,
                                                           testit_suffix)
-                        command = testit_prefix + "cp " + bags_directory + "*bag " + data_directory + testit_suffix
-                        rospy.loginfo("Executing command '%s'" % command)
-                        copy_result = subprocess.call(command, shell=True)
-                        if copy_result != 0:
-                            rospy.logerr("Unable to copy files from pipeline '%s'!" % pipeline)
-                            result = False
-                        else:
-                            rospy.loginfo("Done!")
+                        sources.append((pipeline, bags_directory, testit_prefix, testit_suffix))
+            collector = testit_collector.BagCollector(data_directory,
+                                                      self.configuration.get('bagCollectParallelism', 4),
+                                                      self.configuration.get('bagCollectCompression', ""))
+            collected, skipped, failed = collector.collect(sources)
+            message = "Collected %s bag(s), %s already collected, %s failed" % (collected, skipped, failed)
+            rospy.loginfo(message)
+            if failed > 0:
+                result = False
         else:
             rospy.logerr("'dataDirectory' is not defined!")
             result = False
         return testit.srv.CommandResponse(result, message)
 
+    def handle_bag_extract(self, req):
+        """
+        Extract the failure window of the latest run of a scenario from the collected bags into a new bag.
+
+        Arguments (req.args):
+        scenario_tag
+        --time T -- center of the window in seconds (default: the end of the latest run in the results database)
+        --before S -- seconds before the center (default: 30)
+        --after S -- seconds after the center (default: 5)
+        """
+        result = True
+        message = ""
+        tokens = self.tokenize_arguments(req.args)
+        options = {'--time': None, '--before': 30.0, '--after': 5.0}
+        for option in options:
+            if option in tokens:
+                index = tokens.index(option)
+                try:
+                    options[option] = float(tokens[index + 1])
+                except (IndexError, ValueError):
+                    return testit.srv.CommandResponse(False, self.log(True, "Option '%s' requires a number!" % option,
+                                                                     "err"))
+                del tokens[index + 1]
+                del tokens[index]
+        if len(tokens) != 1 or tokens[0] not in self.tests:
+            return testit.srv.CommandResponse(False, self.log(True, "Specify a single scenario tag!", "err"))
+        test = tokens[0]
+        data_directory = self.configuration.get('dataDirectory', None)
+        if data_directory is None:
+            return testit.srv.CommandResponse(False, self.log(True, "'dataDirectory' is not defined!", "err"))
+        data_directory = self.ground_path(data_directory, "", "")
+        center = options['--time']
+        if center is None:
+            run = self.results.latest(test)
+            if run is None or run['end'] is None:
+                return testit.srv.CommandResponse(False, self.log(True, "Scenario '%s' has no recorded runs!" % test,
+                                                                 "err"))
+            center = run['end']
+        bags = testit_collector.scenario_bags(data_directory, test, self.pipelines.keys())
+        output_filename = os.path.join(data_directory, test + testit_collector.FAILURE_WINDOW_SUFFIX)
+        rospy.loginfo("Extracting [%s, %s] from %s bag(s)..." % (center - options['--before'],
+                                                               center + options['--after'], len(bags)))
+        written, sources = testit_bagindex.extract_window(bags, center - options['--before'],
+                                                          center + options['--after'], output_filename)
+        if written == 0:
+            result = False
+            message = self.log(True, "No messages found in the window (%s bag(s) checked)!" % len(bags), "err")
+        else:
+            message = self.log(True, "Wrote %s message(s) from %s bag(s) to '%s'" % (written, len(sources),
+                                                                                     output_filename), "info")
+        return testit.srv.CommandResponse(result, message)
+
     def shutdown(self):
         rospy.sleep(1)
+        self.executor.shutdown(wait=False)
+        self.write_metrics()
+        self.results.close()
+        if self.journal is not None:
+            self.journal.close()
+        self.close_agents()
+        if self.coordinator is not None:
+            self.coordinator.close()
+        if self.worker is not None:
+            self.worker.close()
         rospy.signal_shutdown("Shutting down!")
 
     def handle_shutdown(self, req):
@@ -1261,54 +2075,82 @@ class TestItDaemon:
         """
         Process paths with bash commands.
         E.g., '$(rospack find testit)/data/' to '/home/user/catkin_ws/src/testit/testit/data/'
+
+        Grounded paths are cached per connection (prefix), use invalidate_paths to clear the cache.
         """
-        if prefix == "":
-            process = subprocess.Popen(['/bin/bash', '-c', 'echo ' + command], stdout=subprocess.PIPE)
-        else:
-            cmd = prefix + "/bin/bash -c '\\''echo " + command + "'\\''" + suffix
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
-        out, err = process.communicate()
+        key = (prefix, suffix)
+        cached = self.path_cache.get(key, {}).get(command, None)
+        if cached is not None:
+            return cached
+        returncode = None
+        agent = self.get_agent(prefix)
+        if agent is not None:
+            try:
+                returncode, out = agent.capture("echo " + command)
+                if not isinstance(out, str):
+                    out = out.encode('utf-8')
+            except testit_agent.AgentError as e:
+                rospy.logwarn("Remote agent failed (%s), grounding '%s' without agent" % (e, command))
+        if returncode is None:
+            if prefix == "":
+                process = subprocess.Popen(['/bin/bash', '-c', 'echo ' + command], stdout=subprocess.PIPE)
+            else:
+                cmd = prefix + "/bin/bash -c '\\''echo " + command + "'\\''" + suffix
+                process = subprocess.Popen(cmd, stdout=subprocess.PIPE, shell=True)
+            out, err = process.communicate()
+            returncode = process.returncode
         out = out.replace("\n", "")
+        if returncode == 0 and out != "":
+            self.path_cache_lock.acquire()
+            try:
+                self.path_cache.setdefault(key, {})[command] = out
+            finally:
+                self.path_cache_lock.release()
         return out
 
-    def annotate_uppaal_transition(self, tree, entry):
+    def invalidate_paths(self, pipeline=None):
         """
-        Annotate a single uppaal transition.
-        
-        Only updates if entry lines
-
-        Arguments:
-        tee -- the xml.etree.ElementTree tree
-        entry -- a single testit coverage entry
+        Clear grounded paths cached for the pipeline connections (all pipelines if pipeline is None).
+        """
+        self.path_cache_lock.acquire()
+        try:
+            if pipeline is None:
+                self.path_cache = {}
+            else:
+                for parameter in ("sutConnection", "testItConnection"):
+                    prefix, suffix = self.get_command_wrapper(parameter, "ssh", pipeline)
+                    if type(prefix) == str:
+                        self.path_cache.pop((prefix, suffix), None)
+                    else:
+                        for i in range(len(prefix)):
+                            self.path_cache.pop((prefix[i], suffix[i]), None)
+        finally:
+            self.path_cache_lock.release()
 
-        Returns:
-        Tuple (success, Annotated xml.etree.ElementTree)
-        """
-        assignments = tree.findall("./template/transition//*[@kind='assignment']")
-        success = False
-        for assignment in assignments:
-            failed = False
-            for i, variable_dict in enumerate(entry['state']):
-                for variable in variable_dict:
-                    match = "i_" + entry['name'] + "_" + variable + "=" + str(entry['state'][i][variable])
-                    if match not in assignment.text:
-                        failed = True
-                        break
-                if failed:
-                    break
-            if not failed:
-                if "V=" not in assignment.text:
-                    assignment.text += ", V=" + str(entry['sum'])
-                    success = True
-        return (success, tree)
+    def handle_reload(self, req):
+        rospy.logdebug("Reload requested")
+        self.invalidate_paths()
+        self.close_agents()
+        return testit.srv.CommandResponse(True, "Cleared cached paths and closed remote agent connections")
 
     def get_temp_filename(self, pipeline, filename):
         testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "scp", pipeline, False, False)
         temp_filename = tempfile.mkstemp()[1]
         rospy.loginfo("Temp file is '%s'" % temp_filename)
+        agent = self.get_agent(self.get_command_wrapper("testItConnection", "ssh", pipeline)[0])
+        if agent is not None:
+            started = time.time()
+            try:
+                agent.get_file(filename, temp_filename)
+                return temp_filename
+            except testit_agent.AgentError as e:
+                rospy.logwarn("[%s] Remote agent failed to copy '%s' (%s), using scp" % (pipeline, filename, e))
+            finally:
+                self.metrics.observe('testit_command_duration_seconds', time.time() - started,
+                                     {'pipeline': pipeline, 'kind': "get file"})
         command = testit_prefix + ":\"" + filename.replace(" ", "\\ ") + "\" " + temp_filename
         rospy.loginfo("Executing '%s'" % command)
-        return_value = subprocess.call(command, shell=True)
+        return_value = self.call(command, pipeline, "scp")
         if return_value != 0:
             rospy.logerr("Unable to copy '%s' from pipeline '%s'!" % (filename, pipeline))
             return None
@@ -1317,10 +2159,10 @@ class TestItDaemon:
 
     def get_file_from_pipeline(self, test, pipeline, filename, prefix, suffix):
         rospy.loginfo("Getting file '%s' from pipeline..." % filename)
-        self.resolve_configuration_value(self.tests[test], pipeline, 'resultsDirectory')
+        results_directory = self.config.pipelines[pipeline].lookup(self.tests[test], 'resultsDirectory')
         # ground testItVolume path
         path = self.ground_path(self.pipelines[pipeline]['testItVolume'], prefix, suffix)
-        fullname = path + self.tests[test].get("resultsDirectory", "") + filename
+        fullname = path + (results_directory or "") + filename
         if self.pipelines[pipeline].get('testItConnection', "-") != "-":
             fullname = self.get_temp_filename(pipeline, fullname)
         return fullname
@@ -1393,25 +2235,24 @@ class TestItDaemon:
                             rospy.loginfo("Ran in %s " % pipeline)
                             if not self.tests[test].get('result', True):
                                 # Test execution location found
-                                testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh",
-                                                                                        pipeline)
-                                data = self.read_yaml_file(test, pipeline, "testit_coverage.log", testit_prefix,
-                                                           testit_suffix)
-                                if data is not None:
+                                data = None
+                                if self.coverage is not None:
+                                    data = self.add_coverage_from_pipeline(test, pipeline, model)
+                                if data is not None and len(data) > 0:
+                                    # Read only the PRE events of the failed trace
                                     filtered = []
                                     last_timestamp = -1.0
-                                    for entry in data:
-                                        if entry['traceStartTimestamp'] == data[-1]['traceStartTimestamp']:
-                                            if entry['event'] == "PRE":
-                                                if entry['timestamp'] != last_timestamp:
-                                                    state = {}
-                                                    for variable in entry['state']:
-                                                        state.update(variable)
-                                                    filtered.append((entry['name'], state))
-                                                    last_timestamp = entry['timestamp']
-
-                                                    rospy.logdebug("Found transition: '%s' - %s" % (
-                                                        entry['name'], str(entry['state'])))
+                                    for entry in self.coverage.query(data[-1]['model'], None, "PRE",
+                                                                     data[-1]['traceStartTimestamp']):
+                                        if entry['timestamp'] != last_timestamp:
+                                            state = {}
+                                            for variable in entry['state']:
+                                                state.update(variable)
+                                            filtered.append((entry['name'], state))
+                                            last_timestamp = entry['timestamp']
+
+                                            rospy.logdebug("Found transition: '%s' - %s" % (
+                                                entry['name'], str(entry['state'])))
                                     if len(filtered) > 0:
                                         message = testit_uppaal.create_sequential_uppaal_xml(filtered)
                                         processed_scenario = test
@@ -1427,113 +2268,92 @@ class TestItDaemon:
                 rospy.logwarn("create new scenario")
                 self.tests[scenario_name] = self.tests[processed_scenario]
                 self.tests[scenario_name]['tag'] = scenario_name
+                self.config.add_test(scenario_name, self.tests[scenario_name], False)
                 self.add_test_to_config_file({'tests': [self.tests[scenario_name]]})
             elif not matched:
                 message = self.log(True, "Unable to match any test scenarios!", "err")
 
         return testit.srv.CommandResponse(result, message)
 
+    def add_coverage_from_pipeline(self, test, pipeline, model):
+        """
+        Add the coverage log of the test from the pipeline to the coverage store (traces that have already been added
+        are skipped).
+
+        Returns:
+        list of coverage entries read from the pipeline or None if the log could not be read
+        """
+        # Get coverage log file from pipeline
+        # TODO support finding the log file in case it has been remapped in test adapter launch file
+        testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
+        data = self.read_yaml_file(test, pipeline, "testit_coverage.log", testit_prefix, testit_suffix)
+        if data is not None:
+            path = self.ground_path(self.pipelines[pipeline]['testItVolume'], testit_prefix, testit_suffix)
+            # Add model info to coverage entries (combined from all pipelines and over runs)
+            for entry in data:
+                entry['model'] = path + model
+            rospy.loginfo("Added %s new coverage entries" % self.coverage.add(data, pipeline))
+        return data
+
     def handle_uppaal_annotate_coverage(self, req):
         """
         Annotate Uppaal TA model (xml file) with coverage info.
         """
         message = "annotate message"
         result = True
+        if self.coverage is None:
+            return testit.srv.CommandResponse(False, self.log(True, "'dataDirectory' is not defined!", "err"))
+        data_directory = self.ground_path(self.configuration['dataDirectory'], "", "")
+        rospy.loginfo("Data directory path is '%s'" % data_directory)
         # TODO check req.args for specific test to process
         for test in self.tests:
             rospy.loginfo("Processing '%s'..." % test)
             model = self.tests[test].get('uppaalModel', None)
             if model is not None:
-                # Read previous processed log entries
-                data_directory = self.ground_path(self.configuration['dataDirectory'], "", "")
-                rospy.loginfo("Data directory path is '%s'" % data_directory)
-                coverage = []
-                daemon_coverage_fullname = data_directory + "testit_coverage.log"
-                try:
-                    coverage = testit_common.parse_yaml(daemon_coverage_fullname)
-                except:
-                    rospy.logwarn("Could not open previous coverage file '%s'!" % daemon_coverage_fullname)
-
                 rospy.loginfo("Uppaal model is %s" % model)
                 pipeline = self.tests[test].get('executor_pipeline', None)
                 if not pipeline:
                     rospy.logwarn("Test has not been executed during this runtime, unable to match data to pipeline!")
                 else:
                     rospy.loginfo("Ran in %s " % pipeline)
-                    # Get coverage log file from pipeline
-                    # TODO support finding the log file in case it has been remapped in test adapter launch file
-                    testit_prefix, testit_suffix = self.get_command_wrapper("testItConnection", "ssh", pipeline)
-                    data = self.read_yaml_file(test, pipeline, "testit_coverage.log", testit_prefix, testit_suffix)
-                    if data is not None:
-                        path = self.ground_path(self.pipelines[pipeline]['testItVolume'], testit_prefix, testit_suffix)
-                        # Add model info to daemon coverage log file (combined from all pipelines and over runs)
-                        for entry in data:
-                            entry['model'] = path + model
-                        coverage += data
-                        # It is up to the user to use "clean" command to avoid erroneous reprocessing
-                        rospy.logwarn(
-                            "Use \"testit_command.py clean\" before using this command again to avoid adding these entries again!")
-
-                if len(coverage) > 0:
-                    rospy.loginfo("Processing %s coverage entries..." % len(coverage))
-                    # Create pruned list (keep only relevant model entries)
-                    entries = []
-                    rospy.loginfo("Filtering '%s' file entries..." % req.args)
-                    for entry in coverage:
-                        if model in entry['model']:
-                            # TODO add PRE events, but only for advanced annotation algorithm
-                            if req.args in entry['file'] and entry['event'] == "POST":
-                                entries.append(entry)
-                    rospy.loginfo("Pruned list is %s entries!" % len(entries))
-                    if len(entries) > 0:
-                        # Parse Uppaal model
-                        rospy.loginfo("Parsing Uppaal model...")
-                        root = None
-                        try:
-                            tree = xml.etree.ElementTree.parse(entries[0]['model'])
-                            root = tree.getroot()
-                        except Exception as e:
-                            rospy.logerr("Unable to parse Uppaal model!")
-                            import traceback
-                            traceback.print_exc()
-
-                        # TODO consider nondeterminism in traces
-                        trace = []
-                        for entry in entries:
-                            if entry['traceStartTimestamp'] == entries[-1]['traceStartTimestamp']:
-                                trace.append(entry)
-                        rospy.loginfo("Annotating model with trace size %s..." % len(trace))
-                        maxV = 0
-                        for entry in trace:
-                            success, tree = self.annotate_uppaal_transition(tree, entry)
-                            if success and entry['sum'] > maxV:
-                                maxV = entry['sum']
-                        # Add variable V and add variable "maxV" as constant to model
-                        declaration = tree.findall("./declaration")
-                        if len(declaration) > 0:
-                            declaration[0].text += " int V; const int maxV=" + str(maxV) + ";"
-                        else:
-                            rospy.logerr("Unable to find '<declaration>' tag in XML tree!")
+                    self.add_coverage_from_pipeline(test, pipeline, model)
+
+                # TODO add PRE events, but only for advanced annotation algorithm
+                rospy.loginfo("Filtering '%s' file entries..." % req.args)
+                traces = self.coverage.traces(model, req.args, "POST")
+                if len(traces) > 0:
+                    # TODO consider nondeterminism in traces
+                    trace = self.coverage.query(model, req.args, "POST", traces[-1])
+                    # Parse Uppaal model (parsed models and their transition indices are cached)
+                    rospy.loginfo("Parsing Uppaal model...")
+                    try:
+                        uppaal_model = testit_uppaal.get_annotated_model(trace[0]['model'])
+                    except Exception as e:
+                        rospy.logerr("Unable to parse Uppaal model!")
+                        import traceback
+                        traceback.print_exc()
+                        result = False
+                        continue
 
-                        # Save annotated Uppaal model to file
-                        annotated_file = data_directory + "annotated_models/" + model
-                        annotated_directory = "/".join(annotated_file.split("/")[:-1])
-                        mkdir_result = subprocess.call("mkdir -p " + annotated_directory, shell=True)
-                        if mkdir_result != 0:
-                            rospy.logerr("Unable to create directory '%s'!" % annotated_directory)
-                        else:
-                            rospy.loginfo("Writing annotated Uppaal model file...")
-                            tree.write(annotated_file)
-                            message = "Wrote annotated Uppaal model file to '%s'" % annotated_file
-                            rospy.loginfo(message)
-
-                        # Save coverage list to file
-                        rospy.loginfo("Saving coverage list to file...")
-                        testit_common.write_yaml_to_file(coverage, daemon_coverage_fullname)
-                        rospy.loginfo("Finished!")
+                    rospy.loginfo("Annotating model with trace size %s..." % len(trace))
+                    annotations, maxV = uppaal_model.annotate(trace)
+
+                    # Save annotated Uppaal model (with variable V and constant "maxV") to file
+                    annotated_file = data_directory + "annotated_models/" + model
+                    annotated_directory = "/".join(annotated_file.split("/")[:-1])
+                    mkdir_result = subprocess.call("mkdir -p " + annotated_directory, shell=True)
+                    if mkdir_result != 0:
+                        rospy.logerr("Unable to create directory '%s'!" % annotated_directory)
                     else:
-                        rospy.logerr("No entries found for file '%s'!" % req.args)
-                        result = False
+                        rospy.loginfo("Writing annotated Uppaal model file...")
+                        if not uppaal_model.write(annotated_file, annotations, maxV):
+                            rospy.logerr("Unable to find '<declaration>' tag in XML tree!")
+                        message = "Wrote annotated Uppaal model file to '%s'" % annotated_file
+                        rospy.loginfo(message)
+                    rospy.loginfo("Finished!")
+                else:
+                    rospy.logerr("No entries found for file '%s'!" % req.args)
+                    result = False
         return testit.srv.CommandResponse(result, message)
 
     def handle_online_test(self, req):
@@ -1554,20 +2374,15 @@ class TestItDaemon:
         """
         message = "Optimize message"
         result = True
-        # Read previous log entries
-        data_directory = self.ground_path(self.configuration['dataDirectory'], "", "")
-        rospy.loginfo("Data directory path is '%s'" % data_directory)
-        log_data = []
-        daemon_log_fullname = data_directory + "logger.log"
-        try:
-            log_data = testit_common.parse_json_stream_file(daemon_log_fullname)
-        except:
-            rospy.logwarn("Could not open previous log file '%s'!" % daemon_log_fullname)
+        if self.logs is None:
+            return testit.srv.CommandResponse(False, self.log(True, "'dataDirectory' is not defined!", "err"))
         tokens = set(self.tokenize_arguments(req.args))
         weights = []
+        optimized_test = None
         for test in self.tests:
             for token in tokens:
                 if token == test:
+                    optimized_test = test
                     pipeline = self.tests[test].get('executor_pipeline', None)
                     if not pipeline:
                         rospy.logwarn(
@@ -1579,21 +2394,19 @@ class TestItDaemon:
 
                         fullname = self.get_file_from_pipeline(test, pipeline, "logger.log", testit_prefix,
                                                                testit_suffix)
-                        log_data += testit_common.parse_json_stream_file(fullname)
-
-                        # It is up to the user to use "clean" command to avoid erroneous reprocessing
-                        rospy.logwarn(
-                            "Use \"testit_command.py clean\" before using this command again to avoid adding these entries again!")
+                        log_data = testit_logstore.read_log(fullname)
+                        if log_data is not None:
+                            # Runs that have already been added are skipped
+                            rospy.loginfo("Saving log to TestIt daemon data directory...")
+                            rospy.loginfo("Added %s new run(s)" % self.logs.add(log_data))
 
                     optimizer = self.tests[test].get('optimizer', {})
                     weights += optimizer.get('weights', [])
-        optimized_sequence = testit_optimizer.optimize(log_data, weights, test)
+        if optimized_test is None:
+            return testit.srv.CommandResponse(False, self.log(True, "Unable to match any test scenarios!", "err"))
+        optimized_sequence = testit_optimizer.optimize(self.logs.entries([optimized_test]), weights, optimized_test)
         message = testit_uppaal.create_sequential_uppaal_xml(
             testit_uppaal.convert_optimizer_sequence_to_uppaal_synchronizations(optimized_sequence))
-
-        rospy.loginfo("Saving log to TestIt daemon data directory...")
-        for i, entry in enumerate(log_data):
-            testit_common.append_to_json_file(entry, daemon_log_fullname, mode="w" if i == 0 else "a+")
         rospy.loginfo("Finished!")
         return testit.srv.CommandResponse(result, message)
 
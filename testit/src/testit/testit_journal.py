@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import json
+import os
+
+
+class Journal(object):
+    """
+    Write-ahead journal of the daemon state with periodic snapshots.
+
+    The state is a dictionary of kinds (e.g., "tests", "pipelines") mapping keys (tags) to value dictionaries.
+    Every change is appended to the journal file and synced to disk before it is applied to the state kept in
+    memory. After 'snapshot_interval' changes the state is written to the snapshot file and the journal is emptied,
+    so recovery reads one snapshot and a short journal.
+    """
+    def __init__(self, directory, snapshot_interval=100):
+        self.journal_filename = os.path.join(directory, "daemon.journal")
+        self.snapshot_filename = os.path.join(directory, "daemon.snapshot.json")
+        self.snapshot_interval = snapshot_interval
+        self.lock = threading.Lock()
+        self.journal = None
+        self.open()
+
+    def open(self):
+        """
+        Load the snapshot and replay the journal.
+        """
+        self.lock.acquire()
+        try:
+            if self.journal is not None:
+                self.journal.close()
+            directory = os.path.dirname(self.journal_filename)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.state = {}
+            try:
+                with open(self.snapshot_filename, 'r') as f:
+                    self.state = json.load(f)
+            except (IOError, ValueError):
+                pass
+            self.changes = 0
+            torn = False
+            try:
+                with open(self.journal_filename, 'r') as f:
+                    for line in f:
+                        try:
+                            if not line.endswith("\n"):
+                                raise ValueError("record is not terminated")
+                            record = json.loads(line)
+                        except ValueError:
+                            # Last record was not written completely
+                            rospy.logwarn("Ignoring incomplete journal record")
+                            torn = True
+                            break
+                        self.apply(record)
+                        self.changes += 1
+            except IOError:
+                pass
+            self.journal = open(self.journal_filename, 'a')
+            if torn:
+                # Records appended after the incomplete record would be lost on the next replay
+                self.snapshot()
+        finally:
+            self.lock.release()
+
+    def apply(self, record):
+        self.state.setdefault(record['kind'], {}).setdefault(record['key'], {}).update(record['values'])
+
+    def recover(self):
+        """
+        Returns:
+        copy of the recovered state ({kind: {key: {name: value}}})
+        """
+        self.lock.acquire()
+        try:
+            return json.loads(json.dumps(self.state))
+        finally:
+            self.lock.release()
+
+    def write(self, kind, key, values):
+        """
+        Record changed values of 'key' (e.g., a test tag) of 'kind' (e.g., "tests").
+        """
+        record = {'kind': kind, 'key': key, 'values': values}
+        self.lock.acquire()
+        try:
+            if self.journal is None:
+                # Closed
+                return
+            self.journal.write(json.dumps(record) + "\n")
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+            self.apply(record)
+            self.changes += 1
+            if self.changes >= self.snapshot_interval:
+                self.snapshot()
+        finally:
+            self.lock.release()
+
+    def snapshot(self):
+        """
+        Write the state to the snapshot file and empty the journal (must be called with lock held).
+        """
+        temp_filename = self.snapshot_filename + ".tmp"
+        with open(temp_filename, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.rename(temp_filename, self.snapshot_filename)
+        self.journal.close()
+        self.journal = open(self.journal_filename, 'w')
+        self.changes = 0
+
+    def reset(self):
+        """
+        Start from an empty state (e.g., after the data directory has been cleaned).
+        """
+        self.lock.acquire()
+        try:
+            self.state = {}
+            self.snapshot()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            if self.journal is not None:
+                self.snapshot()
+                self.journal.close()
+                self.journal = None
+        finally:
+            self.lock.release()
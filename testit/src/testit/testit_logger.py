@@ -36,17 +36,53 @@
 
 import rospy
 import testit_common
+import testit_logwriter
+import testit_serializer
+import testit_coverageflush
+import testit_outputs
 import sys
+import importlib
 import actionlib
 import actionlib_msgs.msg
-import json
-import yaml
 import testit_msgs.srv
 import uuid
 import threading
 import testit_msgs.msg
 import std_msgs.msg
 
+class ServiceProxyPool(object):
+    """
+    Persistent connections to a proxied service, one for every concurrent call (connecting to the service for every
+    call would add a master lookup and a new connection to the latency of the call).
+    """
+    def __init__(self, name, service_class):
+        self.name = name
+        self.service_class = service_class
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def __call__(self, request):
+        self.lock.acquire()
+        try:
+            client = self.idle.pop() if len(self.idle) > 0 else None
+        finally:
+            self.lock.release()
+        if client is None:
+            client = rospy.ServiceProxy(self.name, self.service_class, persistent=True)
+        try:
+            result = client(request)
+        except:
+            # The connection is not reused after a failed call
+            client.close()
+            raise
+        self.lock.acquire()
+        try:
+            self.idle.append(client)
+        finally:
+            self.lock.release()
+        return result
+
+
 class TestItLogger(object):
     def __init__(self):
         self.initialize()
@@ -57,42 +93,50 @@ class TestItLogger(object):
         self.configuration = rospy.get_param('testit/configuration', None)
         self.test = rospy.get_param('~test', "")
         rospy.loginfo("Test is '%s'" % self.test)
-        self.action_proxies = []
-        self.service_proxies = []
-        self.buffers = {}
+        self.action_proxies = {}  # mapping index: (SimpleActionServer, SimpleActionClient)
+        self.service_proxies = {}  # mapping index: (Service, ServiceProxy)
+        self.outputs = {}
         self.mapping = {}
         if self.configuration is None:
             rospy.logerr("Logger configuration not defined!")
             sys.exit(-1)
         self.log_file = rospy.get_param('~log', None)
+        if self.log_file is None:
+            rospy.logerr("Log file not defined!")
+            sys.exit(-1)
+        writer = self.configuration.get('writer', None) or {}
+        try:
+            # Messages are serialized by the writer thread (off the proxy path)
+            self.writer = testit_logwriter.LogWriter(self.log_file, writer.get('queueSize', 10000),
+                                                     writer.get('batchSize', 100), writer.get('flushInterval', 0.5),
+                                                     writer.get('fsync', "never"), writer.get('rotateSize', 0),
+                                                     testit_serializer.serialize)
+        except (IOError, ValueError) as e:
+            rospy.logerr("Unable to start the log writer for '%s': %s" % (self.log_file, e))
+            sys.exit(-1)
         self.coverage_enabled = True
-        self.seq = 0
+        self.flush_scheduler = None
         if self.configuration.get('coverage', None) is not None:
             self.coverage_enabled = self.configuration['coverage'].get("enable", True)
         if self.coverage_enabled:
-            self.coverage = {}
             self.coverage_mode = self.configuration['coverage'].get("mode", "srv")
             self.reporting_time_limit = self.configuration['coverage'].get("reportingTimeLimit", 1.0)
-            self.coverage_lock = threading.Lock()
             if self.coverage_mode == "srv":
                 self.coverage_client = rospy.ServiceProxy("/testit/flush_coverage", testit_msgs.srv.Coverage)
             else:
                 #TODO topic mode
                 self.coverage_publisher = rospy.Publisher("/testit/flush_coverage", std_msgs.msg.UInt32, queue_size=10)
                 self.coverage_subscriber = rospy.Subscriber("/testit/flush_data", testit_msgs.msg.FlushData, self.flush_subscriber)
-        if self.log_file is None:
-            rospy.logerr("Log file not defined!")
-            sys.exit(-1)
+            self.flush_scheduler = testit_coverageflush.CoverageFlushScheduler(
+                self.flush_coverage, self.add_entry, self.configuration['coverage'].get("coalesceWindow", 0.1),
+                self.reporting_time_limit if self.coverage_mode != "srv" else 0.0)
+        rospy.on_shutdown(self.shutdown)
         self.run_id = str(uuid.uuid4())
 
-    def process_coverage_list(self, coverage, host_id="", seq=0):
-        self.coverage_lock.acquire()
-        try:
-            for file_coverage in coverage:
-                self.coverage[host_id+str(seq)+file_coverage.filename] = {'host_id': host_id, 'seq': seq, 'filename': file_coverage.filename,  'lines': file_coverage.lines}
-        except Exception as e:
-            rospy.logerr("Exception from flush subscriber: %s" % e)
-        self.coverage_lock.release()
+    def shutdown(self):
+        if self.flush_scheduler is not None:
+            self.flush_scheduler.close()
+        self.writer.close()
 
     def flush_subscriber(self, data):
         # Received report from SUT host, log it
@@ -100,7 +144,7 @@ class TestItLogger(object):
         # str host_id
         # uint32 seq
         # FileCoverage[] -- str filename, int32[] lines
-        self.process_coverage_list(data.coverage, data.host_id, data.seq)
+        self.flush_scheduler.report(data.seq, data.host_id, data.coverage)
 
     def register_services_and_subscribe(self):
         """
@@ -118,23 +162,33 @@ class TestItLogger(object):
                     channel_type = channel[0].get('type', "")
                     if channel_type != "":
                         rospy.loginfo("%s" % channel[0])
-                        self.do_import(channel_type)
+                        channel_class = self.get_type(channel_type)
                         rospy.loginfo("Import successful!")
                         proxy = channel[0].get('proxy', "")
                         if proxy == "":
                             channel[0]['channel'] = channel[1]
-                            eval("rospy.Subscriber(\"" + identifier + "\", " + channel_type + ", self.topic_callback, callback_args=" + str(i)+")")
+                            if channel[1] == 'output':
+                                try:
+                                    self.outputs[i] = testit_outputs.OutputMonitor(channel[0])
+                                except ValueError as e:
+                                    rospy.logerr("Invalid output '%s': %s" % (identifier, e))
+                                    sys.exit(-1)
+                            rospy.Subscriber(identifier, channel_class, self.topic_callback, callback_args=i)
                             if feedback != "":
-                                self.do_import(feedback['type'])
-                                eval("rospy.Subscriber(\"" + feedback['topic'] + "\", " + feedback['type'] + ", self.response_callback, callback_args=" + str(i)+")")
+                                rospy.Subscriber(feedback['topic'], self.get_type(feedback['type']),
+                                                 self.response_callback, callback_args=i)
                             rospy.loginfo("Logger subscribed to %s" % identifier)
                         else:
                             if channel_type.endswith("Action"):
                                 # Register action server and client
-                                eval("self.action_proxies.append((actionlib.SimpleActionServer(\"" + proxy + "\", " + channel_type + ", lambda x: self.action_handler(x, " + str(i) + "), auto_start = False), actionlib.SimpleActionClient(\"" + identifier + "\", " + channel_type + ")))", dict(globals().items() + [('self', self)]))
-                                self.action_proxies[-1][0].start()
+                                client = actionlib.SimpleActionClient(identifier, channel_class)
+                                server = actionlib.SimpleActionServer(
+                                    proxy, channel_class, lambda goal, i=i: self.action_handler(goal, i),
+                                    auto_start=False)
+                                self.action_proxies[i] = (server, client)
+                                server.start()
                                 rospy.loginfo("Waiting for '%s' action server..." % identifier)
-                                self.action_proxies[-1][1].wait_for_server()
+                                client.wait_for_server()
                                 channel[0]['ready'] = True
                                 rospy.loginfo("Registered action proxy %s" % proxy)
                             else:
@@ -142,32 +196,42 @@ class TestItLogger(object):
                                 rospy.loginfo("Waiting for '%s' service..." % identifier)
                                 rospy.wait_for_service(identifier)
                                 rospy.loginfo("Creating service proxy...")
-                                eval("self.service_proxies.append((rospy.Service(\"" + proxy + "\", " + channel_type + ", lambda x: self.service_handler(x, " + str(i) + ")),rospy.ServiceProxy(\"" + identifier + "\", " + channel_type + ")))", dict(globals().items() + [('self', self)]))
+                                client = ServiceProxyPool(identifier, channel_class)
+                                self.service_proxies[i] = (rospy.Service(
+                                    proxy, channel_class, lambda req, i=i, client=client: self.service_handler(req, i, client)),
+                                    client)
                                 rospy.loginfo("Registered proxy service %s" % identifier)
 
-    def do_import(self, channel_type):
-        import_string = ".".join(channel_type.split(".")[:-1])
-        rospy.loginfo("Importing '%s'" % import_string)
-        exec("import " + import_string, globals())
+    def get_type(self, channel_type):
+        """
+        Import a message, service or action type.
 
-    def flush_coverage(self):
-        if self.coverage_enabled:
-            if self.coverage_mode == "srv":
-                try:
-                    response = self.coverage_client()
-                    if response.result:
-                        self.coverage = self.process_coverage_list(response.coverage)
-                    return True
-                except rospy.ServiceException, e:
-                    rospy.logerr("Coverage flush failed: %s" % e)
-            else:
-                # Topic mode
-                self.seq += 1
-                message = std_msgs.msg.UInt32()
-                message.data = self.seq
-                self.coverage_publisher.publish(message)
-                return self.seq
-        return None
+        Args:
+        channel_type -- type as string (e.g., "std_srvs.srv.Empty")
+
+        Returns:
+        the type class
+        """
+        module_name, class_name = channel_type.rsplit(".", 1)
+        rospy.loginfo("Importing '%s'" % module_name)
+        return getattr(importlib.import_module(module_name), class_name)
+
+    def flush_coverage(self, seq):
+        """
+        Request the coverage reports of flush 'seq' (called by the flush scheduler).
+        """
+        if self.coverage_mode == "srv":
+            try:
+                response = self.coverage_client()
+                if response.result:
+                    self.flush_scheduler.report(seq, "", response.coverage)
+            except rospy.ServiceException, e:
+                rospy.logerr("Coverage flush failed: %s" % e)
+        else:
+            # Topic mode
+            message = std_msgs.msg.UInt32()
+            message.data = seq
+            self.coverage_publisher.publish(message)
 
     def write_response_log_entry(self, identifier, event, data):
         """
@@ -184,17 +248,8 @@ class TestItLogger(object):
         #rospy.loginfo("data is: %s" % str(data))
         #rospy.loginfo("type is %s" % type(data))
         channel = {'identifier': self.mapping[identifier]['feedback']['topic'], 'proxy': "", 'type': self.mapping[identifier]['feedback']['type']}
-        json_str = str(yaml.load(str(data))).replace("'", "\"").replace("None", "null").replace("True", "true").replace("False", "false")
-        entry = {'run_id': self.run_id, 'timestamp': rospy.Time.now().to_sec(), 'channel': channel, 'event': event, 'data': json.loads(json_str), 'test': self.test}
-        seq = self.flush_coverage()
-        if seq is not None:
-            self.seq = seq
-            if self.seq > 0:
-                t = threading.Timer(self.reporting_time_limit, self.add_coverage_entry, args=[entry, seq])
-                t.start()
-                return True
-            else:
-                return self.add_coverage_entry(entry, seq)
+        entry = {'run_id': self.run_id, 'timestamp': rospy.Time.now().to_sec(), 'channel': channel, 'event': event, 'data': data, 'test': self.test}
+        return self.log_entry(entry)
 
 
     def write_log_entry(self, identifier, event, data):
@@ -212,35 +267,30 @@ class TestItLogger(object):
         #rospy.loginfo("data is: %s" % str(data))
         #rospy.loginfo("type is %s" % type(data))
         channel = {'identifier': self.mapping[identifier]['identifier'], 'proxy': self.mapping[identifier]['proxy'], 'type': self.mapping[identifier]['type']}
-        json_str = str(yaml.load(str(data))).replace("'", "\"").replace("None", "null").replace("True", "true").replace("False", "false")
-        entry = {'run_id': self.run_id, 'timestamp': rospy.Time.now().to_sec(), 'channel': channel, 'event': event, 'data': json.loads(json_str), 'test': self.test}
-        seq = self.flush_coverage()
-        if seq is not None:
-            self.seq = seq
-            if self.seq > 0:
-                t = threading.Timer(self.reporting_time_limit, self.add_coverage_entry, args=[entry, seq])
-                t.start()
-                return True
-            else:
-                return self.add_coverage_entry(entry, seq)
+        entry = {'run_id': self.run_id, 'timestamp': rospy.Time.now().to_sec(), 'channel': channel, 'event': event, 'data': data, 'test': self.test}
+        if len(self.outputs) > 0:
+            entry['outputs'] = self.output_values()
+        return self.log_entry(entry)
 
-    def add_coverage_entry(self, entry, seq):
+    def output_values(self):
+        """
+        Returns:
+        dict of the monitored output values ({identifier: {field: value}})
+        """
+        values = {}
+        for output in self.outputs.values():
+            output_values = output.values()
+            if len(output_values) > 0:
+                values[output.identifier] = output_values
+        return values
+
+    def log_entry(self, entry):
+        """
+        Add an entry to the log after the coverage of the next (coalesced) flush has been attached to it.
+        """
+        if self.flush_scheduler is not None:
+            return self.flush_scheduler.add(entry)
         entry['coverage'] = {}
-        self.coverage_lock.acquire()
-        try:
-            purge_keys = []
-            for key in self.coverage:
-                if self.coverage[key]["seq"] != seq:
-                    continue
-                entry['coverage'][self.coverage[key]["filename"]] = entry['coverage'].get(self.coverage[key]["filename"], {})
-                entry['coverage'][self.coverage[key]["filename"]][self.coverage[key]["host_id"]] = self.coverage[key]["lines"]
-                purge_keys.append(key)
-            # Trim added entries
-            for key in purge_keys:
-                del self.coverage[key]
-        except Exception as e:
-            rospy.logerr("Exception when adding coverage entry: %s" % e)
-        self.coverage_lock.release()
         return self.add_entry(entry)
 
     def load_config_from_file(self):
@@ -250,26 +300,16 @@ class TestItLogger(object):
 
     def add_entry(self, data):
         """
-        Add an entry to the JSON log file.
+        Add an entry to the JSON log file (written asynchronously, see testit_logwriter.py).
 
         Args:
         data -- dict with values to store
+
+        Returns:
+        False if the entry was dropped because the writer queue is full
         """
         #rospy.loginfo("trying to write: %s" % data)
-        return testit_common.append_to_json_file(data, self.log_file)
-
-    def get_action_proxy(self, identifier):
-        for action_proxy in self.action_proxies:
-            if action_proxy[0].action_server.ns == identifier:
-                return action_proxy
-        return None
-
-    def get_service_proxy(self, identifier):
-        for service_proxy in self.service_proxies:
-            rospy.loginfo("resolved name = %s" % service_proxy[0].resolved_name)
-            if service_proxy[0].resolved_name == identifier:
-                return service_proxy
-        return None
+        return self.writer.write(data)
 
     def response_callback(self, data, identifier):
         if not self.write_response_log_entry(identifier, "RESPONSE", data):
@@ -277,36 +317,17 @@ class TestItLogger(object):
 
     def topic_callback(self, data, identifier):
         if self.mapping[identifier]['channel'] == 'output':
-            # Update buffer values if needed (based on buffer.hz)
-            self.mapping[identifier]['buffer'] = self.mapping[identifier].get('buffer', {})
-            self.mapping[identifier]['buffer']['hz'] = self.mapping[identifier]['buffer'].get('hz', 1)
-            self.mapping[identifier]['update_timestamp'] = self.mapping[identifier].get('update_timestamp', rospy.Time())
-            if self.mapping[identifier]['update_timestamp'].to_sec() + (1.0 / self.mapping[identifier]['buffer']['hz']) <= rospy.Time.now().to_sec():
-                self.buffers[identifier] = self.buffers.get(identifier, [])
-                self.mapping[identifier]['buffer']['size'] = self.mapping[identifier]['buffer'].get('size', 1)
-                if len(self.buffers[identifier]) < self.mapping[identifier]['buffer']['size']:
-                    self.buffers[identifier].append(data)
-                else:
-                    self.mapping[identifier]['buffer_index'] = self.mapping[identifier].get('buffer_index', 0)
-                    self.buffers[identifier][self.mapping[identifier]['buffer_index'] % len(self.buffers[identifier])] = data
-                    self.mapping[identifier]['buffer_index'] += 1
-                self.mapping[identifier]['update_timestamp'] = rospy.Time().now()
+            # Update the monitored values (at most buffer.hz times per second)
+            self.outputs[identifier].update(data, rospy.Time.now().to_sec())
         else:
             # Write a log entry
             if not self.write_log_entry(identifier, "POST", data):
                 rospy.logerr("Failed to write log entry!")
 
-    def service_handler(self, req, identifier):
-        rospy.loginfo("service_handler")
+    def service_handler(self, req, identifier, client):
         if not self.write_log_entry(identifier, "PRE", req):
             rospy.logerr("Failed to write log entry!")
-        rospy.logerr(self.mapping[identifier])
-        rospy.logwarn(type(req))
-        service_proxy = self.get_service_proxy(self.mapping[identifier]['proxy'])
-        rospy.loginfo(service_proxy)
-        rospy.loginfo("Calling service...")
-        result = service_proxy[1](req)
-        rospy.loginfo("Service call returned!")
+        result = client(req)
         # Write a log entry
         if not self.write_log_entry(identifier, "POST", req):
             rospy.logerr("Failed to write log entry!")
@@ -319,7 +340,7 @@ class TestItLogger(object):
         # Write a log entry
         if not self.write_log_entry(identifier, "PRE", goal):
             rospy.logerr("Failed to write log entry!")
-        action_proxy = self.get_action_proxy(self.mapping[identifier]['proxy'])
+        action_proxy = self.action_proxies.get(identifier, None)
         if action_proxy is not None:
             action_proxy[1].send_goal(goal)
             action_proxy[1].wait_for_result()
@@ -330,13 +351,13 @@ class TestItLogger(object):
                 rospy.logerr("Failed to write log entry!")
             if state == actionlib_msgs.msg.GoalStatus.SUCCEEDED:
                 action_proxy[0].set_succeeded(result)
-                rospy.loginfo("set succeeded")
+                rospy.logdebug("set succeeded")
             elif state == actionlib_msgs.msg.GoalStatus.PREEMPTED:
                 action_proxy[0].set_preempted(result)
-                rospy.loginfo("set preempted")
+                rospy.logdebug("set preempted")
             elif state == actionlib_msgs.msg.GoalStatus.ABORTED:
                 action_proxy[0].set_aborted(result)
-                rospy.loginfo("set aborted")
+                rospy.logdebug("set aborted")
 
 
 if __name__ == "__main__":
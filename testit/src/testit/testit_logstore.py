@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import json
+import gzip
+import os
+import testit_logwriter
+
+
+class LogStore(object):
+    """
+    Daemon-side store for logger entries (see testit_logger.py) collected from the pipelines.
+
+    The entries are kept in the logger log format (JSON lines) and are added per run ('run_id'): runs that are already
+    in the store are skipped, so adding the same pipeline log again does not duplicate entries. The location of every
+    run is recorded in an index file, so the entries of a test are read without parsing the whole log.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.index_filename = os.path.splitext(filename)[0] + ".index.jsonl"
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        self.lock.acquire()
+        try:
+            directory = os.path.dirname(self.filename)
+            if directory != "" and not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.runs = []
+            self.run_ids = set()
+            if os.path.isfile(self.index_filename):
+                with open(self.index_filename, 'r') as f:
+                    for line in f:
+                        if line.strip() != "":
+                            self.add_run(json.loads(line))
+            elif os.path.isfile(self.filename):
+                self.build_index()
+        finally:
+            self.lock.release()
+
+    def add_run(self, run):
+        self.runs.append(run)
+        self.run_ids.add(run['run_id'])
+
+    def build_index(self):
+        """
+        Index an existing log file (must be called with lock held). Repeated runs (from adding the same pipeline log
+        multiple times) are left out of the index.
+        """
+        rospy.loginfo("Indexing '%s'..." % self.filename)
+        runs = []
+        with open(self.filename, 'rb') as f:
+            offset = 0
+            run = None
+            first = None
+            for line in iter(f.readline, b''):
+                if line.strip() != b'':
+                    entry = json.loads(line.decode('utf-8'))
+                    # A repeated first entry starts a copy of the run
+                    if run is None or entry['run_id'] != run['run_id'] or entry == first:
+                        run = {'run_id': entry['run_id'], 'test': entry.get('test', ""), 'offset': offset,
+                               'length': 0, 'count': 0}
+                        runs.append(run)
+                        first = entry
+                    run['count'] += 1
+                offset += len(line)
+                if run is not None:
+                    run['length'] = offset - run['offset']
+        with open(self.index_filename, 'w') as f:
+            for run in runs:
+                if run['run_id'] not in self.run_ids:
+                    self.add_run(run)
+                    f.write(json.dumps(run) + "\n")
+
+    def add(self, entries):
+        """
+        Append the entries of the runs that are not in the store yet (with a single write).
+
+        Returns:
+        number of runs added
+        """
+        runs = {}
+        order = []
+        for entry in entries:
+            if entry['run_id'] not in runs:
+                runs[entry['run_id']] = []
+                order.append(entry['run_id'])
+            runs[entry['run_id']].append(entry)
+        self.lock.acquire()
+        try:
+            order = [run_id for run_id in order if run_id not in self.run_ids]
+            if len(order) == 0:
+                return 0
+            records = []
+            chunks = []
+            with open(self.filename, 'ab') as f:
+                # The position of a file opened for appending is not defined before the first write
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                for run_id in order:
+                    data = "".join([json.dumps(entry) + "\n" for entry in runs[run_id]]).encode('utf-8')
+                    chunks.append(data)
+                    records.append({'run_id': run_id, 'test': runs[run_id][0].get('test', ""), 'offset': offset,
+                                    'length': len(data), 'count': len(runs[run_id])})
+                    offset += len(data)
+                f.write(b''.join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+            # The runs are added to the index only after the data has been written
+            with open(self.index_filename, 'a') as f:
+                f.write("".join([json.dumps(record) + "\n" for record in records]))
+            for record in records:
+                self.add_run(record)
+            return len(records)
+        finally:
+            self.lock.release()
+
+    def entries(self, tests=None):
+        """
+        Read the entries of the runs of the tests (all tests if None) in the order they were added.
+        """
+        self.lock.acquire()
+        try:
+            runs = [run for run in self.runs if tests is None or run['test'] in tests]
+        finally:
+            self.lock.release()
+        entries = []
+        if len(runs) == 0:
+            return entries
+        with open(self.filename, 'rb') as f:
+            for run in runs:
+                f.seek(run['offset'])
+                for line in f.read(run['length']).decode('utf-8').splitlines():
+                    if line.strip() != "":
+                        entries.append(json.loads(line))
+        return entries
+
+
+def read_log(filename):
+    """
+    Read a logger log file (JSON lines) including its rotated segments (see testit_logwriter.py).
+
+    Returns:
+    list of entries or None if the file could not be read
+    """
+    try:
+        entries = []
+        for index, segment in testit_logwriter.segments(filename):
+            with gzip.open(segment, 'rb') as f:
+                entries += [json.loads(line.decode('utf-8')) for line in f if line.strip() != b""]
+        with open(filename, 'r') as f:
+            return entries + [json.loads(line) for line in f if line.strip() != ""]
+    except (IOError, ValueError) as e:
+        rospy.logerr("Unable to read log file '%s': %s" % (filename, e))
+        return None
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import json
+import gzip
+import shutil
+import time
+import os
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+FSYNC_POLICIES = ("never", "flush", "rotate")
+DROP_REPORT_INTERVAL = 5.0
+
+
+def segments(filename):
+    """
+    Returns:
+    list of (index, path) of the rotated (compressed) segments of log 'filename', oldest first
+    """
+    directory, basename = os.path.split(filename)
+    found = []
+    try:
+        names = os.listdir(directory or ".")
+    except OSError:
+        return found
+    for name in names:
+        index = name[len(basename) + 1:-3]
+        if name.startswith(basename + ".") and name.endswith(".gz") and index.isdigit():
+            found.append((int(index), os.path.join(directory, name)))
+    return sorted(found)
+
+
+class LogWriter(object):
+    """
+    Asynchronous JSON lines log writer.
+
+    Entries are put to a bounded queue and written by a writer thread, so the callers (e.g., the proxy callbacks of
+    the logger) never wait for the disk. The file is kept open and flushed after 'batch_size' entries or
+    'flush_interval' seconds, whichever comes first. If the queue is full, the entry is dropped and counted instead of
+    blocking the caller. When the log grows over 'rotate_size' bytes, it is moved to the next segment
+    ('[filename].1.gz', '[filename].2.gz', ...) and compressed. Values that are not JSON serializable (e.g., ROS
+    messages) are converted with 'default' in the writer thread.
+    """
+    def __init__(self, filename, queue_size=10000, batch_size=100, flush_interval=0.5, fsync="never",
+                 rotate_size=0, default=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError("Unknown fsync policy '%s' (expected one of %s)" % (fsync, ", ".join(FSYNC_POLICIES)))
+        self.filename = filename
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rotate_size = rotate_size
+        self.default = default
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.reported = 0
+        self.reported_time = 0.0
+        self.written = 0
+        existing = segments(filename)
+        self.segment = existing[-1][0] if len(existing) > 0 else 0
+        self.file = open(filename, 'a')
+        self.closed = False
+        self.thread = threading.Thread(target=self.run, name="testit_logwriter")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, entry):
+        """
+        Queue an entry (dict) to be written.
+
+        Returns:
+        True if queued, False if the entry was dropped (queue is full or the writer is closed)
+        """
+        if not self.closed:
+            try:
+                self.queue.put_nowait(entry)
+                return True
+            except queue.Full:
+                pass
+        self.lock.acquire()
+        try:
+            self.dropped += 1
+        finally:
+            self.lock.release()
+        return False
+
+    def close(self, timeout=10.0):
+        """
+        Write the queued entries and close the log.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        # Wake up the writer thread (the sentinel is queued after the pending entries)
+        while self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join(timeout)
+        self.report_dropped()
+
+    def report_dropped(self, interval=0.0):
+        """
+        Warn about the entries dropped since the last report (at most once per 'interval' seconds).
+        """
+        if time.time() < self.reported_time + interval:
+            return
+        self.lock.acquire()
+        try:
+            dropped = self.dropped - self.reported
+            self.reported = self.dropped
+        finally:
+            self.lock.release()
+        if dropped > 0:
+            self.reported_time = time.time()
+            rospy.logwarn("Log writer queue full, dropped %s entries (%s in total)" % (dropped, self.reported))
+
+    def run(self):
+        pending = 0
+        deadline = None
+        running = True
+        while running:
+            try:
+                if deadline is None:
+                    entry = self.queue.get()
+                else:
+                    entry = self.queue.get(timeout=max(0.0, deadline - time.time()))
+            except queue.Empty:
+                entry = False
+            lines = []
+            while entry is not False:
+                if entry is None:
+                    running = False
+                    break
+                try:
+                    lines.append(json.dumps(entry, default=self.default) + "\n")
+                except (TypeError, ValueError) as e:
+                    rospy.logerr("Unable to serialize log entry: %s" % e)
+                if len(lines) >= self.batch_size:
+                    break
+                try:
+                    entry = self.queue.get_nowait()
+                except queue.Empty:
+                    entry = False
+            try:
+                if len(lines) > 0:
+                    self.file.write("".join(lines))
+                    self.written += len(lines)
+                    pending += len(lines)
+                    if deadline is None:
+                        deadline = time.time() + self.flush_interval
+                if pending > 0 and (pending >= self.batch_size or time.time() >= deadline or not running):
+                    self.flush(self.fsync == "flush")
+                    pending = 0
+                    deadline = None
+                    if self.rotate_size > 0 and self.file.tell() >= self.rotate_size:
+                        self.rotate()
+            except (IOError, OSError) as e:
+                rospy.logerr("Unable to write log file '%s': %s" % (self.filename, e))
+            self.report_dropped(DROP_REPORT_INTERVAL)
+        try:
+            self.flush(self.fsync != "never")
+        except (IOError, OSError) as e:
+            rospy.logerr("Unable to write log file '%s': %s" % (self.filename, e))
+        self.file.close()
+
+    def flush(self, sync):
+        self.file.flush()
+        if sync:
+            os.fsync(self.file.fileno())
+
+    def rotate(self):
+        """
+        Move the current log to the next compressed segment and start a new log.
+        """
+        self.flush(self.fsync != "never")
+        self.file.close()
+        self.segment += 1
+        segment = "%s.%s" % (self.filename, self.segment)
+        os.rename(self.filename, segment)
+        self.file = open(self.filename, 'a')
+        with open(segment, 'rb') as source:
+            with gzip.open(segment + ".gz", 'wb') as target:
+                shutil.copyfileobj(source, target)
+        os.remove(segment)
+        rospy.loginfo("Rotated log to '%s.gz'" % segment)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import threading
+import time
+import os
+
+# Upper bounds (seconds) of the duration histogram buckets, bringup and test phases can take minutes
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def format_labels(labels):
+    """
+    Returns:
+    Prometheus label set string (e.g., '{pipeline="Pipeline-1",phase="runSUT"}') for a sorted label tuple
+    """
+    if len(labels) == 0:
+        return ""
+    return "{" + ",".join(['%s="%s"' % (name, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace(
+        "\n", "\\n")) for name, value in labels]) + "}"
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram(object):
+    """
+    Cumulative duration histogram with fixed bucket upper bounds.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of histograms, counters and gauges rendered in the Prometheus text exposition format.
+
+    Metric samples are identified by the metric name and a dictionary of labels.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.types = {}  # {name: (type, help)}
+        self.samples = {}  # {name: {labels: Histogram or value}}
+        self.active = {}  # {(name, labels): time when tracking started}
+
+    def declare(self, name, metric_type, help_text):
+        self.lock.acquire()
+        try:
+            self.types[name] = (metric_type, help_text)
+            self.samples.setdefault(name, {})
+        finally:
+            self.lock.release()
+
+    def key(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def observe(self, name, value, labels={}):
+        """
+        Add a value (seconds) to the histogram of the labeled metric.
+        """
+        self.lock.acquire()
+        try:
+            histograms = self.samples.setdefault(name, {})
+            key = self.key(labels)
+            if key not in histograms:
+                histograms[key] = Histogram(self.buckets)
+            histograms[key].observe(value)
+        finally:
+            self.lock.release()
+
+    def increment(self, name, value=1, labels={}):
+        self.lock.acquire()
+        try:
+            counters = self.samples.setdefault(name, {})
+            key = self.key(labels)
+            counters[key] = counters.get(key, 0) + value
+        finally:
+            self.lock.release()
+
+    def set(self, name, value, labels={}):
+        self.lock.acquire()
+        try:
+            self.samples.setdefault(name, {})[self.key(labels)] = value
+        finally:
+            self.lock.release()
+
+    def track(self, name, active, labels={}):
+        """
+        Accumulate the seconds spent in the active state in counter 'name' (e.g., pipeline busy time).
+
+        Arguments:
+        active -- True when the tracked state is entered, False when it is left
+        """
+        key = self.key(labels)
+        now = time.time()
+        self.lock.acquire()
+        try:
+            counters = self.samples.setdefault(name, {})
+            counters.setdefault(key, 0.0)
+            started = self.active.pop((name, key), None)
+            if started is not None:
+                counters[key] += now - started
+            if active:
+                self.active[(name, key)] = now
+        finally:
+            self.lock.release()
+
+    def render(self):
+        """
+        Returns:
+        the metrics in Prometheus text exposition format
+        """
+        now = time.time()
+        lines = []
+        self.lock.acquire()
+        try:
+            for name in sorted(self.samples):
+                metric_type, help_text = self.types.get(name, ('untyped', ""))
+                if help_text != "":
+                    lines.append("# HELP %s %s" % (name, help_text))
+                lines.append("# TYPE %s %s" % (name, metric_type))
+                for key in sorted(self.samples[name]):
+                    sample = self.samples[name][key]
+                    if isinstance(sample, Histogram):
+                        for bound, count in zip(sample.buckets + [float('inf')], sample.counts + [sample.count]):
+                            lines.append("%s_bucket%s %s" % (name, format_labels(key + (('le', format_value(bound)),)),
+                                                             count))
+                        lines.append("%s_sum%s %s" % (name, format_labels(key), format_value(sample.sum)))
+                        lines.append("%s_count%s %s" % (name, format_labels(key), sample.count))
+                    else:
+                        started = self.active.get((name, key), None)
+                        if started is not None:
+                            sample += now - started
+                        lines.append("%s%s %s" % (name, format_labels(key), format_value(sample)))
+        finally:
+            self.lock.release()
+        return "\n".join(lines) + "\n"
+
+    def write(self, filename, text=None):
+        """
+        Write the metrics to 'filename' (e.g., for the node exporter textfile collector).
+
+        The file is replaced atomically so that scrapers never read a partially written file.
+
+        Arguments:
+        text -- already rendered metrics (rendered if None)
+        """
+        if text is None:
+            text = self.render()
+        temp_filename = "%s.%s.tmp" % (filename, threading.current_thread().ident)
+        with open(temp_filename, 'w') as outfile:
+            outfile.write(text)
+        os.rename(temp_filename, filename)
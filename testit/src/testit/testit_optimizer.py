@@ -37,6 +37,7 @@
 import rospy
 import sys
 import hashlib
+import json
 import random
 
 class Optimizer:
@@ -142,7 +143,11 @@ class Optimizer:
                 elif entry['event'] == "POST":
                     # Only process after receiving "POST"
                     state_vector[channel] = str(entry['data'])
-                    new_state = self.get_list_hash(state_vector.values())
+                    if len(entry.get('outputs', {})) > 0:
+                        # Monitored output values (see testit_outputs.py) are additional state dimensions
+                        new_state = self.get_list_hash(state_vector.values() + [json.dumps(entry['outputs'], sort_keys=True)])
+                    else:
+                        new_state = self.get_list_hash(state_vector.values())
                     self.state_hashes[new_state] = (state_vector, entry['data'])
                     edges = graph.get(current_state, [])
                     entry = self.flatten_coverage(entry)
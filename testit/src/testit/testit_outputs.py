@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import operator
+import collections
+import array
+
+MODES = ("min", "max", "avg")
+
+
+class RingBuffer(object):
+    """
+    Fixed size numeric ring buffer that keeps the minimum, maximum or average of its values.
+
+    The values are stored in a preallocated array. The average is kept as a running sum (recomputed from the array
+    when the buffer wraps around, so rounding errors do not accumulate) and the minimum/maximum with a monotonic queue
+    of the candidates, so adding a value and reading the aggregate are O(1) amortized.
+    """
+    def __init__(self, size, mode="max"):
+        if mode not in MODES:
+            raise ValueError("Unknown buffer mode '%s' (expected one of %s)" % (mode, ", ".join(MODES)))
+        self.size = max(1, int(size))
+        self.mode = mode
+        self.values = array.array('d', [0.0] * self.size)
+        self.count = 0
+        self.index = 0
+        self.total = 0.0
+        self.sequence = 0
+        self.candidates = collections.deque()  # (sequence, value)
+
+    def add(self, value):
+        if self.count == self.size:
+            self.total -= self.values[self.index]
+        else:
+            self.count += 1
+        self.values[self.index] = value
+        self.total += value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+            self.total = sum(self.values[:self.count])
+        if self.mode == "max":
+            while len(self.candidates) > 0 and self.candidates[-1][1] <= value:
+                self.candidates.pop()
+        elif self.mode == "min":
+            while len(self.candidates) > 0 and self.candidates[-1][1] >= value:
+                self.candidates.pop()
+        if self.mode != "avg":
+            self.candidates.append((self.sequence, value))
+            if self.candidates[0][0] <= self.sequence - self.size:
+                self.candidates.popleft()
+        self.sequence += 1
+
+    def aggregate(self):
+        """
+        Returns:
+        the minimum, maximum or average of the buffer values or None if the buffer is empty
+        """
+        if self.count == 0:
+            return None
+        if self.mode == "avg":
+            return self.total / self.count
+        return self.candidates[0][1]
+
+
+class OutputMonitor(object):
+    """
+    Monitored values of a logger output channel (see 'outputs' in cfg/logger.yaml).
+
+    Every configured field (e.g., "pose.position.x") has a ring buffer of 'buffer.size' values that is updated at most
+    'buffer.hz' times per second. The values are the buffer aggregates ('buffer.mode') rounded to the field
+    'resolution'.
+    """
+    def __init__(self, channel):
+        buffer = channel.get('buffer', None) or {}
+        self.identifier = channel.get('identifier', "")
+        hz = buffer.get('hz', 1)
+        self.period = 1.0 / hz if hz > 0 else 0.0
+        self.updated = None
+        self.lock = threading.Lock()
+        self.fields = []
+        for field in channel.get('resolution', None) or []:
+            name = field.get('field', "")
+            if name == "":
+                continue
+            self.fields.append((name, operator.attrgetter(name), field.get('resolution', 0.0),
+                                RingBuffer(buffer.get('size', 1), buffer.get('mode', "max"))))
+
+    def update(self, message, now):
+        """
+        Add the field values of 'message' (received at 'now' seconds) unless the buffer was updated less than
+        1/hz seconds ago.
+        """
+        if self.updated is not None and now < self.updated + self.period:
+            return False
+        self.lock.acquire()
+        try:
+            self.updated = now
+            for name, get, resolution, buffer in self.fields:
+                try:
+                    buffer.add(float(get(message)))
+                except (AttributeError, TypeError, ValueError) as e:
+                    rospy.logerr_throttle(10, "Unable to monitor field '%s' of '%s': %s" % (name, self.identifier, e))
+            return True
+        finally:
+            self.lock.release()
+
+    def values(self):
+        """
+        Returns:
+        dict of the rounded aggregate values of the fields ({field: value}), empty if nothing has been received
+        """
+        values = {}
+        self.lock.acquire()
+        try:
+            for name, get, resolution, buffer in self.fields:
+                value = buffer.aggregate()
+                if value is not None:
+                    values[name] = round_value(value, resolution)
+        finally:
+            self.lock.release()
+        return values
+
+
+def round_value(value, resolution):
+    """
+    Round 'value' to the closest multiple of 'resolution' (e.g., 19.26 -> 19.3 with resolution 0.1).
+    """
+    if not resolution:
+        return value
+    return round(round(value / resolution) * resolution, 10)
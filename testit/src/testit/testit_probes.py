@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+"""
+Readiness probes for *FinishTrigger configuration values.
+
+Supported triggers (evaluated inside the daemon process):
+  tcp://host:port -- TCP port accepts connections
+  rosmaster://host:port -- ROS master is reachable
+  topic://host:port/topic/name -- topic is advertised at the ROS master
+  service://host:port/service/name -- service is advertised at the ROS master
+  file:///path/to/file -- file exists (on the daemon host)
+  docker://container -- docker container is healthy (or running if no healthcheck is defined, on the daemon host)
+Any other value is executed as a shell command (ready when it returns 0).
+"""
+
+import os
+import re
+import json
+import socket
+import subprocess
+import time
+try:
+    import xmlrpclib
+    import httplib
+except ImportError:
+    import xmlrpc.client as xmlrpclib
+    import http.client as httplib
+
+CALLER_ID = '/testit_daemon_probe'
+
+
+class TimeoutTransport(xmlrpclib.Transport):
+    """
+    XML-RPC transport with a socket timeout.
+    """
+    def __init__(self, timeout):
+        xmlrpclib.Transport.__init__(self)
+        self.timeout = timeout
+
+    def make_connection(self, host):
+        connection = xmlrpclib.Transport.make_connection(self, host)
+        connection.timeout = self.timeout
+        return connection
+
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    def __init__(self, path, timeout=1.0):
+        httplib.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def split_host_port(location, default_port):
+    host, _, port = location.partition(":")
+    return host, int(port) if port != "" else default_port
+
+
+def master_proxy(location):
+    host, port = split_host_port(location, 11311)
+    # Socket timeout, so an unreachable master does not block the trigger wait
+    return xmlrpclib.ServerProxy("http://%s:%s/" % (host, port), transport=TimeoutTransport(1.0))
+
+
+def tcp_probe(target):
+    host, port = split_host_port(target, 80)
+
+    def probe():
+        try:
+            socket.create_connection((host, port), 1.0).close()
+            return True
+        except (socket.error, socket.timeout):
+            return False
+    return probe
+
+
+def rosmaster_probe(target):
+    def probe():
+        try:
+            code, _, _ = master_proxy(target).getPid(CALLER_ID)
+            return code == 1
+        except Exception:
+            return False
+    return probe
+
+
+def topic_probe(target):
+    location, _, name = target.partition("/")
+    name = "/" + name
+
+    def probe():
+        try:
+            code, _, topics = master_proxy(location).getPublishedTopics(CALLER_ID, "")
+            return code == 1 and name in [topic[0] for topic in topics]
+        except Exception:
+            return False
+    return probe
+
+
+def service_probe(target):
+    location, _, name = target.partition("/")
+    name = "/" + name
+
+    def probe():
+        try:
+            code, _, _ = master_proxy(location).lookupService(CALLER_ID, name)
+            return code == 1
+        except Exception:
+            return False
+    return probe
+
+
+def file_probe(target):
+    return lambda: os.path.exists(target)
+
+
+def docker_probe(target):
+    def probe():
+        try:
+            connection = UnixHTTPConnection("/var/run/docker.sock")
+            connection.request("GET", "/containers/%s/json" % target)
+            response = connection.getresponse()
+            data = response.read()
+            connection.close()
+            if response.status != 200:
+                return False
+            state = json.loads(data).get('State', {})
+            health = state.get('Health', None)
+            if health is not None:
+                return health.get('Status', "") == "healthy"
+            return state.get('Running', False)
+        except Exception:
+            return False
+    return probe
+
+
+PROBES = {'tcp': tcp_probe,
+          'rosmaster': rosmaster_probe,
+          'topic': topic_probe,
+          'service': service_probe,
+          'file': file_probe,
+          'docker': docker_probe}
+
+
+def get_probe(trigger):
+    """
+    Returns:
+    tuple (probe function, True if built-in probe) for the trigger, probe function returns True when ready
+    """
+    m = re.match('^([a-z]+)://(.*)$', str(trigger))
+    if m is not None and m.group(1) in PROBES:
+        return PROBES[m.group(1)](m.group(2)), True
+    return (lambda: subprocess.call(trigger, shell=True) == 0), False
+
+
+def wait(trigger, timeout=0, abort=None, initial_interval=0.005, max_interval=0.1, shell_interval=1.0):
+    """
+    Wait until the trigger reports readiness.
+
+    Built-in probes are polled with exponential backoff (capped at max_interval), shell triggers every
+    shell_interval seconds.
+
+    Arguments:
+    timeout -- seconds to wait (0 for no timeout)
+    abort -- optional function, waiting is stopped if it returns True
+
+    Returns:
+    True if ready, False if timed out or aborted
+    """
+    probe, builtin = get_probe(trigger)
+    interval = initial_interval if builtin else shell_interval
+    start_time = time.time()
+    while abort is None or not abort():
+        if probe():
+            return True
+        elapsed = time.time() - start_time
+        if timeout != 0 and elapsed >= timeout:
+            break
+        time.sleep(interval if timeout == 0 else max(0.0, min(interval, timeout - elapsed)))
+        if builtin:
+            interval = min(interval * 2, max_interval)
+    return False
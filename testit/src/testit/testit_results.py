@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import sqlite3
+import json
+import math
+import os
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scenario TEXT NOT NULL,
+    pipeline TEXT,
+    mode TEXT,
+    uuid TEXT,
+    test_uuid TEXT,
+    start REAL,
+    end REAL,
+    duration REAL,
+    verdict INTEGER,
+    timings TEXT,
+    artifacts TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario, id);
+"""
+
+COLUMNS = ('scenario', 'pipeline', 'mode', 'uuid', 'test_uuid', 'start', 'end', 'duration', 'verdict', 'timings',
+           'artifacts')
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile.
+
+    Arguments:
+    values -- sorted list of numbers
+    p -- percentile (0..100)
+    """
+    if len(values) == 0:
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class RunStore(object):
+    """
+    Persistent store of test runs (one row per executed credit).
+
+    Recorded runs are buffered in memory and written to the SQLite database in batches, either when 'batch_size'
+    runs are pending or every 'flush_interval' seconds. Queries flush pending runs first.
+    """
+    def __init__(self, filename=":memory:", batch_size=20, flush_interval=5.0):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.pending = []
+        self.connection = None
+        self.open()
+        self.stopped = threading.Event()
+        self.writer = threading.Thread(target=self.writer_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def open(self):
+        self.lock.acquire()
+        try:
+            if self.filename != ":memory:":
+                directory = os.path.dirname(self.filename)
+                if directory != "" and not os.path.isdir(directory):
+                    os.makedirs(directory)
+            self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+            self.connection.row_factory = sqlite3.Row
+            self.connection.executescript(SCHEMA)
+            self.connection.commit()
+            rospy.loginfo("Using results database '%s'" % self.filename)
+        finally:
+            self.lock.release()
+
+    def reopen(self):
+        """
+        Reopen the database (e.g., after the data directory has been cleaned), pending runs are discarded.
+        """
+        self.lock.acquire()
+        try:
+            self.pending = []
+            if self.connection is not None:
+                self.connection.close()
+            self.open()
+        finally:
+            self.lock.release()
+
+    def close(self):
+        self.stopped.set()
+        self.writer.join()
+        self.lock.acquire()
+        try:
+            self.flush()
+            self.connection.close()
+            self.connection = None
+        finally:
+            self.lock.release()
+
+    def writer_loop(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                rospy.logerr("Unable to write test runs to '%s': %s" % (self.filename, e))
+
+    def record(self, scenario, pipeline, mode, uuid, test_uuid, start, end, verdict, timings={}, artifacts={}):
+        """
+        Queue a run to be written to the database.
+
+        Arguments:
+        start, end -- run start and end time in seconds (float)
+        verdict -- True (pass), False (fail) or None (no verdict)
+        timings -- dictionary of phase durations in seconds
+        artifacts -- dictionary of artifact paths
+        """
+        duration = None
+        if start is not None and end is not None:
+            duration = max(end - start, 0.0)
+        if verdict is not None:
+            verdict = 1 if verdict else 0
+        row = (scenario, pipeline, mode, uuid, test_uuid, start, end, duration, verdict, json.dumps(timings),
+               json.dumps(artifacts))
+        self.lock.acquire()
+        try:
+            self.pending.append(row)
+            if len(self.pending) >= self.batch_size:
+                try:
+                    self.flush()
+                except sqlite3.Error as e:
+                    # The runs stay pending and are written by the next flush
+                    rospy.logerr("Unable to write test runs to '%s': %s" % (self.filename, e))
+        finally:
+            self.lock.release()
+
+    def flush(self):
+        """
+        Write all pending runs to the database in a single transaction.
+        """
+        self.lock.acquire()
+        try:
+            if len(self.pending) == 0 or self.connection is None:
+                return
+            with self.connection:
+                self.connection.executemany("INSERT INTO runs (" + ", ".join(COLUMNS) + ") VALUES (" +
+                                            ", ".join(["?"] * len(COLUMNS)) + ")", self.pending)
+            self.pending = []
+        finally:
+            self.lock.release()
+
+    def query(self, sql, args=()):
+        self.lock.acquire()
+        try:
+            self.flush()
+            return [self.to_dict(row) for row in self.connection.execute(sql, args).fetchall()]
+        finally:
+            self.lock.release()
+
+    def to_dict(self, row):
+        run = dict(zip(row.keys(), tuple(row)))
+        for key in ('timings', 'artifacts'):
+            if key in run:
+                run[key] = json.loads(run[key]) if run[key] else {}
+        if run.get('verdict', None) is not None:
+            run['verdict'] = run['verdict'] == 1
+        return run
+
+    def latest(self, scenario):
+        """
+        Returns:
+        the most recent run of the scenario as a dictionary or None
+        """
+        runs = self.query("SELECT * FROM runs WHERE scenario = ? ORDER BY id DESC LIMIT 1", (scenario,))
+        return runs[0] if len(runs) > 0 else None
+
+    def runs(self, scenario, page_size=100):
+        """
+        Iterate over all recorded runs of the scenario (oldest first), fetching 'page_size' rows at a time.
+        """
+        last_id = 0
+        while True:
+            page = self.query("SELECT * FROM runs WHERE scenario = ? AND id > ? ORDER BY id LIMIT ?",
+                              (scenario, last_id, page_size))
+            for run in page:
+                yield run
+            if len(page) < page_size:
+                break
+            last_id = page[-1]['id']
+
+    def statistics(self, scenario):
+        """
+        Returns:
+        dictionary with the number of runs, passes, failures, pass rate and duration percentiles of the scenario
+        """
+        counts = self.query("SELECT COUNT(*) AS runs, SUM(verdict = 1) AS passed, SUM(verdict = 0) AS failed "
+                            "FROM runs WHERE scenario = ?", (scenario,))[0]
+        durations = [row['duration'] for row in self.query(
+            "SELECT duration FROM runs WHERE scenario = ? AND duration IS NOT NULL ORDER BY duration", (scenario,))]
+        passed = counts['passed'] or 0
+        failed = counts['failed'] or 0
+        statistics = {'runs': counts['runs'], 'passed': passed, 'failed': failed, 'pass_rate': None}
+        if passed + failed > 0:
+            statistics['pass_rate'] = float(passed) / (passed + failed)
+        for p in (50, 90, 99):
+            statistics['p%s' % p] = percentile(durations, p)
+        return statistics
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+import rospy
+import threading
+import heapq
+import itertools
+
+
+class WorkItem(object):
+    """
+    A pending (scenario, credit) request waiting for a pipeline.
+    """
+    def __init__(self, tag, priority, pipeline, sequence, callback=None):
+        self.tag = tag
+        self.priority = priority
+        self.pipeline = pipeline  # requested pipeline ("" = any)
+        self.sequence = sequence
+        self.assigned = None
+        self.callback = callback
+        self.event = threading.Event()
+
+    def key(self):
+        # Higher priority first, FIFO within the same priority
+        return (-self.priority, self.sequence)
+
+
+class Scheduler(object):
+    """
+    Priority scheduler for assigning free pipelines to queued test scenarios.
+
+    Queued items are kept in priority queues (one shared queue for items that accept any pipeline and one queue per
+    requested pipeline). Whenever a pipeline becomes free, it is handed directly to the best waiting item and only
+    that item's thread is woken up.
+    """
+    def __init__(self, pipelines):
+        self.lock = threading.Lock()
+        self.counter = itertools.count()
+        self.free = []
+        self.queues = {"": []}
+        for pipeline in pipelines:
+            self.queues[pipeline] = []
+
+    def top(self, pipeline):
+        """
+        Return the best live item in the queue of 'pipeline' (lazily dropping already assigned items).
+        """
+        queue = self.queues.get(pipeline, [])
+        while len(queue) > 0 and queue[0][2].assigned is not None:
+            heapq.heappop(queue)
+        if len(queue) > 0:
+            return queue[0][2]
+        return None
+
+    def best_item(self, pipeline):
+        """
+        Return the best waiting item that is allowed to run in 'pipeline' or None.
+        """
+        candidates = [item for item in (self.top(""), self.top(pipeline)) if item is not None]
+        if len(candidates) == 0:
+            return None
+        return min(candidates, key=lambda item: item.key())
+
+    def dispatch(self):
+        """
+        Assign free pipelines to the best waiting items (must be called with lock held).
+
+        Returns:
+        list of items that were assigned a pipeline
+        """
+        assigned = []
+        for pipeline in list(self.free):
+            item = self.best_item(pipeline)
+            if item is not None:
+                item.assigned = pipeline
+                self.free.remove(pipeline)
+                assigned.append(item)
+        return assigned
+
+    def notify(self, items):
+        """
+        Wake up the assigned items (called without lock held, so callbacks may use the scheduler).
+        """
+        for item in items:
+            item.event.set()
+            if item.callback is not None:
+                item.callback(item.assigned)
+
+    def submit(self, tag, priority=0, pipeline="", callback=None):
+        """
+        Queue the scenario without blocking.
+
+        Arguments:
+        callback -- function called with the pipeline tag once a pipeline has been assigned
+
+        Returns:
+        the queued WorkItem
+        """
+        if pipeline != "" and pipeline not in self.queues:
+            rospy.logwarn("Unknown pipeline '%s' requested by test '%s', using any pipeline!" % (pipeline, tag))
+            pipeline = ""
+        self.lock.acquire()
+        try:
+            item = WorkItem(tag, priority, pipeline, next(self.counter), callback)
+            heapq.heappush(self.queues[pipeline], (item.key()[0], item.key()[1], item))
+            assigned = self.dispatch()
+        finally:
+            self.lock.release()
+        self.notify(assigned)
+        return item
+
+    def acquire(self, tag, priority=0, pipeline=""):
+        """
+        Queue the scenario and block until a pipeline has been assigned to it.
+
+        Returns:
+        pipeline tag
+        """
+        item = self.submit(tag, priority, pipeline)
+        while not item.event.wait(30.0):
+            rospy.logwarn('Test \'%s\' (priority %s) waiting for a free pipeline...' % (tag, priority))
+        return item.assigned
+
+    def release(self, pipeline):
+        """
+        Mark the pipeline as free and hand it to the best waiting item (if any).
+        """
+        self.lock.acquire()
+        try:
+            if pipeline not in self.free:
+                self.free.append(pipeline)
+            assigned = self.dispatch()
+        finally:
+            self.lock.release()
+        self.notify(assigned)
+
+    def disable(self, pipeline):
+        """
+        Mark the pipeline as unavailable (e.g., during bringup or teardown).
+        """
+        self.lock.acquire()
+        try:
+            if pipeline in self.free:
+                self.free.remove(pipeline)
+        finally:
+            self.lock.release()
+
+    def higher_priority_waiting(self, pipeline, priority):
+        """
+        Returns:
+        True if an item with higher priority than 'priority' is waiting for 'pipeline'
+        """
+        self.lock.acquire()
+        try:
+            item = self.best_item(pipeline)
+            return item is not None and item.priority > priority
+        finally:
+            self.lock.release()
+
+    def queued(self):
+        """
+        Returns:
+        number of items waiting for a pipeline
+        """
+        self.lock.acquire()
+        try:
+            return sum([len([entry for entry in queue if entry[2].assigned is None])
+                        for queue in self.queues.values()])
+        finally:
+            self.lock.release()
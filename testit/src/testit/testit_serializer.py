@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import threading
+import operator
+import re
+
+NUMERIC_TYPES = ('bool', 'byte', 'char', 'int8', 'uint8', 'int16', 'uint16', 'int32', 'uint32', 'int64', 'uint64',
+                 'float32', 'float64')
+TIME_TYPES = ('time', 'duration')
+ARRAY = re.compile(r'\[[^\]]*\]$')
+
+plans = {}
+plans_lock = threading.Lock()
+
+
+def serialize(message):
+    """
+    Convert a ROS message to a JSON compatible dictionary (fields of nested messages are dictionaries, time and
+    duration are {"secs": ..., "nsecs": ...} and arrays are lists).
+
+    The fields are read with a plan that is compiled from '__slots__' and '_slot_types' when the message type is
+    serialized for the first time (see compile_plan).
+
+    Returns:
+    dictionary of the message fields
+    """
+    plan = plans.get(message.__class__, None)
+    if plan is None:
+        plan = get_plan(message.__class__)
+    return plan(message)
+
+
+def get_plan(message_class):
+    plans_lock.acquire()
+    try:
+        plan = plans.get(message_class, None)
+        if plan is None:
+            plan = compile_plan(message_class)
+            plans[message_class] = plan
+        return plan
+    finally:
+        plans_lock.release()
+
+
+def compile_plan(message_class):
+    """
+    Compile the field plan of a message type: fields that are stored as is (numbers, strings) are read with one
+    attribute getter and the other fields are converted by the converter selected for their type.
+
+    Returns:
+    function converting a message of 'message_class' to a dictionary
+    """
+    if not hasattr(message_class, '_slot_types'):
+        return convert_value
+    plain = []
+    converted = []
+    for name, field_type in zip(message_class.__slots__, message_class._slot_types):
+        converter = get_converter(field_type)
+        if converter is None:
+            plain.append(name)
+        else:
+            converted.append((name, operator.attrgetter(name), converter))
+    plain = tuple(plain)
+    converted = tuple(converted)
+    if len(plain) == 0:
+        getter = lambda message: ()
+    elif len(plain) == 1:
+        single = operator.attrgetter(plain[0])
+        getter = lambda message: (single(message),)
+    else:
+        getter = operator.attrgetter(*plain)
+
+    def plan(message):
+        dictionary = dict(zip(plain, getter(message)))
+        for name, get, converter in converted:
+            dictionary[name] = converter(get(message))
+        return dictionary
+    return plan
+
+
+def get_converter(field_type):
+    """
+    Returns:
+    function converting a field value of 'field_type' or None if the value is stored as is
+    """
+    if field_type in NUMERIC_TYPES or field_type == 'string':
+        return None
+    if field_type in TIME_TYPES:
+        return convert_time
+    if ARRAY.search(field_type) is not None:
+        element_type = ARRAY.sub('', field_type)
+        if element_type in ('uint8', 'char'):
+            return convert_binary
+        if element_type in NUMERIC_TYPES or element_type == 'string':
+            return convert_numeric_array
+        if element_type in TIME_TYPES:
+            return lambda value: [convert_time(element) for element in value]
+        return lambda value: [serialize(element) for element in value]
+    return serialize
+
+
+def convert_time(value):
+    return {'secs': value.secs, 'nsecs': value.nsecs}
+
+
+def convert_binary(value):
+    # uint8[] and char[] are str/bytes (or lists when set by the user)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return list(bytearray(value))
+
+
+def convert_numeric_array(value):
+    # Tuples, lists or numpy arrays (numpy_msg)
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return list(value)
+
+
+def convert_value(value):
+    """
+    Convert a value that is not a ROS message (e.g., a list of messages or a primitive).
+    """
+    if isinstance(value, (list, tuple)):
+        return [convert_value(element) if not hasattr(element, '_slot_types') else serialize(element)
+                for element in value]
+    if isinstance(value, dict):
+        return dict((key, convert_value(element)) for key, element in value.items())
+    if hasattr(value, 'secs') and hasattr(value, 'nsecs'):
+        return convert_time(value)
+    return value
@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+
+import rospy
+import threading
+import itertools
+import socket
+import time
+import concurrent.futures
+import testit_probes
+
+try:
+    from SimpleXMLRPCServer import SimpleXMLRPCServer
+    from SocketServer import ThreadingMixIn
+    import xmlrpclib
+except ImportError:
+    from xmlrpc.server import SimpleXMLRPCServer
+    from socketserver import ThreadingMixIn
+    import xmlrpc.client as xmlrpclib
+
+POLL_WAIT = 5.0  # seconds a worker poll waits for work before returning empty
+RETRY_INTERVAL = 2.0  # seconds between attempts to reach the coordinator
+
+
+def split_address(address):
+    """
+    Returns:
+    (host, port) tuple of a "host:port" address
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+
+class Server(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def connect(address, timeout):
+    # Socket timeout, a lost coordinator must not block a worker forever
+    return xmlrpclib.ServerProxy("http://%s/" % address, transport=testit_probes.TimeoutTransport(timeout),
+                                 allow_none=True)
+
+
+class Coordinator(object):
+    """
+    Coordinator side of sharded execution.
+
+    Worker daemons own the pipelines and poll the coordinator over XML-RPC. Each poll reports the states of the
+    worker's pipelines (and acts as a heartbeat) and returns the messages queued for the worker: runs of single
+    credits ('run'), pipeline releases ('release') and commands ('command', e.g., bringup). Workers report the
+    outcome of each run separately. A worker that has not polled for 'timeout' seconds is lost: its pending runs
+    fail (the credits are not consumed) and its pipelines are reported OFFLINE.
+
+    Arguments:
+    on_states -- function(worker, {pipeline: state}) called on every poll
+    on_lost -- function(worker, [pipelines]) called when a worker is lost
+    """
+    def __init__(self, address, timeout, on_states, on_lost):
+        self.timeout = timeout
+        self.on_states = on_states
+        self.on_lost = on_lost
+        self.lock = threading.Condition()
+        self.counter = itertools.count()
+        self.workers = {}  # {worker: {'seen': time, 'pipelines': [tags]}}
+        self.owners = {}  # {pipeline: worker}
+        self.queues = {}  # {worker: [message]}
+        self.pending = {}  # {run id: {'worker': worker, 'delivered': bool, 'event': Event, 'outcome': dict}}
+        self.running = True
+        host, port = split_address(address)
+        # Only the configured interface, the XML-RPC endpoint is not authenticated
+        self.server = Server((host, port), logRequests=False, allow_none=True)
+        self.server.register_function(self.poll, 'poll')
+        self.server.register_function(self.report, 'report')
+        for target in (self.server.serve_forever, self.monitor):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        rospy.loginfo("Coordinator listening on %s:%s" % (host, port))
+
+    def poll(self, worker, states, running, wait=POLL_WAIT):
+        """
+        Worker poll (XML-RPC).
+
+        Arguments:
+        states -- {pipeline: state} of the worker's pipelines
+        running -- ids of the runs the worker is executing or reporting
+
+        Returns:
+        list of messages for the worker
+        """
+        self.lock.acquire()
+        try:
+            if worker not in self.workers:
+                rospy.loginfo("Worker '%s' connected with pipelines %s" % (worker, sorted(states.keys())))
+                self.queues[worker] = []
+            self.workers[worker] = {'seen': time.time(), 'pipelines': list(states.keys())}
+            for pipeline in states:
+                self.owners[pipeline] = worker
+            # Runs delivered by an earlier poll that the worker does not know about were lost in transit
+            for run_id in list(self.pending):
+                entry = self.pending[run_id]
+                if entry['worker'] == worker and entry['delivered'] and run_id not in running:
+                    rospy.logwarn("Run %s was not received by worker '%s'!" % (run_id, worker))
+                    self.finish(run_id, None)
+        finally:
+            self.lock.release()
+        self.on_states(worker, states)
+        self.lock.acquire()
+        try:
+            deadline = time.time() + wait
+            while self.running and len(self.queues.get(worker, [])) == 0 and time.time() < deadline:
+                self.lock.wait(deadline - time.time())
+            messages = self.queues.get(worker, [])
+            self.queues[worker] = []
+            for message in messages:
+                if message['kind'] == "run" and message['id'] in self.pending:
+                    self.pending[message['id']]['delivered'] = True
+            if worker in self.workers:
+                self.workers[worker]['seen'] = time.time()
+            return messages
+        finally:
+            self.lock.release()
+
+    def report(self, worker, run_id, outcome):
+        """
+        Run outcome (XML-RPC), outcomes of unknown runs (e.g., failed after the worker was lost) are ignored.
+        """
+        self.lock.acquire()
+        try:
+            if run_id in self.pending:
+                self.finish(run_id, outcome)
+            else:
+                rospy.logwarn("Ignoring outcome of unknown run %s from worker '%s'" % (run_id, worker))
+            return True
+        finally:
+            self.lock.release()
+
+    def finish(self, run_id, outcome):
+        # must be called with lock held
+        entry = self.pending.pop(run_id)
+        entry['outcome'] = outcome
+        entry['event'].set()
+
+    def send(self, worker, message):
+        # must be called with lock held
+        self.queues.setdefault(worker, []).append(message)
+        self.lock.notify_all()
+
+    def owner(self, pipeline):
+        self.lock.acquire()
+        try:
+            return self.owners.get(pipeline, None) if self.owners.get(pipeline, None) in self.workers else None
+        finally:
+            self.lock.release()
+
+    def execute(self, pipeline, request):
+        """
+        Execute a credit in the pipeline by its worker (blocking).
+
+        Returns:
+        outcome dict reported by the worker or None if the worker was lost
+        """
+        self.lock.acquire()
+        try:
+            worker = self.owners.get(pipeline, None)
+            if worker not in self.workers:
+                return None
+            run_id = str(next(self.counter))
+            entry = {'worker': worker, 'delivered': False, 'event': threading.Event(), 'outcome': None}
+            self.pending[run_id] = entry
+            self.send(worker, dict(request, kind="run", id=run_id, pipeline=pipeline))
+        finally:
+            self.lock.release()
+        entry['event'].wait()
+        return entry['outcome']
+
+    def release(self, pipeline):
+        """
+        Let the worker release the pipeline (e.g., stop warm containers) after the coordinator freed it.
+        """
+        self.lock.acquire()
+        try:
+            worker = self.owners.get(pipeline, None)
+            if worker in self.workers:
+                self.send(worker, {'kind': "release", 'pipeline': pipeline})
+        finally:
+            self.lock.release()
+
+    def command(self, name, args=""):
+        """
+        Send a command (e.g., "bringup") to all connected workers.
+
+        Returns:
+        list of workers
+        """
+        self.lock.acquire()
+        try:
+            for worker in self.workers:
+                self.send(worker, {'kind': "command", 'name': name, 'args': args})
+            return sorted(self.workers)
+        finally:
+            self.lock.release()
+
+    def status(self):
+        """
+        Returns:
+        {worker: [pipelines]} of the connected workers
+        """
+        self.lock.acquire()
+        try:
+            return dict((worker, sorted(self.workers[worker]['pipelines'])) for worker in self.workers)
+        finally:
+            self.lock.release()
+
+    def monitor(self):
+        while self.running:
+            time.sleep(min(1.0, self.timeout / 4.0))
+            lost = []
+            self.lock.acquire()
+            try:
+                for worker in list(self.workers):
+                    if time.time() - self.workers[worker]['seen'] > self.timeout:
+                        rospy.logerr("Worker '%s' lost (no poll in %s seconds)!" % (worker, self.timeout))
+                        lost.append((worker, self.workers.pop(worker)['pipelines']))
+                        self.queues.pop(worker, None)
+                        for run_id in list(self.pending):
+                            if self.pending[run_id]['worker'] == worker:
+                                self.finish(run_id, None)
+            finally:
+                self.lock.release()
+            for worker, pipelines in lost:
+                self.on_lost(worker, pipelines)
+
+    def close(self):
+        self.lock.acquire()
+        try:
+            self.running = False
+            for run_id in list(self.pending):
+                self.finish(run_id, None)
+            self.lock.notify_all()
+        finally:
+            self.lock.release()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Worker(object):
+    """
+    Worker side of sharded execution: polls the coordinator and executes the messages.
+
+    The messages of each pipeline ('run', 'release') are executed in order in a thread of the pipeline, commands
+    in new threads, so polling continues while they execute.
+
+    Arguments:
+    states -- function returning {pipeline: state} of the worker's pipelines
+    execute -- function(message) executing a 'run' message and returning the outcome dict
+    handle -- function(message) executing 'release' and 'command' messages
+    """
+    def __init__(self, address, name, timeout, states, execute, handle):
+        self.address = address
+        self.name = name
+        self.timeout = timeout
+        self.states = states
+        self.execute = execute
+        self.handle = handle
+        self.executors = {}  # {pipeline: single thread executor}
+        self.running_lock = threading.Lock()
+        self.running_runs = set()
+        self.active = True
+        self.thread = threading.Thread(target=self.loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def running(self):
+        self.running_lock.acquire()
+        try:
+            return list(self.running_runs)
+        finally:
+            self.running_lock.release()
+
+    def loop(self):
+        connected = False
+        while self.active:
+            try:
+                proxy = connect(self.address, POLL_WAIT + self.timeout)
+                messages = proxy.poll(self.name, self.states(), self.running(), min(POLL_WAIT, self.timeout / 3.0))
+            except (socket.error, xmlrpclib.Error) as e:
+                if connected:
+                    rospy.logerr("Lost connection to coordinator at %s: %s" % (self.address, e))
+                connected = False
+                time.sleep(RETRY_INTERVAL)
+                continue
+            if not connected:
+                rospy.loginfo("Connected to coordinator at %s as worker '%s'" % (self.address, self.name))
+                connected = True
+            for message in messages:
+                if message['kind'] == "run":
+                    self.running_lock.acquire()
+                    try:
+                        self.running_runs.add(message['id'])
+                    finally:
+                        self.running_lock.release()
+                    self.pipeline_executor(message['pipeline']).submit(self.run, message)
+                elif message['kind'] == "release":
+                    self.pipeline_executor(message['pipeline']).submit(self.handle, message)
+                else:
+                    thread = threading.Thread(target=self.handle, args=(message,))
+                    thread.daemon = True
+                    thread.start()
+
+    def pipeline_executor(self, pipeline):
+        if pipeline not in self.executors:
+            self.executors[pipeline] = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        return self.executors[pipeline]
+
+    def run(self, message):
+        try:
+            outcome = self.execute(message)
+        except Exception as e:
+            rospy.logerr("Run %s failed: %s" % (message['id'], e))
+            outcome = None
+        try:
+            while self.active:
+                try:
+                    connect(self.address, self.timeout).report(self.name, message['id'], outcome)
+                    return
+                except (socket.error, xmlrpclib.Error) as e:
+                    rospy.logwarn("Unable to report run %s to coordinator: %s" % (message['id'], e))
+                    time.sleep(RETRY_INTERVAL)
+        finally:
+            self.running_lock.acquire()
+            try:
+                self.running_runs.discard(message['id'])
+            finally:
+                self.running_lock.release()
+
+    def close(self):
+        self.active = False
+        for executor in self.executors.values():
+            executor.shutdown(wait=False)
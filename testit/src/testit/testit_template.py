@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Software License Agreement (BSD License)
+#
+# Copyright (c) 2019 Gert Kanter.
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+#  * Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+#  * Redistributions in binary form must reproduce the above
+#    copyright notice, this list of conditions and the following
+#    disclaimer in the documentation and/or other materials provided
+#    with the distribution.
+#  * Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+# FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE
+# COPYRIGHT OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT,
+# INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING,
+# BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT
+# LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN
+# ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
+#
+# Author: Gert Kanter
+
+import rospy
+import re
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+PLACEHOLDER = re.compile(r'\[\[(.*?)\]\]')
+
+
+def compile_value(value):
+    """
+    Split a string into literal and placeholder parts.
+
+    Returns:
+    list of parts (odd indices are placeholder names) or None if the value has no placeholders
+    """
+    parts = PLACEHOLDER.split(value)
+    if len(parts) == 1:
+        return None
+    return parts
+
+
+class Template(object):
+    """
+    Configuration dictionary (e.g., a test scenario) with precompiled '[[key]]' placeholders.
+
+    The placeholders are parsed once, rendering creates a new dictionary and never modifies the source.
+    """
+    def __init__(self, params):
+        self.params = params
+        self.compiled = {}
+        for key in params:
+            value = params[key]
+            if isinstance(value, string_types):
+                parts = compile_value(value)
+                if parts is not None:
+                    self.compiled[key] = parts
+            elif type(value) == list and all([isinstance(x, string_types) for x in value]):
+                parts = [compile_value(x) for x in value]
+                if any([x is not None for x in parts]):
+                    self.compiled[key] = [x if x is not None else [value[i]] for i, x in enumerate(parts)]
+
+    def lookup(self, name, overrides, auxiliary):
+        for source in (overrides, self.params, auxiliary):
+            value = source.get(name, None)
+            if value is not None:
+                return str(value)
+        return None
+
+    def render_parts(self, key, parts, overrides, auxiliary):
+        value = []
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                value.append(part)
+                continue
+            substitution = self.lookup(part, overrides, auxiliary)
+            if substitution is None:
+                rospy.logwarn("Unable to ground substition '%s' key '[[%s]]'" % (key, part))
+                substitution = "[[" + part + "]]"
+            value.append(substitution)
+        return "".join(value)
+
+    def render(self, overrides={}, auxiliary={}):
+        """
+        Render the configuration.
+
+        Placeholders are looked up from overrides first, then from the source dictionary and finally from the
+        auxiliary dictionary (e.g., the pipeline configuration).
+
+        Returns:
+        new dict with the substituted values (overrides are included)
+        """
+        rendered = dict(self.params)
+        rendered.update(overrides)
+        for key in self.compiled:
+            if key in overrides:
+                continue
+            if type(self.params[key]) == list:
+                rendered[key] = [self.render_parts(key, parts, overrides, auxiliary) for parts in self.compiled[key]]
+            else:
+                rendered[key] = self.render_parts(key, self.compiled[key], overrides, auxiliary)
+        return rendered
@@ -34,6 +34,120 @@
 #
 # Author: Gert Kanter
 
+import os
+import threading
+import xml.etree.ElementTree
+
+
+def assignment_signature(text):
+    """
+    Split an Uppaal assignment label into its assignments, e.g., "i_goto_x=1, i_goto_y=2" -> set(["i_goto_x=1", "i_goto_y=2"])
+    """
+    if text is None:
+        return set()
+    return set(["".join(assignment.split()) for assignment in text.split(",") if assignment.strip() != ""])
+
+
+class AnnotatedModel(object):
+    """
+    Parsed Uppaal model with an index from assignments (e.g., "i_goto_x=1") to the transition assignment labels that
+    contain them, so a coverage entry is matched to its transitions without searching all labels.
+
+    The parsed tree is not modified by annotating, the annotations are applied only while writing the model.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.mtime = os.path.getmtime(filename)
+        self.tree = xml.etree.ElementTree.parse(filename)
+        self.lock = threading.Lock()
+        self.assignments = self.tree.findall("./template/transition//*[@kind='assignment']")
+        self.index = {}
+        for i, assignment in enumerate(self.assignments):
+            for signature in assignment_signature(assignment.text):
+                self.index.setdefault(signature, []).append(i)
+
+    def match(self, entry):
+        """
+        Returns:
+        list of indices of the assignment labels matching all variables of the coverage entry
+        """
+        signatures = []
+        for variable_dict in entry['state']:
+            for variable in variable_dict:
+                signatures.append("i_" + entry['name'] + "_" + variable + "=" + str(variable_dict[variable]))
+        if len(signatures) == 0:
+            return range(len(self.assignments))
+        postings = sorted([self.index.get(signature, []) for signature in signatures], key=len)
+        matches = set(postings[0])
+        for posting in postings[1:]:
+            matches.intersection_update(posting)
+        return sorted(matches)
+
+    def annotate(self, trace):
+        """
+        Match the trace entries to transitions, the first matching entry of every transition determines its 'V'.
+
+        Returns:
+        tuple (annotations as {assignment index: V}, maxV)
+        """
+        annotations = {}
+        maxV = 0
+        for entry in trace:
+            success = False
+            for i in self.match(entry):
+                if i not in annotations and "V=" not in self.assignments[i].text:
+                    annotations[i] = entry['sum']
+                    success = True
+            if success and entry['sum'] > maxV:
+                maxV = entry['sum']
+        return annotations, maxV
+
+    def write(self, filename, annotations, maxV):
+        """
+        Write the model with the annotations and the "V" and "maxV" declarations to 'filename'.
+
+        Returns:
+        True if the global declaration was found
+        """
+        self.lock.acquire()
+        try:
+            declaration = self.tree.findall("./declaration")
+            originals = [(assignment, assignment.text) for assignment in self.assignments]
+            if len(declaration) > 0:
+                originals.append((declaration[0], declaration[0].text))
+                declaration[0].text += " int V; const int maxV=" + str(maxV) + ";"
+            try:
+                for i in annotations:
+                    self.assignments[i].text += ", V=" + str(annotations[i])
+                self.tree.write(filename)
+            finally:
+                for element, text in originals:
+                    element.text = text
+            return len(declaration) > 0
+        finally:
+            self.lock.release()
+
+
+models = {}
+models_lock = threading.Lock()
+
+
+def get_annotated_model(filename):
+    """
+    Returns:
+    cached AnnotatedModel of the file (parsed again if the file has changed)
+    """
+    models_lock.acquire()
+    try:
+        model = models.get(filename, None)
+        if model is None or model.mtime != os.path.getmtime(filename):
+            model = AnnotatedModel(filename)
+            models[filename] = model
+        return model
+    finally:
+        models_lock.release()
+
+
 def convert_optimizer_sequence_to_uppaal_synchronizations(sequence):
     """
     Args:
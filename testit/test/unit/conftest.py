@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The daemon modules import each other as top-level modules (e.g., "import testit_common")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "src", "testit"))
@@ -0,0 +1,92 @@
+import io
+import threading
+
+import testit_agent
+
+
+def test_local_agent_round_trip(tmpdir):
+    agent = testit_agent.LocalAgent()
+    try:
+        lines = []
+        assert agent.execute(["sh", "-c", "echo one; echo two"], lines.append) == 0
+        assert lines == ["one\n", "two\n"]
+        assert agent.execute("exit 3") == 3
+        assert agent.capture("echo captured", cwd=str(tmpdir)) == (0, "captured\n")
+        assert agent.capture(["pwd"], cwd=str(tmpdir))[1].strip() == str(tmpdir.realpath())
+        assert agent.batch(["true", "false", ["sh", "-c", "exit 2"]]) == [0, 1, 2]
+        assert agent.capture(["/nonexistent/command"])[0] == 127
+
+        data = bytes(bytearray(range(256))) * (3 * testit_agent.CHUNK_SIZE // 256 + 1)
+        source = tmpdir.join("source.bin")
+        source.write_binary(data)
+        agent.put_file(str(source), str(tmpdir.join("remote.bin")))
+        assert tmpdir.join("remote.bin").read_binary() == data
+        agent.get_file(str(tmpdir.join("remote.bin")), str(tmpdir.join("copy.bin")))
+        assert tmpdir.join("copy.bin").read_binary() == data
+
+        empty = tmpdir.join("empty")
+        empty.write_binary(b"")
+        agent.put_file(str(empty), str(tmpdir.join("remote_empty")))
+        assert tmpdir.join("remote_empty").read_binary() == b""
+    finally:
+        agent.close()
+
+
+def test_local_agent_errors_and_reconnect(tmpdir):
+    agent = testit_agent.LocalAgent()
+    try:
+        try:
+            agent.get_file(str(tmpdir.join("missing")), str(tmpdir.join("copy")))
+            assert False, "AgentError expected"
+        except testit_agent.AgentError as e:
+            assert "missing" in str(e)
+        agent.close()
+        # The next request starts a new connection
+        assert agent.capture("echo again") == (0, "again\n")
+    finally:
+        agent.close()
+
+
+def test_local_agent_partial_callback_errors(tmpdir):
+    agent = testit_agent.LocalAgent()
+    try:
+        def output(line):
+            raise UnicodeEncodeError("ascii", u"\u00e4", 0, 1, "ordinal not in range(128)")
+        try:
+            agent.execute(["echo", "out"], output)
+            assert False, "AgentError expected"
+        except testit_agent.AgentError as e:
+            assert "UnicodeEncodeError" in str(e)
+        # The connection is still usable
+        assert agent.execute(["true"]) == 0
+    finally:
+        agent.close()
+
+
+def test_invalid_replies():
+    class NoisyAgent(testit_agent.LocalAgent):
+        def connect(self):
+            writer, reader = testit_agent.LocalAgent.connect(self)
+            return writer, io.BytesIO(b"Welcome!\n" + reader.readline())
+
+    # Output of the remote shell startup files is a failed start
+    agent = NoisyAgent()
+    try:
+        agent.execute(["true"])
+        assert False, "AgentError expected"
+    except testit_agent.AgentError as e:
+        assert not e.sent
+    # A reply that is not valid JSON fails the pending requests instead of blocking them
+    agent = testit_agent.LocalAgent()
+    try:
+        agent.ensure_connected()
+        call = testit_agent.Call()
+        agent.pending[-1] = call
+        thread = threading.Thread(target=agent.read_replies,
+                                  args=(agent.writer, io.BytesIO(b"{invalid\n"), agent.pending))
+        thread.start()
+        thread.join(5.0)
+        assert call.event.is_set() and call.reply is None
+        assert agent.writer is None
+    finally:
+        agent.close()
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+rosbag = pytest.importorskip("rosbag")
+rospy = pytest.importorskip("rospy")
+std_msgs = pytest.importorskip("std_msgs.msg")
+
+import testit_bagindex
+
+
+def write_bag(filename, times):
+    bag = rosbag.Bag(filename, 'w')
+    try:
+        for t in times:
+            bag.write("/chatter", std_msgs.String(data="%s" % t), rospy.Time.from_sec(t))
+    finally:
+        bag.close()
+
+
+def test_extract_window(tmpdir):
+    first = str(tmpdir.join("first.bag"))
+    second = str(tmpdir.join("second.bag"))
+    write_bag(first, [10, 11, 12])
+    write_bag(second, [100, 101])
+    output = str(tmpdir.join("test_failure_window.bag"))
+    written, sources = testit_bagindex.extract_window([first, second], 10.5, 12.5, output)
+    assert (written, sources) == (2, [first])
+    assert os.path.isfile(output)
+
+
+def test_extract_empty_window_removes_output(tmpdir):
+    bag = str(tmpdir.join("first.bag"))
+    write_bag(bag, [10, 11, 12])
+    output = str(tmpdir.join("test_failure_window.bag"))
+    written, sources = testit_bagindex.extract_window([bag], 50.0, 60.0, output)
+    assert (written, sources) == (0, [])
+    assert not os.path.exists(output)
@@ -0,0 +1,89 @@
+import json
+import os
+
+import testit_collector
+
+
+def make_source(tmpdir, content):
+    source = tmpdir.mkdir("source")
+    source.join("run.bag").write_binary(content)
+    return str(source)
+
+
+def test_collect_and_skip(tmpdir):
+    content = os.urandom(1000)
+    source = make_source(tmpdir, content)
+    data = str(tmpdir.join("data"))
+    collector = testit_collector.BagCollector(data, parallelism=2)
+    assert collector.collect([("P0", source, "", "")]) == (1, 0, 0)
+    with open(os.path.join(data, "run.bag"), 'rb') as f:
+        assert f.read() == content
+    with open(os.path.join(data, "bag_manifest.json"), 'r') as f:
+        manifest = json.load(f)
+    entry = manifest["P0:" + os.path.join(source, "run.bag")]
+    assert (entry['size'], entry['name'], entry['md5']) == (1000, "run.bag", testit_collector.md5sum(
+        os.path.join(data, "run.bag")))
+    # Unchanged bags are not transferred again, bags with the same name from another pipeline are renamed
+    collector = testit_collector.BagCollector(data)
+    assert collector.collect([("P0", source, "", ""), ("P1 x", source, "", "")]) == (1, 1, 0)
+    assert os.path.isfile(os.path.join(data, "P1_x_run.bag"))
+
+
+def test_resume_partial_transfer(tmpdir, monkeypatch):
+    content = os.urandom(1000)
+    source = make_source(tmpdir, content)
+    path = os.path.join(source, "run.bag")
+    data = str(tmpdir.join("data"))
+    collector = testit_collector.BagCollector(data)
+    (listed_path, size, mtime), = collector.list_bags("P0", source, "", "")
+    partial = tmpdir.join("data", ".partial").ensure(dir=True)
+    partial.join("run.bag").write_binary(content[:400])
+    partial.join("run.bag.source").write("P0:%s %s %s" % (path, size, mtime))
+    commands = []
+    call = testit_collector.subprocess.call
+
+    def record(command, **kwargs):
+        commands.append(command)
+        return call(command, **kwargs)
+    monkeypatch.setattr(testit_collector.subprocess, "call", record)
+    assert collector.collect([("P0", source, "", "")]) == (1, 0, 0)
+    assert commands == ["tail -c +401 \"%s\" >> \"%s\"" % (path, partial.join("run.bag"))]
+    with open(os.path.join(data, "run.bag"), 'rb') as f:
+        assert f.read() == content
+    assert not partial.join("run.bag").exists() and not partial.join("run.bag.source").exists()
+
+
+def test_scenario_bags(tmpdir):
+    names = ["1.bag", "1_0.bag", "1_12.bag", "Pipeline_1_1_2.bag", "X_1.bag", "11.bag", "1_failure_window.bag",
+             "window.bag", "T_failure_window.bag", "Pipeline_1_window_0.bag", "1.bag.index.json"]
+    for name in names:
+        tmpdir.join(name).write("")
+    pipelines = ["Pipeline 1", "Pipeline_2"]
+    found = [os.path.basename(path) for path in testit_collector.scenario_bags(str(tmpdir), "1", pipelines)]
+    # Split 1 of scenario "X" and bags of scenario "11" are not bags of scenario "1"
+    assert found == ["1.bag", "1_0.bag", "1_12.bag", "Pipeline_1_1_2.bag"]
+    found = [os.path.basename(path) for path in testit_collector.scenario_bags(str(tmpdir), "window", pipelines)]
+    assert found == ["Pipeline_1_window_0.bag", "window.bag"]
+
+
+def test_checksums_are_verified(tmpdir):
+    content = os.urandom(1000)
+    source = make_source(tmpdir, content)
+    path = os.path.join(source, "run.bag")
+    data = str(tmpdir.join("data"))
+    collector = testit_collector.BagCollector(data)
+    (listed_path, size, mtime), = collector.list_bags("P0", source, "", "")
+    # A partial file of the same source that does not match it is not accepted
+    partial = tmpdir.join("data", ".partial").ensure(dir=True)
+    partial.join("run.bag").write_binary(b"x" * 400)
+    partial.join("run.bag.source").write("P0:%s %s %s" % (path, size, mtime))
+    assert collector.collect([("P0", source, "", "")]) == (0, 0, 1)
+    assert not partial.join("run.bag").exists()
+    assert collector.collect([("P0", source, "", "")]) == (1, 0, 0)
+    # A collected file that no longer matches its checksum is collected again
+    with open(os.path.join(data, "run.bag"), 'r+b') as f:
+        f.write(bytes(bytearray([bytearray(content)[0] ^ 0xff])))
+    assert collector.collect([("P0", source, "", "")]) == (1, 0, 0)
+    with open(os.path.join(data, "run.bag"), 'rb') as f:
+        assert f.read() == content
+    assert collector.collect([("P0", source, "", "")]) == (0, 1, 0)
@@ -0,0 +1,59 @@
+import pytest
+
+import testit_config
+
+SCHEMA = {'configuration': {'runSUTTimeout': 0, 'verbose': False, 'bringupSUT': ''},
+          'pipelines': [{'tag': '', 'sutHost': ''}],
+          'tests': [{'tag': '', 'priority': 0, 'concurrency': 1, 'pipeline': '', 'scenario': []}]}
+
+
+def test_configuration():
+    configuration = testit_config.Configuration(
+        {'runSUTTimeout': 10},
+        {'P0': {'tag': "P0", 'runSUT': ["a", "b"], 'runSUTTimeout': [1, 2], 'verbose': True}},
+        {'T0': {'tag': "T0", 'priority': 5, 'pipeline': ''}}, SCHEMA)
+    assert configuration.configuration.runSUTTimeout == 10
+    pipeline = configuration.pipelines['P0']
+    assert pipeline.steps['runSUT'].command(1) == "b"
+    assert pipeline.steps['runSUT'].timeout(0) == 1
+    assert pipeline.steps['runSUT'].delay(1) == 0
+    assert pipeline.steps['bringupSUT'].command() is None
+    test = configuration.tests['T0']
+    assert (test.priority, test.concurrency, test.pipeline) == (5, 1, '')
+    # Pipeline settings have priority over the test settings
+    resolved = pipeline.resolve({'verbose': False, 'postCommand': None})
+    assert resolved['verbose'] is True
+    assert resolved['postCommand'] == ""
+    assert pipeline.lookup({'verbose': False}, 'verbose') is True
+    with pytest.raises(AttributeError):
+        test.priority = 1
+
+
+def test_configuration_problems():
+    with pytest.raises(testit_config.ConfigurationError) as error:
+        testit_config.Configuration(
+            {'verbose': "yes"},
+            {'P0': {'tag': "P0", 'runSUT': ["a", "b"], 'runSUTTimeout': [1, 2, 3]}},
+            {'T0': {'tag': "T0", 'priority': "high"}}, SCHEMA)
+    problems = error.value.problems
+    assert len(problems) == 3
+    assert "Configuration 'verbose' must be a boolean (is 'yes')" in problems
+    assert "Test 'T0' 'priority' must be a number (is 'high')" in problems
+
+
+def test_add_test():
+    configuration = testit_config.Configuration({}, {}, {}, SCHEMA)
+    with pytest.raises(testit_config.ConfigurationError):
+        configuration.add_test("T1", {'concurrency': True})
+    assert configuration.add_test("T1", {'concurrency': True}, strict=False) != []
+    assert configuration.add_test("T2", {'concurrency': 2, 'priority': ''}) == []
+    assert configuration.tests['T2'].priority == 0
+
+
+def test_pipeline_defaults():
+    defaults = testit_config.pipeline_defaults({'runSUTTimeout': 5, 'runSUTDelay': ''},
+                                               {'configuration': {'runSUTDelay': 3}})
+    assert defaults['runSUTTimeout'] == 5
+    assert defaults['runSUTDelay'] == 3
+    assert defaults['runSUTFinishTrigger'] == "-"
+    assert defaults['warmPipeline'] is False
@@ -0,0 +1,40 @@
+import testit_coverage
+
+
+def entry(trace, event, line, model="/models/model.xml", file="/src/sut.py"):
+    return {'model': model, 'file': file, 'event': event, 'traceStartTimestamp': trace, 'lines': [line]}
+
+
+def test_add_and_query(tmpdir):
+    store = testit_coverage.CoverageStore(str(tmpdir.join("coverage")))
+    entries = [entry(1, "PRE", 1), entry(1, "POST", 2), entry(1, "PRE", 3), entry(2, "PRE", 4),
+               entry(2, "POST", 5, file="/src/other.py")]
+    assert store.add(entries, "P0") == 5
+    # Slices are merged back in the order the entries were added
+    assert store.query() == entries
+    assert store.query(event="PRE") == [entries[0], entries[2], entries[3]]
+    assert store.query(file="other.py") == [entries[4]]
+    assert store.query(trace=2) == entries[3:]
+    assert store.traces(model="model.xml") == [1, 2]
+    assert store.traces(file="other.py") == [2]
+
+
+def test_traces_are_deduplicated(tmpdir):
+    directory = str(tmpdir.join("coverage"))
+    store = testit_coverage.CoverageStore(directory)
+    assert store.add([entry(1, "PRE", 1)], "P0") == 1
+    # The same trace from the same pipeline is skipped, also after reopening the store
+    assert store.add([entry(1, "PRE", 1), entry(2, "PRE", 2)], "P0") == 1
+    store = testit_coverage.CoverageStore(directory)
+    assert store.add([entry(2, "PRE", 2)], "P0") == 0
+    assert store.add([entry(2, "PRE", 2)], "P1") == 1
+    assert store.query() == [entry(1, "PRE", 1), entry(2, "PRE", 2), entry(2, "PRE", 2)]
+
+
+def test_segments(tmpdir, monkeypatch):
+    monkeypatch.setattr(testit_coverage, "SEGMENT_SIZE", 10)
+    store = testit_coverage.CoverageStore(str(tmpdir.join("coverage")))
+    entries = [entry(i, "PRE", i) for i in range(5)]
+    store.add(entries, "P0")
+    assert len(set(record['segment'] for record in store.slices)) > 1
+    assert testit_coverage.CoverageStore(str(tmpdir.join("coverage"))).query() == entries
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import testit_coverageflush
+
+
+class FileCoverage(object):
+    def __init__(self, filename, lines):
+        self.filename = filename
+        self.lines = lines
+
+
+def test_flush_is_requested_on_the_first_entry():
+    requested = threading.Event()
+    scheduler = testit_coverageflush.CoverageFlushScheduler(lambda seq: requested.set(), lambda entry: None,
+                                                            window=5.0, report_time=5.0)
+    start = time.time()
+    scheduler.add({'i': 0})
+    assert requested.wait(2.0)
+    assert time.time() - start < 2.0
+    scheduler.close()
+
+
+def wait_written(written, count):
+    deadline = time.time() + 5.0
+    while len(written) < count and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def test_entries_see_the_coverage_gathered_after_them():
+    written = []
+    executed = [0]
+
+    def flush(seq):
+        # Coverage of the SUT at the time of the request
+        scheduler.report(seq, "host", [FileCoverage("sut.py", list(executed))])
+
+    scheduler = testit_coverageflush.CoverageFlushScheduler(flush, written.append, window=0.1, report_time=0.2)
+    scheduler.add({'event': "PRE"})
+    time.sleep(0.02)
+    # The service handler runs before the POST entry is logged
+    executed.append(1)
+    scheduler.add({'event': "POST"})
+    wait_written(written, 2)
+    scheduler.close()
+    assert [entry['event'] for entry in written] == ["PRE", "POST"]
+    assert written[0]['coverage'] == {'sut.py': {'host': [0]}}
+    assert written[1]['coverage'] == {'sut.py': {'host': [0, 1]}}
+
+
+def test_entries_within_the_window_share_one_flush():
+    written = []
+    flushes = []
+
+    def flush(seq):
+        flushes.append(seq)
+        scheduler.report(seq, "h1", [FileCoverage("a.py", [seq])])
+        scheduler.report(seq, "h2", [FileCoverage("a.py", [seq + 100]), FileCoverage("b.py", [1])])
+
+    scheduler = testit_coverageflush.CoverageFlushScheduler(flush, written.append, window=0.5, report_time=0.5)
+    scheduler.add({'i': 0})
+    deadline = time.time() + 5.0
+    while len(flushes) < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    for i in range(1, 10):
+        scheduler.add({'i': i})
+    wait_written(written, 10)
+    # The first entry is flushed immediately, the following entries are throttled into the next flush
+    assert flushes == [1, 2]
+    assert [entry['i'] for entry in written] == list(range(10))
+    assert written[0]['coverage'] == {'a.py': {'h1': [1], 'h2': [101]}, 'b.py': {'h2': [1]}}
+    assert all(entry['coverage'] == {'a.py': {'h1': [2], 'h2': [102]}, 'b.py': {'h2': [1]}}
+               for entry in written[1:])
+    # Late reports of a completed flush are ignored
+    assert not scheduler.report(1, "h3", [FileCoverage("c.py", [1])])
+    scheduler.add({'i': 10})
+    deadline = time.time() + 5.0
+    while len(flushes) < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    scheduler.close()
+    assert flushes == [1, 2, 3]
+    assert [entry['i'] for entry in written] == list(range(11))
+
+
+def test_close_writes_pending_entries():
+    written = []
+    scheduler = testit_coverageflush.CoverageFlushScheduler(lambda seq: None, written.append,
+                                                            window=10.0, report_time=10.0)
+    scheduler.add({'i': 0})
+    scheduler.add({'i': 1})
+    scheduler.close()
+    assert [entry['i'] for entry in written] == [0, 1]
+    assert written[0]['coverage'] == {}
+    assert not scheduler.add({'i': 2})
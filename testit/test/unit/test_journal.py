@@ -0,0 +1,35 @@
+import testit_journal
+
+
+def test_replay(tmpdir):
+    journal = testit_journal.Journal(str(tmpdir), snapshot_interval=100)
+    journal.write("tests", "A", {'credits': 3})
+    journal.write("tests", "A", {'running': 1})
+    journal.write("pipelines", "P0", {'state': "BUSY"})
+    recovered = testit_journal.Journal(str(tmpdir)).recover()
+    assert recovered == {'tests': {'A': {'credits': 3, 'running': 1}}, 'pipelines': {'P0': {'state': "BUSY"}}}
+
+
+def test_snapshot_empties_journal(tmpdir):
+    journal = testit_journal.Journal(str(tmpdir), snapshot_interval=2)
+    journal.write("tests", "A", {'credits': 1})
+    journal.write("tests", "B", {'credits': 2})
+    assert tmpdir.join("daemon.journal").read() == ""
+    journal.write("tests", "C", {'credits': 3})
+    assert testit_journal.Journal(str(tmpdir)).recover()['tests'] == {'A': {'credits': 1}, 'B': {'credits': 2},
+                                                                      'C': {'credits': 3}}
+
+
+def test_torn_tail_recovery(tmpdir):
+    journal = testit_journal.Journal(str(tmpdir), snapshot_interval=100)
+    journal.write("tests", "A", {'credits': 3})
+    journal.journal.close()
+    # Crash while writing a record
+    with open(str(tmpdir.join("daemon.journal")), 'a') as f:
+        f.write('{"kind": "tests", "key": "A", "val')
+    journal = testit_journal.Journal(str(tmpdir), snapshot_interval=100)
+    assert journal.recover() == {'tests': {'A': {'credits': 3}}}
+    journal.write("tests", "B", {'credits': 1})
+    journal.journal.close()
+    recovered = testit_journal.Journal(str(tmpdir), snapshot_interval=100).recover()
+    assert recovered == {'tests': {'A': {'credits': 3}, 'B': {'credits': 1}}}
@@ -0,0 +1,33 @@
+import json
+
+import testit_logstore
+
+
+def run(run_id, test, count):
+    return [{'run_id': run_id, 'test': test, 'i': i} for i in range(count)]
+
+
+def test_add_skips_stored_runs(tmpdir):
+    filename = str(tmpdir.join("logs", "testit.log"))
+    store = testit_logstore.LogStore(filename)
+    assert store.add(run("a", "T0", 2) + run("b", "T1", 1)) == 2
+    # Adding the same pipeline log again does not duplicate the runs
+    assert store.add(run("a", "T0", 2) + run("b", "T1", 1) + run("c", "T0", 1)) == 1
+    store = testit_logstore.LogStore(filename)
+    assert store.add(run("c", "T0", 1)) == 0
+    assert store.entries() == run("a", "T0", 2) + run("b", "T1", 1) + run("c", "T0", 1)
+    assert store.entries(["T0"]) == run("a", "T0", 2) + run("c", "T0", 1)
+
+
+def test_build_index_of_legacy_log(tmpdir):
+    filename = str(tmpdir.join("testit.log"))
+    # A log without an index where the same pipeline log was appended twice
+    entries = run("a", "T0", 2) + run("b", "T1", 2)
+    with open(filename, 'w') as f:
+        for entry in entries + entries + run("c", "T0", 1):
+            f.write(json.dumps(entry) + "\n")
+    store = testit_logstore.LogStore(filename)
+    assert [(record['run_id'], record['count']) for record in store.runs] == [("a", 2), ("b", 2), ("c", 1)]
+    assert store.entries() == entries + run("c", "T0", 1)
+    assert store.add(run("b", "T1", 2) + run("d", "T1", 1)) == 1
+    assert testit_logstore.LogStore(filename).entries(["T1"]) == run("b", "T1", 2) + run("d", "T1", 1)
@@ -0,0 +1,52 @@
+import gzip
+import json
+
+import pytest
+
+import testit_logwriter
+
+
+def read_lines(filename, opener=open):
+    with opener(filename, 'rb') as f:
+        return [json.loads(line.decode('utf-8')) for line in f.read().splitlines()]
+
+
+def test_write_and_close(tmpdir):
+    filename = str(tmpdir.join("testit.log"))
+    writer = testit_logwriter.LogWriter(filename, batch_size=3, flush_interval=0.05)
+    for i in range(10):
+        assert writer.write({'i': i})
+    writer.close()
+    assert [entry['i'] for entry in read_lines(filename)] == list(range(10))
+    assert writer.written == 10
+    assert not writer.write({'i': 10})
+    assert writer.dropped == 1
+
+
+def test_default_serializer(tmpdir):
+    filename = str(tmpdir.join("testit.log"))
+    writer = testit_logwriter.LogWriter(filename, default=lambda value: sorted(value))
+    writer.write({'values': set([2, 1])})
+    writer.close()
+    assert read_lines(filename) == [{'values': [1, 2]}]
+
+
+def test_rotate(tmpdir):
+    filename = str(tmpdir.join("testit.log"))
+    writer = testit_logwriter.LogWriter(filename, batch_size=1, rotate_size=1)
+    for i in range(3):
+        writer.write({'i': i})
+    writer.close()
+    found = testit_logwriter.segments(filename)
+    assert [index for index, path in found] == [1, 2, 3]
+    assert [read_lines(path, gzip.open) for index, path in found] == [[{'i': 0}], [{'i': 1}], [{'i': 2}]]
+    # Segments are continued after a restart
+    writer = testit_logwriter.LogWriter(filename, batch_size=1, rotate_size=1)
+    writer.write({'i': 3})
+    writer.close()
+    assert testit_logwriter.segments(filename)[-1][0] == 4
+
+
+def test_unknown_fsync_policy(tmpdir):
+    with pytest.raises(ValueError):
+        testit_logwriter.LogWriter(str(tmpdir.join("testit.log")), fsync="always")
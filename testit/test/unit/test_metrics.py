@@ -0,0 +1,50 @@
+import testit_metrics
+
+
+def test_render_histogram():
+    metrics = testit_metrics.Metrics(buckets=(0.5, 1.0))
+    metrics.declare("testit_phase_seconds", "histogram", "Duration of the pipeline phases")
+    metrics.observe("testit_phase_seconds", 0.25, {'pipeline': "P0", 'phase': "runSUT"})
+    metrics.observe("testit_phase_seconds", 0.75, {'phase': "runSUT", 'pipeline': "P0"})
+    metrics.observe("testit_phase_seconds", 2.0, {'phase': "runSUT", 'pipeline': "P0"})
+    assert metrics.render().splitlines() == [
+        '# HELP testit_phase_seconds Duration of the pipeline phases',
+        '# TYPE testit_phase_seconds histogram',
+        'testit_phase_seconds_bucket{phase="runSUT",pipeline="P0",le="0.5"} 1',
+        'testit_phase_seconds_bucket{phase="runSUT",pipeline="P0",le="1.0"} 2',
+        'testit_phase_seconds_bucket{phase="runSUT",pipeline="P0",le="+Inf"} 3',
+        'testit_phase_seconds_sum{phase="runSUT",pipeline="P0"} 3.0',
+        'testit_phase_seconds_count{phase="runSUT",pipeline="P0"} 3']
+
+
+def test_render_counters_and_gauges():
+    metrics = testit_metrics.Metrics()
+    metrics.declare("testit_runs_total", "counter", "Test runs")
+    metrics.increment("testit_runs_total", labels={'verdict': "pass"})
+    metrics.increment("testit_runs_total", 2, labels={'verdict': "fail"})
+    metrics.set("testit_queued", 4)
+    assert metrics.render().splitlines() == [
+        '# TYPE testit_queued untyped',
+        'testit_queued 4.0',
+        '# HELP testit_runs_total Test runs',
+        '# TYPE testit_runs_total counter',
+        'testit_runs_total{verdict="fail"} 2.0',
+        'testit_runs_total{verdict="pass"} 1.0']
+
+
+def test_format_labels():
+    assert testit_metrics.format_labels(()) == ""
+    assert testit_metrics.format_labels((('test', 'a"b\\c\nd'),)) == '{test="a\\"b\\\\c\\nd"}'
+
+
+def test_track(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(testit_metrics.time, "time", lambda: now[0])
+    metrics = testit_metrics.Metrics()
+    metrics.track("testit_busy_seconds_total", True, {'pipeline': "P0"})
+    now[0] = 102.5
+    # Active time is included while the state is active
+    assert 'testit_busy_seconds_total{pipeline="P0"} 2.5' in metrics.render().splitlines()
+    metrics.track("testit_busy_seconds_total", False, {'pipeline': "P0"})
+    now[0] = 110.0
+    assert 'testit_busy_seconds_total{pipeline="P0"} 2.5' in metrics.render().splitlines()
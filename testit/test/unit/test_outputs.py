@@ -0,0 +1,45 @@
+import collections
+
+import pytest
+
+import testit_outputs
+
+
+@pytest.mark.parametrize("mode, aggregate", [("max", max), ("min", min),
+                                             ("avg", lambda values: float(sum(values)) / len(values))])
+def test_ring_buffer(mode, aggregate):
+    values = [3, 1, 4, 1, 5, 9, 2, 6, 5, 3, 5, 8, 9, 7, 9, 3, 2, 3, 8, 4]
+    buffer = testit_outputs.RingBuffer(4, mode)
+    assert buffer.aggregate() is None
+    for i, value in enumerate(values):
+        buffer.add(value)
+        assert buffer.aggregate() == pytest.approx(aggregate(values[max(0, i - 3):i + 1]))
+
+
+def test_ring_buffer_mode():
+    with pytest.raises(ValueError):
+        testit_outputs.RingBuffer(4, "median")
+
+
+def test_output_monitor():
+    Point = collections.namedtuple("Point", ["x", "y"])
+    Pose = collections.namedtuple("Pose", ["position"])
+    monitor = testit_outputs.OutputMonitor({'identifier': "pose",
+                                            'buffer': {'size': 2, 'mode': "max", 'hz': 10},
+                                            'resolution': [{'field': "position.x", 'resolution': 0.1},
+                                                           {'field': "position.y"}]})
+    assert monitor.values() == {}
+    assert monitor.update(Pose(Point(1.04, 2.5)), 0.0)
+    # Updated at most 10 times per second
+    assert not monitor.update(Pose(Point(9.0, 9.0)), 0.05)
+    assert monitor.update(Pose(Point(0.5, 1.25)), 0.1)
+    assert monitor.values() == {'position.x': 1.0, 'position.y': 2.5}
+    assert monitor.update(Pose(Point(0.2, 0.0)), 0.2)
+    assert monitor.values() == {'position.x': 0.5, 'position.y': 1.25}
+
+
+def test_round_value():
+    assert testit_outputs.round_value(19.26, 0.1) == 19.3
+    assert testit_outputs.round_value(19.26, 0.5) == 19.5
+    assert testit_outputs.round_value(19.26, 0) == 19.26
+    assert testit_outputs.round_value(7, 5) == 5
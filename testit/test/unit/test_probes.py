@@ -0,0 +1,35 @@
+import socket
+import time
+import testit_probes
+
+
+def test_file_probe(tmpdir):
+    filename = tmpdir.join("ready")
+    assert not testit_probes.wait("file://" + str(filename), timeout=0.05)
+    filename.write("")
+    assert testit_probes.wait("file://" + str(filename), timeout=0.05)
+
+
+def test_tcp_probe():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    port = server.getsockname()[1]
+    assert testit_probes.wait("tcp://127.0.0.1:%s" % port, timeout=1.0)
+    server.close()
+
+
+def test_master_probes_time_out_on_unresponsive_host():
+    # Connections are accepted (backlog) but never answered
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(8)
+    location = "127.0.0.1:%s" % server.getsockname()[1]
+    try:
+        for trigger in ("rosmaster://" + location, "topic://" + location + "/chatter",
+                        "service://" + location + "/rosout/get_loggers"):
+            started = time.time()
+            assert not testit_probes.wait(trigger, timeout=0.5)
+            assert time.time() - started < 3.0
+    finally:
+        server.close()
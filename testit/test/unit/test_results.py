@@ -0,0 +1,29 @@
+import testit_results
+
+
+def test_percentile():
+    assert testit_results.percentile([], 50) is None
+    assert testit_results.percentile([1, 2, 3, 4], 50) == 2
+    assert testit_results.percentile([1, 2, 3, 4], 75) == 3
+    assert testit_results.percentile([1, 2, 3, 4], 76) == 4
+    assert testit_results.percentile([1, 2, 3, 4], 100) == 4
+    assert testit_results.percentile([1, 2, 3, 4], 0) == 1
+    assert testit_results.percentile([5], 99) == 5
+    assert testit_results.percentile(list(range(1, 101)), 90) == 90
+
+
+def test_record_keeps_runs_pending_when_the_database_fails(tmpdir):
+    store = testit_results.RunStore(str(tmpdir.join("results.sqlite")), batch_size=2, flush_interval=60.0)
+    # Another connection holds the write lock (e.g., a concurrent writer)
+    blocker = testit_results.sqlite3.connect(str(tmpdir.join("results.sqlite")), timeout=0.0)
+    blocker.execute("BEGIN EXCLUSIVE")
+    store.connection.execute("PRAGMA busy_timeout = 0")
+    store.record("A", "P0", "test", None, None, 1.0, 2.0, True)
+    store.record("A", "P0", "test", None, None, 2.0, 3.0, False)
+    assert len(store.pending) == 2
+    blocker.rollback()
+    blocker.close()
+    runs = store.query("SELECT * FROM runs ORDER BY start")
+    assert [run['verdict'] for run in runs] == [True, False]
+    assert runs[0]['duration'] == 1.0
+    store.close()
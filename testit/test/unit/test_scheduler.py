@@ -0,0 +1,57 @@
+import testit_scheduler
+
+
+def test_priority_order():
+    scheduler = testit_scheduler.Scheduler(["P0"])
+    assigned = []
+    for tag, priority in (("low", 0), ("high", 5), ("medium", 2), ("high2", 5)):
+        scheduler.submit(tag, priority, callback=lambda pipeline, tag=tag: assigned.append((tag, pipeline)))
+    assert scheduler.queued() == 4
+    assert scheduler.higher_priority_waiting("P0", 4)
+    assert not scheduler.higher_priority_waiting("P0", 5)
+    for i in range(4):
+        scheduler.release("P0")
+    # Higher priority first, FIFO within the same priority
+    assert assigned == [("high", "P0"), ("high2", "P0"), ("medium", "P0"), ("low", "P0")]
+    assert scheduler.queued() == 0
+
+
+def test_per_pipeline_dispatch():
+    scheduler = testit_scheduler.Scheduler(["P0", "P1"])
+    pinned = scheduler.submit("pinned", 0, "P1")
+    scheduler.release("P0")
+    # A pipeline is only assigned to items that accept it
+    assert pinned.assigned is None
+    other = scheduler.submit("any", 0)
+    assert other.assigned == "P0"
+    scheduler.release("P1")
+    assert pinned.assigned == "P1"
+
+
+def test_pinned_and_shared_queues_are_merged_by_priority():
+    scheduler = testit_scheduler.Scheduler(["P0"])
+    shared = scheduler.submit("shared", 1)
+    pinned = scheduler.submit("pinned", 3, "P0")
+    scheduler.release("P0")
+    assert pinned.assigned == "P0" and shared.assigned is None
+    scheduler.release("P0")
+    assert shared.assigned == "P0"
+
+
+def test_unknown_pipeline_uses_any_pipeline():
+    scheduler = testit_scheduler.Scheduler(["P0"])
+    item = scheduler.submit("test", 0, "missing")
+    scheduler.release("P0")
+    assert item.assigned == "P0"
+
+
+def test_disable_and_acquire():
+    scheduler = testit_scheduler.Scheduler(["P0"])
+    scheduler.release("P0")
+    scheduler.disable("P0")
+    item = scheduler.submit("waiting", 0)
+    assert item.assigned is None
+    scheduler.release("P0")
+    assert item.event.is_set() and item.assigned == "P0"
+    scheduler.release("P0")
+    assert scheduler.acquire("blocking", 0) == "P0"
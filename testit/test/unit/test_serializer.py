@@ -0,0 +1,59 @@
+import testit_serializer
+
+
+class Message(object):
+    __slots__ = []
+    _slot_types = []
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name, None))
+
+
+class Time(object):
+    def __init__(self, secs, nsecs):
+        self.secs = secs
+        self.nsecs = nsecs
+
+
+class Point(Message):
+    __slots__ = ['x', 'y']
+    _slot_types = ['float64', 'float64']
+
+
+class Header(Message):
+    __slots__ = ['seq', 'stamp', 'frame_id']
+    _slot_types = ['uint32', 'time', 'string']
+
+
+class Path(Message):
+    __slots__ = ['header', 'points', 'data', 'ranges', 'names', 'stamps']
+    _slot_types = ['std_msgs/Header', 'geometry_msgs/Point[]', 'uint8[]', 'float32[4]', 'string[]', 'time[]']
+
+
+def test_serialize():
+    path = Path(header=Header(seq=1, stamp=Time(2, 3), frame_id="map"),
+                points=[Point(x=1.0, y=2.0), Point(x=3.0, y=4.0)], data=b"\x01\x02", ranges=(0.5, 1.5, 2.5, 3.5),
+                names=["a", "b"], stamps=[Time(4, 5)])
+    assert testit_serializer.serialize(path) == {
+        'header': {'seq': 1, 'stamp': {'secs': 2, 'nsecs': 3}, 'frame_id': "map"},
+        'points': [{'x': 1.0, 'y': 2.0}, {'x': 3.0, 'y': 4.0}],
+        'data': [1, 2],
+        'ranges': [0.5, 1.5, 2.5, 3.5],
+        'names': ["a", "b"],
+        'stamps': [{'secs': 4, 'nsecs': 5}]}
+    # The plan is compiled once per message type
+    assert testit_serializer.plans[Path] is testit_serializer.get_plan(Path)
+
+
+def test_serialize_single_field():
+    class Single(Message):
+        __slots__ = ['data']
+        _slot_types = ['string']
+    assert testit_serializer.serialize(Single(data="value")) == {'data': "value"}
+
+
+def test_convert_value():
+    assert testit_serializer.convert_value([Point(x=1.0, y=2.0), Time(1, 2), {'key': (1, 2)}]) == \
+        [{'x': 1.0, 'y': 2.0}, {'secs': 1, 'nsecs': 2}, {'key': [1, 2]}]
+    assert testit_serializer.convert_value(5) == 5
@@ -0,0 +1,64 @@
+import socket
+import threading
+import time
+import testit_shard
+
+
+def free_address():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return "127.0.0.1:%s" % port
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.02)
+
+
+def test_coordinator_and_workers():
+    address = free_address()
+    states = {}
+    lost = []
+    coordinator = testit_shard.Coordinator(address, 1.0, lambda worker, pipelines: states.update(pipelines),
+                                           lambda worker, pipelines: lost.append((worker, pipelines)))
+    blocked = threading.Event()
+    handled = []
+    workers = [
+        testit_shard.Worker(address, "worker0", 1.0, lambda: {'P0': "READY"},
+                            lambda message: {'verdict': True, 'pipeline': message['pipeline'],
+                                             'tag': message['tag']},
+                            handled.append),
+        testit_shard.Worker(address, "worker1", 1.0, lambda: {'P1': "READY"},
+                            lambda message: blocked.wait(10.0) and None, handled.append)]
+    try:
+        wait_for(lambda: coordinator.status() == {'worker0': ['P0'], 'worker1': ['P1']})
+        assert states == {'P0': "READY", 'P1': "READY"}
+        # Runs are executed by the worker owning the pipeline
+        for i in range(3):
+            assert coordinator.execute("P0", {'tag': "T%s" % i}) == {'verdict': True, 'pipeline': "P0",
+                                                                     'tag': "T%s" % i}
+        # Commands go to all workers
+        assert coordinator.command("bringup") == ['worker0', 'worker1']
+        wait_for(lambda: len(handled) == 2)
+        assert [message['name'] for message in handled] == ["bringup", "bringup"]
+        # A worker that stops polling is lost and its unfinished runs return None
+        outcome = []
+        thread = threading.Thread(target=lambda: outcome.append(coordinator.execute("P1", {'tag': "T"})))
+        thread.start()
+        wait_for(lambda: len(workers[1].running()) == 1)
+        workers[1].close()
+        thread.join(10.0)
+        assert outcome == [None]
+        assert lost == [('worker1', ['P1'])]
+        assert coordinator.status() == {'worker0': ['P0']}
+        assert coordinator.execute("P1", {'tag': "T"}) is None
+        assert coordinator.execute("P0", {'tag': "T"})['verdict']
+    finally:
+        blocked.set()
+        for worker in workers:
+            worker.close()
+        coordinator.close()
@@ -0,0 +1,28 @@
+import testit_template
+
+
+def test_render():
+    params = {'tag': "test", 'command': "run [[tag]] on [[host]]", 'args': ["[[tag]].log", "plain"], 'count': 2,
+              'missing': "[[unknown]]"}
+    template = testit_template.Template(params)
+    assert sorted(template.compiled) == ['args', 'command', 'missing']
+    rendered = template.render({'tag': "override"}, {'host': "localhost", 'tag': "auxiliary"})
+    assert rendered['tag'] == "override"
+    assert rendered['command'] == "run override on localhost"
+    assert rendered['args'] == ["override.log", "plain"]
+    assert rendered['count'] == 2
+    # Unknown placeholders are left as is
+    assert rendered['missing'] == "[[unknown]]"
+    # The source is never modified
+    assert params['command'] == "run [[tag]] on [[host]]"
+    assert template.render()['command'] == "run test on [[host]]"
+
+
+def test_overridden_keys_are_not_rendered():
+    template = testit_template.Template({'command': "[[a]]"})
+    assert template.render({'command': "[[b]]", 'b': "x"})['command'] == "[[b]]"
+
+
+def test_compile_value():
+    assert testit_template.compile_value("plain") is None
+    assert testit_template.compile_value("a[[b]]c[[d]]") == ["a", "b", "c", "d", ""]
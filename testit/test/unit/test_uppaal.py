@@ -0,0 +1,46 @@
+import os
+import xml.etree.ElementTree
+
+import testit_uppaal
+
+
+def write_model(tmpdir):
+    filename = str(tmpdir.join("model.xml"))
+    with open(filename, 'w') as f:
+        f.write(testit_uppaal.create_sequential_uppaal_xml([("robot_0_goto", {'x': 1, 'y': 2}),
+                                                            ("robot_0_goto", {'x': 3, 'y': 4}),
+                                                            ("robot_0_goto", {'x': 1, 'y': 5})]))
+    return filename
+
+
+def assignments(filename):
+    return [label.text for label in
+            xml.etree.ElementTree.parse(filename).findall("./template/transition//*[@kind='assignment']")]
+
+
+def test_assignment_signature():
+    assert testit_uppaal.assignment_signature(" i_x = 1, i_y=2,") == set(["i_x=1", "i_y=2"])
+    assert testit_uppaal.assignment_signature(None) == set()
+
+
+def test_annotate_and_restore(tmpdir):
+    filename = write_model(tmpdir)
+    model = testit_uppaal.get_annotated_model(filename)
+    assert model.match({'name': "robot_0_goto", 'state': [{'x': 1}]}) == [0, 2]
+    assert model.match({'name': "robot_0_goto", 'state': [{'x': 1}, {'y': 5}]}) == [2]
+    annotations, maxV = model.annotate([{'name': "robot_0_goto", 'state': [{'x': 3}, {'y': 4}], 'sum': 7},
+                                        {'name': "robot_0_goto", 'state': [{'x': 1}], 'sum': 2},
+                                        {'name': "robot_0_goto", 'state': [{'x': 1}, {'y': 5}], 'sum': 9}])
+    # The first matching entry determines the value of a transition
+    assert (annotations, maxV) == ({0: 2, 1: 7, 2: 2}, 7)
+    annotated = str(tmpdir.join("annotated.xml"))
+    assert model.write(annotated, annotations, maxV)
+    labels = assignments(annotated)
+    assert labels[1].endswith(", V=7")
+    assert "const int maxV=7;" in xml.etree.ElementTree.parse(annotated).find("./declaration").text
+    # The cached tree is restored after writing
+    assert [label.text for label in model.assignments] == assignments(filename)
+    assert testit_uppaal.get_annotated_model(filename) is model
+    # The model is parsed again when the file changes
+    os.utime(filename, (model.mtime + 10, model.mtime + 10))
+    assert testit_uppaal.get_annotated_model(filename) is not model